@@ -1,58 +1,149 @@
-from Player import Player, PlayerNode
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from dealing import deal, default_rng, hand_dict
+from instrument import timed
+from Player import Player, PlayerNode, one_on_one
+
 
 class LiarsDice:
-    def __init__(self, start: PlayerNode, size: int) -> None:
+    @timed()
+    def __init__(self, start: PlayerNode, size: int, wild: bool = False,
+                 rng: Optional[np.random.Generator] = None) -> None:
         self.current_turn = start
         self.table_size = size
+        self.wild = wild
+        self.rng = rng or default_rng()
+        self.bids = []
 
-
+        # Every hand at the table is rolled in one call.
+        hands = deal(self.rng, self.hand_sizes())
         curr = self.current_turn
-        curr.player.last_bet = None
-        curr.player.make_hand()
-        curr = curr.next
-        while curr != self.head.last:
-            curr.player.last_bet = None
-            curr.player.make_hand()
-            curr = curr.next()
-
-    def can_move(self, bet, player):
-        if self.current_turn.last.last_bet:
-            return bet[0] in range(7) and bet[1] in range(size + 1)
-        else:
-            if self.current_turn.last.last_bet[0] <= bet[0]:
-                return bet[1] in range(self.current_turn.last.last_bet[1] + 1, size + 1)
-            else:
-                return bet[1] in range(self.current_turn.last.last_bet[1], size + 1)
+        for hist in hands:
+            curr.last_bet = None
+            curr.player.hand = hand_dict(hist)
+            curr = curr.next
+
+        self.total = sum(self.hand_sizes())
+        for _ in range(self.table_size):
+            curr.player.total = self.total
+            curr.player.opponent_hands = self.hand_sizes(curr.next)[:-1]
+            curr.player.opponent_names = self.names(curr.next)[:-1]
+            curr.player.set_wild(self.wild)
+            curr = curr.next
+
+    def hand_sizes(self, start: Optional[PlayerNode] = None) -> List[int]:
+        """
+        Returns the number of dice each player holds, in turn order from
+        start (the current player by default).
+        """
+        curr = start or self.current_turn
+        sizes = []
+        for _ in range(self.table_size):
+            sizes.append(curr.player.size)
+            curr = curr.next
+        return sizes
+
+    def names(self, start: Optional[PlayerNode] = None) -> List[str]:
+        """
+        Returns the names of the players, in turn order from start (the
+        current player by default).
+        """
+        curr = start or self.current_turn
+        names = []
+        for _ in range(self.table_size):
+            names.append(curr.player.name)
+            curr = curr.next
+        return names
+
+    def last_bet(self) -> Optional[Tuple[int, int]]:
+        return self.bids[-1] if self.bids else None
+
+    def can_move(self, bet, player=None):
+        last = self.last_bet()
+        if bet == (0, 0):
+            return last is not None
+        if bet[0] not in range(1, 7) or bet[1] not in range(1, self.total + 1):
+            return False
+        if not last:
+            return True
+        if last[0] < bet[0]:
+            return bet[1] >= last[1]
+        return bet[1] > last[1]
 
     def move(self, dice, count):
         if (dice, count) == (0, 0):
-            loser = self.call_bet(dice, count, self.current_turn)
+            loser = self.call_bet(*self.last_bet(), self.current_turn)
             loser.player.size -= 1
-            return LiarsDice(loser, self.table_size - 1)
+            if loser.player.size > 0:
+                return LiarsDice(loser, self.table_size, self.wild, self.rng)
+            loser.last.next = loser.next
+            loser.next.last = loser.last
+            return LiarsDice(loser.next, self.table_size - 1, self.wild,
+                             self.rng)
         else:
+            curr = self.current_turn
+            for seat in range(self.table_size):
+                curr.player.observe(-seat % self.table_size, (dice, count))
+                curr = curr.next
+            self.bids.append((dice, count))
             self.current_turn.last_bet = (dice, count)
             self.current_turn = self.current_turn.next
-            
+
+    @timed()
     def call_bet(self, dice: int, count: int, calling_player: PlayerNode):
         curr = calling_player
-        total = curr.player.hand[dice]
-        curr = curr.next
-        while curr != calling player and total < count:
+        total = 0
+        for _ in range(self.table_size):
             total += curr.player.hand[dice]
+            if self.wild and dice != 1:
+                total += curr.player.hand[1]
+            curr = curr.next
         if total < count:
             return calling_player.last
         return calling_player
 
+    def sudden_death(self, guess: Optional[int] = None,
+                     reply: Optional[int] = None):
+        """
+        When both remaining players have one dice left they each guess
+        the sum of the two dice, starting with the current player.  The
+        closest guess wins the game, and a tie is re-rolled.  Guesses
+        that are not given are made with one_on_one.
+        """
+        first, second = self.current_turn, self.current_turn.next
+        if guess is None:
+            guess = one_on_one(None, first.player.hand)
+        if reply is None:
+            reply = one_on_one(guess, second.player.hand)
+        actual = (max(d for d, c in first.player.hand.items() if c) +
+                  max(d for d, c in second.player.hand.items() if c))
+
+        miss, reply_miss = abs(guess - actual), abs(reply - actual)
+        if miss == reply_miss:
+            return LiarsDice(first, self.table_size, self.wild, self.rng)
+        loser = second if miss < reply_miss else first
+        loser.player.size -= 1
+        loser.last.next = loser.next
+        loser.next.last = loser.last
+        return LiarsDice(loser.next, self.table_size - 1, self.wild,
+                         self.rng)
+
 
 class Operator:
+    """
+    A named move, applicable to the states precond accepts, that maps a
+    state to the state after it with state_transf.
+    """
+
     def __init__(self, name, precond, state_transf):
         self.name = name
         self.precond = precond
         self.state_transf = state_transf
-    
+
     def is_applicable(self, s):
         return self.precond(s)
 
     def apply(self, s):
-        self.state_transf(s)
-
+        return self.state_transf(s)
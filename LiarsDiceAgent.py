@@ -1,8 +1,469 @@
 """
 LiarsDiceAgent.py
+
+"Markov Master" plays two player Liar's Dice from an equilibrium
+strategy learned by Monte Carlo counterfactual regret minimization
+(external sampling MCCFR).
+
+For a configuration of dice per player, every possible bid is a claim
+index c = (count - 1) * faces + (face - 1), so a legal raise is always a
+larger claim, and calling is one extra action.  An information set is
+the player's hand histogram plus the last RECALL claims of the round,
+packed into one integer, and regrets and strategy sums are flat NumPy
+arrays indexed by it.  Training can be spread over processes and is
+checkpointed to disk; at play time a move is one array lookup.
+
+The tables grow with the dice as (hands) x (claims + 1) ** (RECALL + 1),
+so only the endings of heads-up games are trained: every configuration
+of up to MAX_DICE dice a side (131 MB for 2 against 2, where 5 against 5
+would need 56 GB).  One dice each is sudden death, solved by endgame.
+
+Usage:
+    python LiarsDiceAgent.py --iterations 100000 --workers 4   # all
+    python LiarsDiceAgent.py --dice 2 1 --iterations 100000
 """
 
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from itertools import combinations_with_replacement
+from math import factorial
+from random import uniform
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Player import Player
+from sharedtables import open_segment
+
 NAME = "Markov Master"
 
-def initailize():
-    
\ No newline at end of file
+# Number of most recent claims remembered in an information set.
+RECALL = 3
+# Most dice a side in a trained configuration.
+MAX_DICE = 2
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'markov_master')
+
+SOLVERS = {}
+# A worker's solver of each (dice, faces, recall), kept between syncs.
+_WORKERS = {}
+
+
+class CFRSolver:
+    """
+    MCCFR for two player Liar's Dice with a fixed number of dice each.
+
+    Attributes:
+        dice (Tuple[int, int]): Dice held by the opening player (player
+                                0) and by the responding player.
+        faces (int): Number of faces on each dice.
+        recall (int): Number of recent claims in an information set.
+        regrets (np.ndarray): (infosets, actions) cumulative regrets.
+        strategy (np.ndarray): (infosets, actions) strategy sums.
+        iterations (int): Iterations trained so far.
+    """
+
+    def __init__(self,
+                 dice: Tuple[int, int] = (1, 1),
+                 faces: int = 6,
+                 recall: int = RECALL) -> None:
+        self.dice = tuple(dice)
+        self.faces = faces
+        self.recall = recall
+        self.n_claims = sum(self.dice) * faces
+        self.n_actions = self.n_claims + 1
+        self.n_histories = self.n_actions ** recall
+
+        self.hands = []
+        self.hand_probs = []
+        self.hand_index = []
+        self.offsets = []
+        offset = 0
+        for d in self.dice:
+            hands, probs = enumerate_hands(d, faces)
+            self.hands.append(hands)
+            self.hand_probs.append(np.cumsum(probs))
+            self.hand_index.append({tuple(h[1:]): i
+                                    for i, h in enumerate(hands)})
+            self.offsets.append(offset)
+            offset += len(hands) * self.n_histories
+
+        self.regrets = np.zeros((offset, self.n_actions), dtype=np.float32)
+        self.strategy = np.zeros_like(self.regrets)
+        self.iterations = 0
+        self.__policy = None
+
+    def claim(self, bid: Tuple[int, int]) -> int:
+        """
+        Returns the claim index of bid = (dice, count).
+        """
+        return (bid[1] - 1) * self.faces + bid[0] - 1
+
+    def bid(self, claim: int) -> Tuple[int, int]:
+        """
+        Returns the (dice, count) of a claim index, (0, 0) for a call.
+        """
+        if claim == self.n_claims:
+            return (0, 0)
+        return (claim % self.faces + 1, claim // self.faces + 1)
+
+    def history(self, claims: Sequence[int]) -> int:
+        """
+        Packs the last recall claims of a round into one integer.
+        """
+        code = self.n_histories - 1
+        for c in claims:
+            code = self.__push(code, c)
+        return code
+
+    def infoset(self, player: int, hand: int, history: int) -> int:
+        return self.offsets[player] + hand * self.n_histories + history
+
+    def iterate(self, iterations: int,
+                rng: Optional[np.random.Generator] = None) -> None:
+        """
+        Runs iterations of external sampling MCCFR, alternating which
+        player is updated.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        for _ in range(iterations):
+            deal = [int(np.searchsorted(p, rng.random(), side='right'))
+                    for p in self.hand_probs]
+            counts = self.hands[0][deal[0]] + self.hands[1][deal[1]]
+            traverser = self.iterations % 2
+            self.__walk(deal, counts, self.n_histories - 1, 0, traverser,
+                        rng)
+            self.iterations += 1
+        self.__policy = None
+
+    def train(self,
+              iterations: int,
+              workers: int = 1,
+              seed: Optional[int] = None,
+              sync: int = 1000,
+              checkpoint: Optional[str] = None) -> None:
+        """
+        Trains for iterations.  With several workers each sync round is
+        split between processes that start from the current regrets, and
+        their updates are summed.  The regrets and strategy sums are
+        moved into shared memory while the workers run, so a sync sends
+        them only the segment's name and gets back only the rows they
+        changed.  The solver is saved to checkpoint after every sync
+        round.
+        """
+        seeds = np.random.SeedSequence(seed)
+        pool = shared = None
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            shared = SharedMemory(create=True, size=2 * self.regrets.nbytes)
+            tables = np.ndarray((2,) + self.regrets.shape,
+                                self.regrets.dtype, buffer=shared.buf)
+            tables[0], tables[1] = self.regrets, self.strategy
+            self.regrets, self.strategy = tables
+            del tables
+        done = 0
+        try:
+            while done < iterations:
+                n = min(sync, iterations - done)
+                if pool is None:
+                    self.iterate(n,
+                                 np.random.default_rng(seeds.spawn(1)[0]))
+                else:
+                    self.__sync(pool, shared.name, workers, n, seeds)
+                done += n
+                if checkpoint:
+                    self.save(checkpoint)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+                self.regrets = self.regrets.copy()
+                self.strategy = self.strategy.copy()
+                shared.close()
+                shared.unlink()
+
+    def __sync(self, pool: ProcessPoolExecutor, segment: str,
+               workers: int, n: int,
+               seeds: np.random.SeedSequence) -> None:
+        """
+        Splits n iterations between the workers of pool, which read the
+        regrets and strategy sums from the shared segment, and sums
+        their updates once they have all finished.
+        """
+        shares = [n // workers + (w < n % workers) for w in range(workers)]
+        starts = self.iterations + np.cumsum([0] + shares[:-1])
+        futures = [pool.submit(_iterate, segment, self.dice, self.faces,
+                               self.recall, int(start), share, s)
+                   for start, share, s in
+                   zip(starts, shares, seeds.spawn(workers)) if share]
+        updates = [future.result() for future in futures]
+        for rows, regrets, strategy in updates:
+            self.regrets[rows] += regrets
+            self.strategy[rows] += strategy
+        self.iterations += n
+        self.__policy = None
+
+    def policy(self) -> np.ndarray:
+        """
+        Returns the average strategy, normalized over legal actions.
+        Information sets never reached play uniformly over their legal
+        actions.
+        """
+        if self.__policy is None:
+            totals = self.strategy.sum(axis=1, keepdims=True)
+            policy = np.divide(self.strategy, totals,
+                               out=np.zeros_like(self.strategy),
+                               where=totals > 0)
+            unseen = (totals[:, 0] <= 0)
+            if unseen.any():
+                policy[unseen] = self.__uniform()[unseen]
+            self.__policy = policy
+        return self.__policy
+
+    def act(self,
+            hand: Dict[int, int],
+            bids: List[Tuple[int, int]],
+            u: float) -> Tuple[int, int]:
+        """
+        Chooses a move for the player to act after bids, holding hand,
+        from the average strategy.  u is a uniform [0, 1) draw.
+        """
+        player = len(bids) % 2
+        hist = tuple(hand.get(f, 0) for f in range(1, self.faces + 1))
+        index = self.infoset(player, self.hand_index[player][hist],
+                             self.history(self.claim(b) for b in bids))
+        cdf = np.cumsum(self.policy()[index])
+        action = int(np.searchsorted(cdf, u * cdf[-1], side='right'))
+        return self.bid(min(action, self.n_claims))
+
+    def save(self, path: str) -> None:
+        np.savez(path, dice=self.dice, faces=self.faces, recall=self.recall,
+                 regrets=self.regrets, strategy=self.strategy,
+                 iterations=self.iterations)
+
+    @classmethod
+    def load(cls, path: str) -> 'CFRSolver':
+        data = np.load(path)
+        solver = cls(tuple(int(d) for d in data['dice']),
+                     int(data['faces']), int(data['recall']))
+        solver.regrets[:] = data['regrets']
+        solver.strategy[:] = data['strategy']
+        solver.iterations = int(data['iterations'])
+        return solver
+
+    def __walk(self, deal, counts, code, depth, traverser, rng) -> float:
+        """
+        Returns the sampled utility to traverser of the node reached by
+        the claims in code, depth claims into the round.
+        """
+        player = depth % 2
+        last = code % self.n_actions
+        start = 0 if last == self.n_claims else last + 1
+        legal = np.arange(start, self.n_actions if depth else self.n_claims)
+        index = self.infoset(player, deal[player], code)
+
+        regrets = np.maximum(self.regrets[index, legal], 0.0)
+        total = regrets.sum()
+        if total > 0:
+            strategy = regrets / total
+        else:
+            strategy = np.full(len(legal), 1.0 / len(legal))
+
+        if player != traverser:
+            self.strategy[index, legal] += strategy
+            a = int(np.searchsorted(np.cumsum(strategy), rng.random() *
+                                    strategy.sum(), side='right'))
+            action = int(legal[min(a, len(legal) - 1)])
+            return self.__next(deal, counts, code, depth, action,
+                               traverser, rng)
+
+        utils = np.array([self.__next(deal, counts, code, depth, int(a),
+                                      traverser, rng) for a in legal])
+        value = float(strategy @ utils)
+        self.regrets[index, legal] += utils - value
+        return value
+
+    def __next(self, deal, counts, code, depth, action, traverser,
+               rng) -> float:
+        if action == self.n_claims:
+            face, count = self.bid(code % self.n_actions)
+            caller = depth % 2
+            loser = caller if counts[face] >= count else 1 - caller
+            return -1.0 if loser == traverser else 1.0
+        return self.__walk(deal, counts, self.__push(code, action),
+                           depth + 1, traverser, rng)
+
+    def __push(self, code: int, claim: int) -> int:
+        return (code * self.n_actions + claim) % self.n_histories
+
+    def __uniform(self) -> np.ndarray:
+        """
+        Returns the uniform strategy over legal actions for every
+        information set.
+        """
+        history = np.arange(self.n_histories)
+        last = history % self.n_actions
+        start = np.where(last == self.n_claims, 0, last + 1)
+        actions = np.arange(self.n_actions)
+        legal = ((actions[None, :] >= start[:, None]) &
+                 ((actions[None, :] < self.n_claims) |
+                  (last[:, None] != self.n_claims)))
+        uniform = (legal / legal.sum(axis=1, keepdims=True)).astype(
+            self.strategy.dtype)
+        return np.tile(uniform, (len(self.regrets) // self.n_histories, 1))
+
+
+def _iterate(segment, dice, faces, recall, iterations, n, seed):
+    """
+    Runs n iterations in a worker, starting from the regrets and
+    strategy sums in the shared segment, and returns the information
+    sets it changed with the change to their regrets and strategy sums.
+    """
+    key = (tuple(dice), faces, recall)
+    if key not in _WORKERS:
+        _WORKERS[key] = CFRSolver(dice, faces, recall)
+    solver = _WORKERS[key]
+    shared = open_segment(segment)
+    try:
+        tables = np.ndarray((2,) + solver.regrets.shape,
+                            solver.regrets.dtype, buffer=shared.buf)
+        solver.regrets[:], solver.strategy[:] = tables
+        solver.iterations = iterations
+        solver.iterate(n, np.random.default_rng(seed))
+        rows = np.flatnonzero((solver.regrets != tables[0]).any(axis=1) |
+                              (solver.strategy != tables[1]).any(axis=1))
+        update = (rows, solver.regrets[rows] - tables[0][rows],
+                  solver.strategy[rows] - tables[1][rows])
+        del tables
+    finally:
+        shared.close()
+    return update
+
+
+def enumerate_hands(dice: int, faces: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns every histogram of dice over faces, as (hands, faces + 1)
+    arrays with column 0 empty, and the probability of rolling each.
+    """
+    hands, probs = [], []
+    for roll in combinations_with_replacement(range(1, faces + 1), dice):
+        hist = np.bincount(roll, minlength=faces + 1)
+        ways = factorial(dice)
+        for c in hist:
+            ways //= factorial(c)
+        hands.append(hist)
+        probs.append(ways / faces ** dice)
+    return np.array(hands, dtype=np.int64), np.array(probs)
+
+
+def configurations(max_dice: int = MAX_DICE) -> List[Tuple[int, int]]:
+    """
+    Returns the (opener, responder) dice of every heads-up ending with
+    at most max_dice a side, but for sudden death.
+    """
+    return [(a, b) for a in range(1, max_dice + 1)
+            for b in range(1, max_dice + 1) if (a, b) != (1, 1)]
+
+
+def checkpoint_path(dice: Tuple[int, int],
+                    directory: str = CHECKPOINT_DIR) -> str:
+    return os.path.join(directory, 'cfr_%d_%d.npz' % tuple(dice))
+
+
+def initialize(directory: str = CHECKPOINT_DIR) -> Dict[Tuple[int, int],
+                                                        CFRSolver]:
+    """
+    Loads every trained configuration in directory into SOLVERS.
+    """
+    for path in glob.glob(os.path.join(directory, 'cfr_*_*.npz')):
+        solver = CFRSolver.load(path)
+        SOLVERS[solver.dice] = solver
+    return SOLVERS
+
+
+class MarkovMaster(Player):
+    """
+    A Player that plays the endings of heads-up games, with at most
+    MAX_DICE dice a side, from the CFR average strategy of that
+    configuration of dice.
+
+    Every other turn is played as a Player would play it.  That covers
+    tables of more than two players and heads-up rounds with more dice
+    or wild 1's, as well as configurations not trained yet (see
+    configurations).  Sudden death never reaches take_turn.
+    """
+
+    def __init__(self,
+                 size: int,
+                 total_dice: int,
+                 opponents: List[int],
+                 name: str = NAME,
+                 solvers: Optional[Dict[Tuple[int, int],
+                                        CFRSolver]] = None,
+                 aggressiveness: Optional[float] = None,
+                 craziness: Optional[float] = None) -> None:
+        super().__init__(size, total_dice, opponents, name, aggressiveness,
+                         craziness)
+        self.solvers = SOLVERS if solvers is None else solvers
+        self.__bids = []
+
+    def set_wild(self, isWild: bool) -> None:
+        super().set_wild(isWild)
+        self.__bids = []
+
+    def observe(self, seat: int, bet: Tuple[int, int]) -> None:
+        super().observe(seat, bet)
+        self.__bids.append(bet)
+
+    def take_turn(self, last=None) -> Tuple[int, int]:
+        # The round's bids are only known to a caller that observes
+        # them; otherwise the last one is not the bid being answered.
+        if (self.__bids[-1] if self.__bids else None) != (
+                tuple(last) if last else None):
+            return super().take_turn(last)
+        if len(self.opponent_hands) == 1 and not self.wild:
+            dice = (self.size, self.opponent_hands[0])
+            if len(self.__bids) % 2:
+                dice = dice[::-1]
+            solver = self.solvers.get(dice)
+            if solver is not None:
+                return solver.act(self.hand, self.__bids, uniform(0, 1))
+        return super().take_turn(last)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Train Markov Master with MCCFR.")
+    parser.add_argument("--dice", type=int, nargs=2, default=None,
+                        help="dice held by the opening and second player, "
+                             "every configuration up to --max-dice if "
+                             "not given.")
+    parser.add_argument("--max-dice", type=int, default=MAX_DICE)
+    parser.add_argument("--faces", type=int, default=6)
+    parser.add_argument("--recall", type=int, default=RECALL)
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--sync", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--directory", default=CHECKPOINT_DIR)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.directory, exist_ok=True)
+    for dice in ([tuple(args.dice)] if args.dice else
+                 configurations(args.max_dice)):
+        path = checkpoint_path(dice, args.directory)
+        if os.path.exists(path):
+            solver = CFRSolver.load(path)
+        else:
+            solver = CFRSolver(dice, args.faces, args.recall)
+        solver.train(args.iterations, args.workers, args.seed, args.sync,
+                     path)
+        print("Trained %s to %d iterations, saved to %s." %
+              (solver.dice, solver.iterations, path))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -14,21 +14,28 @@ sum of the two dice and the closest player wins.
 
 Uses name file from
 'https://github.com/hadley/data-baby-names/blob/master/baby-names.csv'
+compiled into a binary name table by names.py, which is memory-mapped the
+first time a computer player needs a name.  Nothing slower to import than
+numpy is loaded before the first prompt.
 """
 import os
 import sys
-import tkinter
-import pandas as pd
-from random import uniform, choice, randint
-from scipy.stats import binom
-from Player import Player, PlayerNode
+from random import choice, randint, sample
+
+import names
+from dealing import deal, default_rng
+from opponentstats import OpponentStats
+from Player import Player, PlayerNode, one_on_one
 from typing import Dict, List, Optional, T, Tuple
 
-NAMES = pd.read_csv('us-names.csv')
+NAME_TABLE = None
 TOTAL_DICE = 0
 HAND_SIZES = []
 LOST = {}
 MOVES = {}
+STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'opponents.npy')
+STATS = None
 NAMES = []
 ROUND = 0
 TABLE_SIZE = 0
@@ -45,10 +52,7 @@ def setup():
         front = PlayerNode(name, 5)
         curr = front
         NAMES.append(name)
-    for _ in range(5):
-        d = randint(1, 6)
-        USER_HAND[d] += 1
-        PLAYER_HANDS[d] += 1
+    roll_user_hand()
     while True:
         try:
             TABLE_SIZE = int(input("How many other players are there? "))
@@ -63,11 +67,10 @@ def setup():
     TABLE_SIZE += 1
     HAND_SIZES = [5] * TABLE_SIZE 
     TOTAL_DICE = 5 * TABLE_SIZE
-    for _ in TABLE_SIZE:
-        while name in NAMES:
-            name = choice(NAMES.name[NAMES.percent <= uniform(0, 1)])
+    for name in bot_names(TABLE_SIZE - 1):
         NAMES.append(name)
         p = Player(5, TOTAL_DICE, HAND_SIZES, name)
+        p.stats = opponent_stats()
         curr.next = PlayerNode(p, 5, curr)
         curr = curr.next
     front.last = curr
@@ -85,6 +88,42 @@ def setup():
     runGame()
 
 
+def bot_names(k: int) -> List[str]:
+    """
+    Picks k names that are not yet at the table, loading the name table
+    on first use.
+    """
+    global NAME_TABLE
+    if NAME_TABLE is None:
+        NAME_TABLE = names.load()
+    if NAME_TABLE is not None:
+        return NAME_TABLE.sample(default_rng(), k, exclude=NAMES)
+    free = [n for n in range(1, 100) if "Bot %d" % n not in NAMES]
+    return ["Bot %d" % n for n in sample(free, k)]
+
+
+def opponent_stats() -> OpponentStats:
+    """
+    Returns the opponent statistics saved by simulate.py --stats, which
+    the bots read, loading them on first use.
+    """
+    global STATS
+    if STATS is None:
+        STATS = (OpponentStats.load(STATS_PATH)
+                 if os.path.exists(STATS_PATH) else OpponentStats())
+    return STATS
+
+
+def roll_user_hand() -> None:
+    """
+    Rolls the users five dice in one call.
+    """
+    hand = deal(default_rng(), 5)
+    for d in range(1, 7):
+        USER_HAND[d] += int(hand[d])
+        PLAYER_HANDS[d] += int(hand[d])
+
+
 def runGame():
     print("Game Running")
 
@@ -100,10 +139,7 @@ def runGame():
                     for d, count in p.hand.values():
                         PLAYER_HANDS[d] += count
                 else:
-                    for _ in range(5):
-                        d = randint(1, 6)
-                        USER_HAND[d] += 1
-                        PLAYER_HANDS[d] += 1
+                    roll_user_hand()
 
 
 # def startGame(players: List[int]) -> int:
@@ -131,19 +167,20 @@ def endGame():
     print("Beginning Sudden Death, Player who guesses closest to the" +
           " total of the two dice is the winner.")
     guesses = {}
-    hands = []
+    hands = {}
+    last = None
     for p in PLAYERS:
-        p.hand = randint(1, 6)
-        hands.append[randint(1, 6)]
+        name = p.name if isinstance(p, Player) else p
+        hands[name] = randint(1, 6)
         while True:
             if isinstance(p, Player):
-                guess[p.name] = p.take_turn
+                p.hand = {n: int(n == hands[name]) for n in range(7)}
+                guesses[name] = one_on_one(last, p.hand)
                 break
             else:
                 try:
                     guess = int(input("Please guess the sum " +
                                       "for the two dice."))
-                    continue
                 except ValueError:
                     print("Value must be a single integer.")
                     continue
@@ -151,12 +188,12 @@ def endGame():
                     if guess <= 1:
                         print("You must guess at least 2.")
                         continue
-                    
+                    guesses[name] = guess
                     break
-    actual = sum(hands)
-    diff1 = abs(guess[Players[0]] - actual)
-    if diff1 <
-    
+        last = guesses[name]
+    actual = sum(hands.values())
+    misses = [abs(guess - actual) for guess in guesses.values()]
+    return misses.index(max(misses))
 
 
 def runRound(ind: int) -> int:
@@ -13,13 +13,17 @@ This file creates a Player class that plays a game of Liars Dice.
 #       if they had not bet that number before.
 # -- Possibly Gradient Descent, using each round as an episode.
 
-from math import log, sqrt
-from random import randint, uniform, choice
+from math import sqrt
+from random import uniform, choice
 from typing import Dict, List, Optional, T, Tuple
-from scipy.stats import norm
 
 import numpy as np
 
+import decision
+import endgame
+import montecarlo
+from dealing import deal, default_rng, hand_dict
+from instrument import timed
 from probcalc import probcalc
 
 
@@ -28,7 +32,8 @@ class Player:
     Attributes:
 
         craziness (float [0, 0.3]): The probability with which the
-                                  player acts randomly.
+                                  player acts randomly.  Drawn at random
+                                  unless given, as is aggressiveness.
         aggressiveness (float [0, 0.4]): Probability threshold that the
                                          player accuses player of
                                          bluffing.
@@ -40,26 +45,79 @@ class Player:
                                    refers to the next players hand and
                                    index n_players - 1 is the prior
                                    players hand.
+        posterior (HandPosterior): Optional estimate of the opponents
+                                   hands from their bids.  When set, it
+                                   replaces the binomial distribution.
+        tablebase (Tablebase): Optional precomputed decisions, used for
+                               sane moves when there is no posterior.
+        deadline_ms (float): Optional time budget for a move.  When set,
+                             the distribution is estimated by
+                             montecarlo within the budget instead of
+                             taken from probcalc.
+        opponent_names List[str]: Names of the opponents, in the order
+                                  of opponents_hands.
+        stats (OpponentStats): Optional record of how opponents bid.
+                               When set, the call threshold is scaled by
+                               how often the prior player bluffs.
     """
 
     def __init__(self,
                  size: int,
                  total_dice: int,
                  opponents: List[int],
-                 name: str = None) -> None:
+                 name: str = None,
+                 aggressiveness: Optional[float] = None,
+                 craziness: Optional[float] = None) -> None:
 
         self.size = size
-        self.__aggressiveness = uniform(0, 0.4)
-        self.__craziness = uniform(0, 0.3)
+        if aggressiveness is None:
+            aggressiveness = uniform(0, 0.4)
+        if craziness is None:
+            craziness = uniform(0, 0.3)
+        self.__aggressiveness = aggressiveness
+        self.__craziness = craziness
         self.name = name
         self.total = total_dice
         self.opponent_hands = opponents
         self.__probs = None
         self.wild = False
         self.hand = None
+        self.posterior = None
+        self.__seen = None
+        self.tablebase = None
+        self.deadline_ms = None
+        self.opponent_names = []
+        self.stats = None
+        self.__bids = []
+
+    @property
+    def aggressiveness(self) -> float:
+        return self.__aggressiveness
+
+    @property
+    def craziness(self) -> float:
+        return self.__craziness
 
     def set_wild(self, isWild: bool) -> None:
-        self.__probs = probcalc(self.hand, self.total, self.total, self.wild)
+        self.wild = isWild
+        self.__bids = []
+        if self.posterior is not None:
+            self.posterior.reset([self.size] + self.opponent_hands, isWild,
+                                 self.hand)
+        self.__probs = probcalc(self.size, self.hand, self.total, isWild,
+                                self.posterior)
+        if self.posterior is not None:
+            self.__seen = self.posterior.version
+
+    def observe(self, seat: int, bet: Tuple[int, int]) -> None:
+        """
+        Records a bet made by the player seat places after this one
+        (0 being this player), and updates the posterior if the player
+        keeps one.
+        """
+        self.__bids.append((seat, bet))
+        if self.posterior is not None:
+            self.posterior.observe(seat, bet)
 
     def get_count(self, dice: int) -> int:
         n = self.hand[dice]
@@ -92,6 +150,7 @@ class Player:
     def __eq__(self: T, s2: T) -> bool:
         return self.name == s2.name and self.hand == s2.hand
 
+    @timed()
     def take_turn(self, last=None) -> Tuple[int, int]:
         """
         Makes a move based on the best probability of either
@@ -101,54 +160,70 @@ class Player:
             Tuple[int, int]: Containing the dice and amount.  Returns
                              (0, 0) if calling a bluff.
         """
+        if (self.posterior is not None and
+                self.posterior.version != self.__seen):
+            self.__probs = probcalc(self.size, self.hand, self.total,
+                                    self.wild, self.posterior)
+            self.__seen = self.posterior.version
+
         crazy = (uniform(0, 1) < self.__craziness)
         ones = self.hand[1]
-        d = np.argmax(list(self.hand.values())[2:])
+        d = 2 + int(np.argmax([self.hand[f] for f in range(2, 7)]))
         if len(self.opponent_hands) == 1 and self.opponent_hands[0] == 1:
             if self.size == 1:
-                return one_on_one(last, self.hand[d])
+                return one_on_one(last, self.hand)
+        if len(self.opponent_hands) == 1 and not crazy:
+            bet = self.__bid_out(last)
+            if bet is not None:
+                return bet
 
         if not last:
-            if len(self.opponent_hands) == 1 and sum(self.hand.values()) == 1:
+            if (len(self.opponent_hands) == 1 and self.size == 1 and
+                    self.hand[d]):
                 return (d, self.hand[d])
             if crazy:
                 d = choice(range(1, 7))
-                count = choice(range(1, (self.size // 4) + 1))
+                count = choice(range(1, max(self.size // 4, 1) + 1))
                 return (d, count)
             if ones >= self.hand[d]:
                 return (1, ones)
             return (d, ones + self.hand[d])
 
-        k = last[1] - self.hand[last[0]]
-        play = (self.__probs[last[0], k] < self.__aggressiveness)
-
-        if (play and not crazy) or (not play and crazy):
-            return (0, 0)
-        play = self.__play(last)
-
-        if self.__probs[last] - self.__probs[play[0], play[1] - ones] > 0.15:
-            return (0, 0)
+        aggressiveness = self.__aggressiveness
+        if self.stats is not None and self.opponent_names:
+            aggressiveness *= self.stats.bluff_ratio(self.opponent_names[-1])
 
-        if should_call(play, self.hand, self.total, self.wild):
-            return (0, 0)
+        if (self.tablebase is not None and self.posterior is None and
+                self.deadline_ms is None and not crazy and
+                self.tablebase.covers(self.size, self.total)):
+            return self.tablebase.decide(self.hand, self.total, self.wild,
+                                         last, aggressiveness)
 
-        return play
-
-    def __play(self, last: Tuple[int, int]) -> Tuple[int, int]:
+        hand = np.array([0] + [self.hand[f] for f in range(1, 7)])
+        if self.deadline_ms is None:
+            dist = np.asarray(self.__probs.dist)
+        else:
+            dist = montecarlo.estimate(hand, self.opponent_hands, self.wild,
+                                       self.deadline_ms,
+                                       self.posterior).mean
+        bid = np.array([last])
+        evaluation = decision.evaluate(dist[None], hand[None], [self.total],
+                                       [self.wild], bid)
+        face, count = decision.decide(evaluation, bid, aggressiveness,
+                                      [crazy])[0]
+        return (int(face), int(count))
+
+    def __bid_out(self, last) -> Optional[Tuple[int, int]]:
         """
-        Makes a move for the player.
+        Returns the solved move of a heads-up round of endgame.MAX_DICE
+        dice against 1, or None if there is none for this round.
         """
-        if not self.wild or not last:
-            k = self.hand[1]
-        else:
-            k = 0
-
-        count = last[1] - k
-        low = list(self.__probs[:last[0] + 1, count + 1].T)
-        high = list(self.__probs[last[0] + 1:, count].T)
-        moves = np.array(low + high)
-        d = np.argmax(list(moves))
-        return (d, k + self.hand[d])
+        bids = [bet for _, bet in self.__bids]
+        if (bids[-1] if bids else None) != (tuple(last) if last else None):
+            return None
+        opened = not bids or self.__bids[0][0] == 0
+        return endgame.bid(self.hand, self.opponent_hands[0], opened, bids,
+                           self.wild)
 
     def start_new_round(self, lost, new_hand) -> None:
         """
@@ -156,20 +231,23 @@ class Player:
         lost in the last round.
         """
         self.hand = new_hand
-        self.size = len(new_hand) - 1
+        self.size = sum(new_hand.values())
         self.wild = False
         self.__probs = None
+        self.__bids = []
+        if self.posterior is not None:
+            self.posterior.reset([self.size] + self.opponent_hands, False,
+                                 new_hand)
 
-    def make_hand(self) -> Dict[int, int]:
+    def make_hand(self, rng: Optional[np.random.Generator] = None) -> None:
         """
-        Randomly creates a new hand for the player.
+        Randomly creates a new hand for the player, using this process's
+        Generator unless one is given.
         """
-        hand = {n: 0 for n in range(7)}
-        for _ in range(self.size):
-            hand[randint(1, 6)] += 1
-        self.hand = hand
+        self.hand = hand_dict(deal(rng or default_rng(), self.size))
 
 
+@timed()
 def should_call(last, my_hand, total_dice, wild) -> bool:
     """
     Returns False if the probability of the last play is greater than
@@ -180,12 +258,14 @@ def should_call(last, my_hand, total_dice, wild) -> bool:
     else:
         p = 1 / 6
     n_s = last[1] - my_hand[last[0]]
-    if wild:
+    if wild and last[0] != 1:
         n_s -= my_hand[1]
-    if n_s >= 0:
+    if n_s <= 0:
         return False
 
-    n_f = total_dice - my_hand - n_s
+    n_f = total_dice - sum(my_hand.values()) - n_s
+    if n_f < 0:
+        return True
     p_hat = get_CI(n_s, n_f)
 
     if p_hat < p:
@@ -193,6 +273,7 @@ def should_call(last, my_hand, total_dice, wild) -> bool:
     return True
 
 
+@timed()
 def get_CI(n_s: int, n_f: int) -> float:
     """
     Calculates the Binomial proportion confidence interval using the
@@ -204,7 +285,7 @@ def get_CI(n_s: int, n_f: int) -> float:
         (i.e. 10% likelyhood that the events probability is not higher
          than the value.)
     """
-    z = norm.ppf(0.8)   # 90% confidence interval
+    z = decision.Z
     a = (n_s + z ** 2 / 2) / (n_s + n_f + z ** 2)
     b = z / ((n_s + n_f) + z ** 2) * \
         sqrt((n_s * n_f / (n_s + n_f)) + z ** 2 / 4)
@@ -213,19 +294,11 @@ def get_CI(n_s: int, n_f: int) -> float:
 
 def one_on_one(last: int, my_dice: Dict[int, int]) -> int:
     """
-    If both players have one dice remaining bet on the sum of both hands.
+    If both players have one dice remaining bet on the sum of both hands,
+    playing the solved equilibrium of endgame.
     """
-    mine = max(my_dice.values())
-    bet = mine + randint(1, 6)
-    if last:
-        if last <= mine:
-            return mine + 1
-        elif last <= mine + 2:
-            return mine + (last - mine) + 1
-        while last == bet:
-            bet = mine + randint(1, 6)
-        return bet
-    return bet
+    mine = max(d for d, c in my_dice.items() if c)
+    return endgame.guess(mine, last)
 
 
 # def end_game(opponenent_size: int,
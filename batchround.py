@@ -0,0 +1,168 @@
+"""batchround.py
+
+Array-backed game state for playing many tables of 'Liars Dice' in
+lockstep.  Where GameRound.LiarsDice walks a ring of PlayerNodes and
+keeps each hand as a dict on its Player, BatchLiarsDice keeps the state
+of every table as a struct of NumPy arrays so that dealing, bid legality
+and resolving calls are vectorized over tables.
+
+Batched tables play the bidding rules to the last dice; the sudden-death
+sum guess is only played by GameRound.LiarsDice.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from dealing import deal, default_rng
+
+
+class BatchLiarsDice:
+    """
+    The state of n_tables games played in lockstep.
+
+    Attributes:
+        hands (np.ndarray[int8]): (tables, seats, 7) face histograms, so
+                                  hands[t, s, i] is the number of dice i
+                                  held by seat s at table t.
+        sizes (np.ndarray[int8]): (tables, seats) dice held by each seat,
+                                  0 once a seat is out.
+        bid (np.ndarray[int16]): (tables, 2) the current (dice, count)
+                                 bid, (0, 0) before the first bid.
+        bidder (np.ndarray[int64]): (tables,) seat that made the bid.
+        turn (np.ndarray[int64]): (tables,) seat whose turn it is.
+        wild (np.ndarray[bool]): (tables,) whether 1's are wild.
+        rng (np.random.Generator): Dice for every table.
+    """
+
+    def __init__(self,
+                 n_tables: int,
+                 n_seats: int,
+                 dice: int = 5,
+                 wild: bool = False,
+                 rng: Optional[np.random.Generator] = None) -> None:
+        self.dice = dice
+        self.rng = rng if rng is not None else default_rng()
+        self.hands = np.zeros((n_tables, n_seats, 7), dtype=np.int8)
+        self.sizes = np.zeros((n_tables, n_seats), dtype=np.int8)
+        self.bid = np.zeros((n_tables, 2), dtype=np.int16)
+        self.bidder = np.zeros(n_tables, dtype=np.int64)
+        self.turn = np.zeros(n_tables, dtype=np.int64)
+        self.wild = np.full(n_tables, wild)
+        self.reset()
+
+    @property
+    def n_tables(self) -> int:
+        return self.sizes.shape[0]
+
+    @property
+    def n_seats(self) -> int:
+        return self.sizes.shape[1]
+
+    def reset(self, tables: Optional[np.ndarray] = None) -> None:
+        """
+        Starts new games at tables (a boolean mask, all by default) with
+        every seat holding self.dice dice and seat 0 to bid first.
+        """
+        tables = self.__mask(tables)
+        self.sizes[tables] = self.dice
+        self.turn[tables] = 0
+        self.deal(tables)
+
+    def deal(self, tables: Optional[np.ndarray] = None) -> None:
+        """
+        Rolls new hands at tables and clears their bids.
+        """
+        tables = self.__mask(tables)
+        self.hands[tables] = deal(self.rng, self.sizes[tables])
+        self.bid[tables] = 0
+
+    def totals(self) -> np.ndarray:
+        """
+        Returns the total dice in play at each table.
+        """
+        return self.sizes.sum(axis=1, dtype=np.int64)
+
+    def done(self) -> np.ndarray:
+        """
+        Returns a mask of the tables with at most one player left.
+        """
+        return (self.sizes > 0).sum(axis=1) <= 1
+
+    def face_counts(self, dice: np.ndarray) -> np.ndarray:
+        """
+        Returns how many of dice[t] are on table t, counting 1's when
+        they are wild.
+        """
+        t = np.arange(self.n_tables)
+        counts = self.hands[t, :, dice].sum(axis=1, dtype=np.int64)
+        ones = self.hands[:, :, 1].sum(axis=1, dtype=np.int64)
+        return counts + np.where(self.wild & (dice != 1), ones, 0)
+
+    def next_seat(self, seat: np.ndarray) -> np.ndarray:
+        """
+        Returns the first seat after seat[t] at each table that still
+        has dice.
+        """
+        t = np.arange(self.n_tables)[:, None]
+        ahead = seat[:, None] + np.arange(1, self.n_seats + 1)
+        ahead %= self.n_seats
+        first = np.argmax(self.sizes[t, ahead] > 0, axis=1)
+        return ahead[t[:, 0], first]
+
+    def can_move(self, bets: np.ndarray) -> np.ndarray:
+        """
+        Returns a mask of the tables where bets[t] = (dice, count) is a
+        legal move, (0, 0) being a call.
+        """
+        dice, count = bets[:, 0], bets[:, 1]
+        opened = self.bid[:, 1] > 0
+        call = (dice == 0) & (count == 0)
+        in_range = ((dice >= 1) & (dice <= 6) & (count >= 1) &
+                    (count <= self.totals()))
+        raises = ((count > self.bid[:, 1]) |
+                  ((count == self.bid[:, 1]) & (dice > self.bid[:, 0])))
+        return np.where(call, opened, in_range & raises)
+
+    def step(self,
+             bets: np.ndarray,
+             tables: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Makes the move bets[t] for the player whose turn it is at each of
+        tables.  A call resolves the bid, takes a dice from the loser and
+        deals the next round, which the loser starts (or the next player
+        if the loser is out).
+
+        Returns:
+            np.ndarray[int64]: The seat that lost a dice at each table,
+                               or -1 where no bid was called.
+        """
+        tables = self.__mask(tables) & ~self.done()
+        bets = np.asarray(bets, dtype=np.int16)
+        if not self.can_move(bets)[tables].all():
+            raise ValueError("Illegal move at tables %s." %
+                             np.flatnonzero(tables & ~self.can_move(bets)))
+
+        call = tables & (bets[:, 0] == 0)
+        bid = tables & ~call
+        losers = np.full(self.n_tables, -1, dtype=np.int64)
+
+        self.bid[bid] = bets[bid]
+        self.bidder[bid] = self.turn[bid]
+        self.turn[bid] = self.next_seat(self.turn)[bid]
+
+        if call.any():
+            truthful = self.face_counts(self.bid[:, 0]) >= self.bid[:, 1]
+            losers[call] = np.where(truthful, self.turn, self.bidder)[call]
+            self.sizes[np.flatnonzero(call), losers[call]] -= 1
+            out = call & (self.sizes[np.arange(self.n_tables),
+                                     np.maximum(losers, 0)] == 0)
+            self.turn[call] = losers[call]
+            self.turn[out] = self.next_seat(losers)[out]
+            self.deal(call)
+        return losers
+
+    def __mask(self, tables: Optional[np.ndarray]) -> np.ndarray:
+        if tables is None:
+            return np.ones(self.n_tables, dtype=bool)
+        return np.asarray(tables, dtype=bool)
@@ -0,0 +1,254 @@
+"""bench.py
+
+Benchmarks for the hot paths of the bots and the game engine.  Every
+benchmark runs offline from fixed seeds and is reported relative to a
+fixed calibration workload, so results can be compared across machines
+and commits.  Each timing runs for at least MIN_TIME, the calibration
+is timed again next to every timing, and a result is the median of
+ROUNDS such ratios taken in turn with the other benchmarks, so a busy
+machine slows both sides alike and a burst of load is outvoted.  Results
+are checked against the baseline committed with the repository, and
+the run fails if any benchmark is slower than the baseline by more
+than the threshold plus NOISE_FLOOR, or has no baseline at all.
+
+Usage:
+    python bench.py --save              # record a new baseline
+    python bench.py --threshold 0.25    # compare against it
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import decision
+from dealing import deal, hand_dict
+from GameRound import LiarsDice
+from Player import Player, get_CI, should_call
+from probcalc import probcalc
+from simulate import make_bots, run_games, seat_players
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'bench_baseline.json')
+SEED = 1234
+MIN_TIME = 0.01                 # seconds per timing
+ROUNDS = 5
+# Calibration units any benchmark may drift by, which matters only for
+# the sub-microsecond ones whose timings jitter most.
+NOISE_FLOOR = 0.05
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str, number: int) -> Callable:
+    """
+    Registers a benchmark.  The decorated function sets up its state
+    from SEED and returns the callable to time number times.
+    """
+    def register(setup: Callable) -> Callable:
+        BENCHMARKS[name] = (setup, number)
+        return setup
+    return register
+
+
+def measure(fn: Callable, number: int, repeat: int = 3) -> float:
+    """
+    Returns the best time per call over repeat runs of number calls,
+    number being raised first until a run takes at least MIN_TIME.
+    """
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_TIME:
+            break
+        number *= max(2, int(MIN_TIME / max(elapsed, 1e-9) * 1.2))
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def calibrate() -> float:
+    """
+    Times a fixed mix of interpreter and small NumPy work, the unit all
+    results are reported in.
+    """
+    a = np.arange(64, dtype=np.float64)
+
+    def work():
+        total = 0
+        for i in range(200):
+            total += i * i
+        return total + float((a * a).sum())
+    return measure(work, 100)
+
+
+def seeded() -> np.random.Generator:
+    random.seed(SEED)
+    return np.random.default_rng(SEED)
+
+
+def bot(size: int, total: int, opponents: List[int],
+        rng: np.random.Generator,
+        aggressiveness: Optional[float] = None) -> Player:
+    p = Player(size, total, opponents, "Bench", aggressiveness, 0.0)
+    p.hand = hand_dict(deal(rng, size))
+    p.set_wild(False)
+    return p
+
+
+for _players in (2, 4, 8, 12):
+    def _setup(players=_players):
+        rng = seeded()
+        hand = hand_dict(deal(rng, 5))
+        return lambda: probcalc(5, hand, 5 * players, False)
+    benchmark('probcalc_init_%d' % _players, 2000)(_setup)
+
+
+@benchmark('opponent_probability', 2000)
+def _opponent_probability():
+    rng = seeded()
+    hand = hand_dict(deal(rng, 5))
+
+    def run():
+        probcalc(5, hand, 30, False).opponent_probability(5, (3, 6))
+    return run
+
+
+@benchmark('take_turn_open', 2000)
+def _take_turn_open():
+    p = bot(5, 30, [5] * 5, seeded())
+    return lambda: p.take_turn(None)
+
+
+@benchmark('take_turn_raise', 2000)
+def _take_turn_raise():
+    p = bot(5, 30, [5] * 5, seeded(), aggressiveness=0.0)
+    return lambda: p.take_turn((3, 4))
+
+
+@benchmark('should_call', 5000)
+def _should_call():
+    hand = hand_dict(deal(seeded(), 5))
+    return lambda: should_call((4, 9), hand, 30, False)
+
+
+@benchmark('get_CI', 5000)
+def _get_CI():
+    return lambda: get_CI(6, 19)
+
+
+@benchmark('decide_all_1000', 50)
+def _decide_all():
+    rng = seeded()
+    sizes = rng.integers(1, 6, 1000)
+    hands = deal(rng, sizes)
+    totals = sizes + rng.integers(1, 30, 1000)
+    wild = rng.random(1000) < 0.5
+    last = np.stack([rng.integers(1, 7, 1000),
+                     rng.integers(1, totals + 1)], axis=1)
+    return lambda: decision.decide_all(hands, totals, wild, last, 0.2)
+
+
+@benchmark('call_bet', 5000)
+def _call_bet():
+    rng = seeded()
+    players = make_bots(6)
+    game = LiarsDice(seat_players(players), 6, rng=rng)
+    return lambda: game.call_bet(4, 9, game.current_turn)
+
+
+@benchmark('game_4_players', 3)
+def _game():
+    return lambda: run_games(5, 4, seed=SEED)
+
+
+def run(names: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    Runs the benchmarks (all by default).
+
+    Returns:
+        Dict[str, float]: Median over ROUNDS of the time per call of
+                          each benchmark in units of the calibration
+                          workload timed beside it.
+    """
+    chosen = {name: (setup(), number)
+              for name, (setup, number) in BENCHMARKS.items()
+              if not names or any(n in name for n in names)}
+    ratios = {name: [] for name in chosen}
+    # Rounds go through every benchmark in turn, so that a burst of load
+    # lands in one round of several benchmarks rather than in every
+    # round of one.
+    for _ in range(ROUNDS):
+        for name, (fn, number) in chosen.items():
+            unit = calibrate()
+            value = measure(fn, number)
+            ratios[name].append(value / ((unit + calibrate()) / 2))
+    return {name: float(np.median(r)) for name, r in ratios.items()}
+
+
+def compare(results: Dict[str, float],
+            baseline: Dict[str, float],
+            threshold: float) -> List[Tuple[str, float]]:
+    """
+    Returns the benchmarks slower than baseline by more than threshold
+    and NOISE_FLOOR, with their ratio to the baseline.
+    """
+    return [(name, value / baseline[name])
+            for name, value in results.items()
+            if name in baseline and
+            value > baseline[name] * (1 + threshold) + NOISE_FLOOR]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the benchmarks.")
+    parser.add_argument("names", nargs="*",
+                        help="only run benchmarks containing these.")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown, 0.2 is 20%%.")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baseline.")
+    args = parser.parse_args(argv)
+
+    results = run(args.names)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    for name, value in results.items():
+        if name in baseline:
+            print("%-24s %12.3f  (%+.1f%%)" %
+                  (name, value, 100 * (value / baseline[name] - 1)))
+        else:
+            print("%-24s %12.3f" % (name, value))
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("Saved baseline to %s." % args.baseline)
+        return 0
+
+    missing = [name for name in results if name not in baseline]
+    for name in missing:
+        print("NO BASELINE for %s, record one with --save." % name)
+    regressions = compare(results, baseline, args.threshold)
+    for name, ratio in regressions:
+        print("REGRESSION %s is %.2fx the baseline." % (name, ratio))
+    return 1 if regressions or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,79 @@
+"""binomtable.py
+
+Precomputed binomial tail probabilities for 'Liars Dice'.
+
+A table can hold at most MAX_DICE dice and a face only ever appears with
+probability 1/6 (no wilds, or bidding ones) or 1/3 (ones are wild), so
+every tail P[X_n >= k] the game can ask for fits in one small array.
+The array is written to TABLE_PATH the first time it is needed and
+memory-mapped on every later import (or attached from shared memory if
+the parent of a worker published it), so building a probability
+distribution is an index lookup rather than a scipy call.
+"""
+
+import os
+
+import numpy as np
+
+import instrument
+from sharedtables import attach
+
+MAX_DICE = 60
+PROBS = (1 / 6, 1 / 3)
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'binom_tails.npy')
+
+
+def build_tails(max_dice: int = MAX_DICE) -> np.ndarray:
+    """
+    Computes the tail table with scipy.
+
+    Returns:
+        A 2 x (max_dice + 1) x (max_dice + 2) array A where A[w][n][k]
+        is P[X_n >= k] for X_n ~ Binomial(n, PROBS[w]).
+    """
+    from scipy.stats import binom
+
+    if instrument.ENABLED:
+        instrument.count('scipy_calls')
+    n = np.arange(max_dice + 1)[:, None]
+    k = np.arange(max_dice + 2)[None, :]
+    tails = np.stack([binom.sf(k - 1, n, p) for p in PROBS])
+    return np.ascontiguousarray(tails, dtype=np.float64)
+
+
+def load_tails(path: str = TABLE_PATH) -> np.ndarray:
+    """
+    Returns the published tail table if there is one, and otherwise
+    memory-maps the tail table at path, building and saving it first if
+    it does not exist yet.  If the table cannot be written (e.g. a read
+    only install) the freshly built array is used in memory instead.
+    """
+    shape = (len(PROBS), MAX_DICE + 1, MAX_DICE + 2)
+    shared = attach('tails')
+    if shared is not None and shared.shape == shape:
+        return shared
+    try:
+        tails = np.load(path, mmap_mode='r')
+        if tails.shape == shape:
+            return tails
+    except (OSError, ValueError):
+        pass
+
+    tails = build_tails()
+    try:
+        np.save(path, tails)
+    except OSError:
+        return tails
+    return np.load(path, mmap_mode='r')
+
+
+TAILS = load_tails()
+
+
+def tails(n: int, wild: bool) -> np.ndarray:
+    """
+    Returns the row of P[X_n >= k] for k in [0, n + 1], where wild
+    selects p = 1/3 instead of p = 1/6.
+    """
+    return TAILS[int(wild), n, :n + 2]
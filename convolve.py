@@ -0,0 +1,150 @@
+"""convolve.py
+
+Exact distribution of how many of a face are held across seats of
+different sizes.  probcalc pools every unknown dice into one binomial;
+here each seat has its own count distribution (binomial by default, or
+any per-seat pmf such as a posterior over that seat's hand) and the
+distribution over a set of seats is the product of their generating
+polynomials, computed once with an FFT and cached.
+"""
+
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from binomtable import TAILS
+
+
+class SeatConvolution:
+    """
+    Count distributions of each face over subsets of the seats at a
+    table.
+
+    Attributes:
+        sizes (List[int]): Number of dice held by each seat.
+        wild (bool): Whether 1's are wild, so count towards every face.
+        total (int): Number of dice held by all seats.
+    """
+
+    def __init__(self,
+                 sizes: List[int],
+                 wild: bool = False,
+                 pmfs: Optional[np.ndarray] = None) -> None:
+        """
+        Args:
+            sizes: Number of dice held by each seat.
+            wild: Whether 1's are wild.
+            pmfs: Optional (seats, 7, max(sizes) + 1) array where
+                  pmfs[s, i, k] is the probability seat s holds k of
+                  face i (1's included when wild).  Seats are binomial
+                  when it is not given.
+        """
+        self.sizes = list(sizes)
+        self.wild = wild
+        self.total = sum(self.sizes)
+        self.__pmfs = pmfs
+        self.__spectra = {}
+        self.__cache = {}
+
+    def seat_pmf(self, seat: int, face: int) -> np.ndarray:
+        """
+        Returns P[seat holds k of face] for k in [0, sizes[seat]].
+        """
+        size = self.sizes[seat]
+        if self.__pmfs is not None:
+            return np.asarray(self.__pmfs[seat, face, :size + 1])
+        tails = TAILS[self.__p_index(face), size, :size + 2]
+        return tails[:-1] - tails[1:]
+
+    def pmf(self, face: int,
+            seats: Optional[Iterable[int]] = None) -> np.ndarray:
+        """
+        Returns the exact P[seats hold k of face] for k in
+        [0, dice held by seats], over all seats by default.
+        """
+        mask = self.__mask(seats)
+        key = (self.__key(face), mask)
+        if key not in self.__cache:
+            chosen = [s for s in range(len(self.sizes)) if mask >> s & 1]
+            n = sum(self.sizes[s] for s in chosen)
+            product = np.prod(self.__spectrum(face)[chosen], axis=0)
+            dist = np.fft.irfft(product, self.total + 1)[:n + 1]
+            self.__cache[key] = np.clip(dist, 0.0, 1.0)
+        return self.__cache[key]
+
+    def tails(self, face: int,
+              seats: Optional[Iterable[int]] = None) -> np.ndarray:
+        """
+        Returns P[seats hold at least k of face] for k in
+        [0, dice held by seats + 1].
+        """
+        mask = self.__mask(seats)
+        key = (self.__key(face), mask, 'tails')
+        if key not in self.__cache:
+            dist = self.pmf(face, seats)
+            tails = np.append(np.cumsum(dist[::-1])[::-1], 0.0)
+            self.__cache[key] = np.clip(tails, 0.0, 1.0)
+        return self.__cache[key]
+
+    def tail(self, face: int, count: int,
+             seats: Optional[Iterable[int]] = None) -> float:
+        """
+        Returns P[seats hold at least count of face].
+        """
+        tails = self.tails(face, seats)
+        return float(tails[min(max(count, 0), len(tails) - 1)])
+
+    def conditional(self,
+                    face: int,
+                    seats: Iterable[int],
+                    at_least: int) -> np.ndarray:
+        """
+        Returns P[seats hold k of face | all seats hold at least at_least
+        of face] for k in [0, dice held by seats].  With seats as a
+        single opponent this is the distribution behind
+        probcalc.opponent_probability.
+        """
+        mask = self.__mask(seats)
+        rest = [s for s in range(len(self.sizes)) if not mask >> s & 1]
+        dist = self.pmf(face, seats)
+        rest_tails = self.tails(face, rest)
+        need = np.clip(at_least - np.arange(len(dist)), 0,
+                       len(rest_tails) - 1)
+        joint = dist * rest_tails[need]
+        total = joint.sum()
+        if total <= 0.0:
+            return np.zeros_like(joint)
+        return joint / total
+
+    def __spectrum(self, face: int) -> np.ndarray:
+        """
+        Returns the (seats, total // 2 + 1) real FFTs of every seat's
+        pmf for face, zero padded to total + 1.
+        """
+        key = self.__key(face)
+        if key not in self.__spectra:
+            padded = np.zeros((len(self.sizes), self.total + 1))
+            for s, size in enumerate(self.sizes):
+                padded[s, :size + 1] = self.seat_pmf(s, face)
+            self.__spectra[key] = np.fft.rfft(padded, axis=1)
+        return self.__spectra[key]
+
+    def __p_index(self, face: int) -> int:
+        return int(self.wild and face != 1)
+
+    def __key(self, face: int) -> int:
+        """
+        Faces whose seats are all binomial with the same p share their
+        spectra and cached results.
+        """
+        if self.__pmfs is None:
+            return -1 - self.__p_index(face)
+        return face
+
+    def __mask(self, seats: Optional[Iterable[int]]) -> int:
+        if seats is None:
+            return (1 << len(self.sizes)) - 1
+        mask = 0
+        for s in seats:
+            mask |= 1 << s
+        return mask
@@ -0,0 +1,61 @@
+"""dealing.py
+
+Rolls hands of 'Liars Dice' in bulk.  Every hand of a round, or of many
+tables at once, is drawn with a single numpy Generator call that returns
+face histograms directly.  Each table or worker can be given its own
+seeded stream, so parallel runs are reproducible without sharing the
+global random state.
+"""
+
+import os
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+FACES = np.full(6, 1 / 6)
+
+_DEFAULT = {}
+
+
+def default_rng() -> np.random.Generator:
+    """
+    Returns this process's unseeded Generator.  A forked worker gets a
+    fresh one rather than a copy of its parent's state.
+    """
+    pid = os.getpid()
+    if pid not in _DEFAULT:
+        _DEFAULT.clear()
+        _DEFAULT[pid] = np.random.default_rng()
+    return _DEFAULT[pid]
+
+
+def streams(seed: Optional[int], n: int) -> List[np.random.Generator]:
+    """
+    Returns n independent Generators spawned from seed, one for each
+    table or worker.
+    """
+    return [np.random.default_rng(s)
+            for s in np.random.SeedSequence(seed).spawn(n)]
+
+
+def deal(rng: np.random.Generator,
+         sizes: Union[int, np.ndarray]) -> np.ndarray:
+    """
+    Rolls a hand for every entry of sizes in one call.
+
+    Returns:
+        np.ndarray[int64]: sizes.shape + (7,) face histograms where
+                           hist[..., i] is the number of dice i rolled
+                           and hist[..., 0] is 0.
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    hist = np.zeros(sizes.shape + (7,), dtype=np.int64)
+    hist[..., 1:] = rng.multinomial(sizes, FACES)
+    return hist
+
+
+def hand_dict(hist: np.ndarray) -> Dict[int, int]:
+    """
+    Converts a face histogram into the hand dict used by Player.
+    """
+    return {n: int(c) for n, c in enumerate(hist)}
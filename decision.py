@@ -0,0 +1,215 @@
+"""decision.py
+
+A batched decision kernel for the sane Player policy.  Given the
+distribution of the dice on the table, the candidate raises on the last
+bid, their probability of being true, the Wilson lower bound of the
+proportion each needs from the unseen dice and the call thresholds are
+evaluated as arrays for a whole batch of players (or tables) in one pass.
+
+Only the lowest legal count of each face is a candidate: the chance of
+at least count dice never grows with the count, so it is the best raise
+on that face.  This gives the same move as Player.__play's argmax over
+every legal bid, ties going to the lower face.
+
+Craziness is an input rather than a random draw, and the heads-up
+special cases of Player.take_turn (the sudden-death sum guess and the
+one dice opening) are left to the Player.
+"""
+
+from statistics import NormalDist
+from typing import NamedTuple, Optional, Union
+
+import numpy as np
+
+from binomtable import TAILS
+from instrument import timed
+
+Z = NormalDist().inv_cdf(0.8)   # 90% confidence interval
+FACES = np.arange(1, 7)
+# A raise this much less likely than the last bid is not worth making.
+MARGIN = 0.15
+
+
+class Evaluation(NamedTuple):
+    """
+    Every candidate raise of a batch of B players, candidate i being a
+    bid on face i + 1.
+
+    Attributes:
+        counts (np.ndarray[int64]): (B, 6) lowest legal count per face.
+        p_play (np.ndarray[float64]): (B, 6) chance each candidate is
+                                      true, -1 where it is not legal.
+        lower (np.ndarray[float64]): (B, 6) Wilson lower bound of the
+                                     proportion of unseen dice each
+                                     candidate needs, nan where it needs
+                                     none.
+        unlikely (np.ndarray[bool]): (B, 6) should_call for each
+                                     candidate.
+        p_last (np.ndarray[float64]): (B,) chance the last bid is true.
+        best (np.ndarray[int64]): (B,) index of the most likely
+                                  candidate.
+    """
+    counts: np.ndarray
+    p_play: np.ndarray
+    lower: np.ndarray
+    unlikely: np.ndarray
+    p_last: np.ndarray
+    best: np.ndarray
+
+
+def wilson_lower(n_s: np.ndarray, n_f: np.ndarray) -> np.ndarray:
+    """
+    Vectorized Player.get_CI.
+    """
+    n = n_s + n_f
+    a = (n_s + Z ** 2 / 2) / (n + Z ** 2)
+    b = Z / (n + Z ** 2) * np.sqrt(n_s * n_f / np.maximum(n, 1) + Z ** 2 / 4)
+    return a - b
+
+
+def distribution(hands: np.ndarray,
+                 totals: np.ndarray,
+                 wild: np.ndarray) -> np.ndarray:
+    """
+    Looks up the binomial distribution of every player, as probcalc
+    does, for a batch of (B, 7) hand histograms.
+
+    Returns:
+        np.ndarray[float64]: (B, 7, max(totals) + 1) array where
+                             [b, i, j] is the chance of at least j dice
+                             i on the table of player b, -1 past its
+                             total.
+    """
+    hands = np.asarray(hands, dtype=np.int64)
+    totals = np.asarray(totals, dtype=np.int64)
+    wild = np.asarray(wild, dtype=bool)
+    known = hands.copy()
+    known[:, 2:] += np.where(wild, hands[:, 1], 0)[:, None]
+    p_index = np.zeros(known.shape, dtype=np.int64)
+    p_index[:, 2:] = wild[:, None]
+    n = (totals - hands.sum(axis=1))[:, None, None]
+    columns = np.arange(totals.max() + 1)
+    k = columns[None, None, :] - known[:, :, None]
+    dist = TAILS[p_index[:, :, None], n, np.clip(k, 0, n + 1)]
+    dist[np.broadcast_to(columns[None, None, :] > totals[:, None, None],
+                         dist.shape)] = -1.0
+    return dist
+
+
+def evaluate(dist: np.ndarray,
+             hands: np.ndarray,
+             totals: np.ndarray,
+             wild: np.ndarray,
+             last: np.ndarray) -> Evaluation:
+    """
+    Evaluates the candidate raises on last[b] = (dice, count) for each
+    player b, whose distribution is dist[b] (from distribution, or a
+    stack of probcalc.dist).
+    """
+    dist = np.asarray(dist)
+    hands = np.asarray(hands, dtype=np.int64)
+    totals = np.asarray(totals, dtype=np.int64)
+    wild = np.asarray(wild, dtype=bool)
+    last = np.asarray(last, dtype=np.int64)
+    rows = np.arange(len(hands))
+    face, count = last[:, 0], last[:, 1]
+
+    counts = count[:, None] + (FACES[None, :] <= face[:, None])
+    legal = counts <= totals[:, None]
+    capped = np.minimum(counts, dist.shape[2] - 1)
+    p_play = np.where(legal, dist[rows[:, None], FACES[None, :], capped],
+                      -1.0)
+    p_last = dist[rows, face, np.minimum(count, dist.shape[2] - 1)]
+
+    n_s = counts - hands[:, 1:]
+    n_s[:, 1:] -= np.where(wild, hands[:, 1], 0)[:, None]
+    n_f = (totals - hands.sum(axis=1))[:, None] - n_s
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lower = np.where(n_s > 0, wilson_lower(n_s, n_f), np.nan)
+    p = np.where(wild, 1 / 3, 1 / 6)[:, None]
+    unlikely = (n_s > 0) & ((n_f < 0) | (lower >= p))
+
+    return Evaluation(counts, p_play, lower, unlikely, p_last,
+                      np.argmax(p_play, axis=1))
+
+
+def opening(hands: np.ndarray) -> np.ndarray:
+    """
+    Returns the (B, 2) opening bids of a sane Player with each hand: its
+    most common face other than 1, counting the 1's, or the 1's if there
+    are at least as many.
+    """
+    hands = np.asarray(hands, dtype=np.int64)
+    d = 2 + np.argmax(hands[:, 2:], axis=1)
+    ones = hands[:, 1]
+    most = hands[np.arange(len(hands)), d]
+    return np.where((ones >= most)[:, None],
+                    np.stack([np.ones_like(ones), ones], axis=1),
+                    np.stack([d, ones + most], axis=1))
+
+
+def decide(evaluation: Evaluation,
+           last: np.ndarray,
+           aggressiveness: Union[float, np.ndarray],
+           crazy: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Applies the Player's call thresholds to an evaluation.
+
+    Args:
+        evaluation: From evaluate, for the same last bids.
+        last: (B, 2) last bids, (0, 0) for an opening bid.
+        aggressiveness: Each player's aggressiveness.
+        crazy: Where set, the first call test is inverted, as it is
+               when a Player acts randomly.
+
+    Returns:
+        np.ndarray[int64]: (B, 2) moves, (0, 0) being a call.
+    """
+    last = np.asarray(last, dtype=np.int64)
+    rows = np.arange(len(last))
+    best = evaluation.best
+    call = evaluation.p_last < aggressiveness
+    if crazy is not None:
+        call = call != np.asarray(crazy, dtype=bool)
+    p_play = evaluation.p_play[rows, best]
+    call |= p_play < 0
+    call |= evaluation.p_last - p_play > MARGIN
+    call |= evaluation.unlikely[rows, best]
+    moves = np.stack([best + 1, evaluation.counts[rows, best]], axis=1)
+    return np.where(call[:, None], 0, moves)
+
+
+@timed()
+def decide_all(hands: np.ndarray,
+               totals: np.ndarray,
+               wild: np.ndarray,
+               last: np.ndarray,
+               aggressiveness: Union[float, np.ndarray],
+               crazy: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Returns the (B, 2) moves of a batch of sane Players, opening where
+    last[b] is (0, 0).
+    """
+    hands = np.asarray(hands, dtype=np.int64)
+    last = np.asarray(last, dtype=np.int64)
+    opened = last[:, 1] > 0
+    evaluation = evaluate(distribution(hands, totals, wild), hands,
+                          totals, wild, np.where(opened[:, None], last, 1))
+    moves = decide(evaluation, last, aggressiveness, crazy)
+    return np.where(opened[:, None], moves, opening(hands))
+
+
+def table_moves(game,
+                aggressiveness: Union[float, np.ndarray],
+                crazy: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Returns the move of the player whose turn it is at every table of a
+    batchround.BatchLiarsDice, for game.step.  aggressiveness may be
+    given per table or per (table, seat).
+    """
+    tables = np.arange(game.n_tables)
+    aggressiveness = np.asarray(aggressiveness, dtype=np.float64)
+    if aggressiveness.ndim == 2:
+        aggressiveness = aggressiveness[tables, game.turn]
+    return decide_all(game.hands[tables, game.turn], game.totals(),
+                      game.wild, game.bid, aggressiveness, crazy)
@@ -0,0 +1,619 @@
+"""endgame.py
+
+Exact solutions of the smallest endings of 'Liars Dice'.
+
+When the last two players hold one dice each they guess the sum of the
+two dice instead of bidding: the first player guesses knowing only their
+own dice, the second replies knowing their own dice and the first
+guess, the closer guess wins the game and a tie is re-rolled with the
+same player first.  This is a small two player zero-sum game with
+hidden information, so its equilibrium is solved as a pair of linear
+programs (the first player's guess may need to be mixed, so as not to
+give their dice away).  Since a tie restarts the game, a tie is worth
+the value of the game itself; the value is found as the fixed point of
+solving with ties worth v, starting from v = 1/2.  The reply can always
+force a re-roll by repeating the guess, so the first player wins only
+1/6 of sudden deaths.
+
+The strategies are written to a (6, 12, 11) table, lazily loaded the
+first time a guess is made: row [d - 1, 0] is the chance of each guess
+2 to 12 when opening with dice d, and row [d - 1, g - 1] the chance of
+each reply with dice d to the guess g.
+
+Two players still bidding out a round are solved exactly only for the
+smallest such ending, MAX_DICE dice against 1: with perfect recall the
+bids made so far are part of every information set, so the game tree
+has a state for each of the 2 ** 18 sets of claims.  BidOut runs CFR+
+over the whole tree, and the average strategies are written to a
+float16 table that is only loaded if it has been solved (python
+endgame.py --max-dice 2), and Player plays from it when it has been.
+Larger endings are only approximated, by the sampled equilibrium of
+Markov Master (LiarsDiceAgent), which recalls just the last claims and
+which Player does not use.
+
+Usage:
+    python endgame.py
+    python endgame.py --max-dice 2 --iterations 100
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import product
+from math import comb
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import instrument
+from sharedtables import attach
+
+GUESSES = np.arange(2, 13)
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'sudden_death.npy')
+SHAPE = (6, 1 + len(GUESSES), len(GUESSES))
+# Most dice a side of the bid-out endings that can be solved: the game
+# tree of a dice against b has 2 ** (6 * (a + b)) public states.
+MAX_DICE = 2
+ITERATIONS = 100
+BID_OUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'bid_out.npy')
+# Wild, opener, claim or call, state, hand of MAX_DICE dice.
+BID_OUT_SHAPE = (2, 2, 2, 1 << (6 * (MAX_DICE + 1)), comb(MAX_DICE + 5, 5))
+
+_TABLE = {}
+
+
+def payoffs(tie: float) -> np.ndarray:
+    """
+    Returns the (6, 6, 11, 11) chance u[a, b, i, j] that the first
+    player wins with dice a + 1 against b + 1, guessing GUESSES[i]
+    against GUESSES[j], a tie being worth tie.
+    """
+    dice = np.arange(1, 7)
+    actual = dice[:, None, None, None] + dice[None, :, None, None]
+    first = np.abs(GUESSES[None, None, :, None] - actual)
+    second = np.abs(GUESSES[None, None, None, :] - actual)
+    return np.where(first < second, 1.0, np.where(first > second, 0.0, tie))
+
+
+def solve_first(u: np.ndarray) -> Tuple[float, np.ndarray]:
+    """
+    Solves for the first player's equilibrium guesses.
+
+    Returns:
+        Tuple[float, np.ndarray]: The value of the game to the first
+                                  player and the (6, 11) chance of each
+                                  guess with each dice.
+    """
+    from scipy.optimize import linprog
+
+    n = len(GUESSES)
+    # Variables: x[a, i] then v[b, i], the worst reply's value of i
+    # when the second player holds b.
+    n_x = 6 * n
+    a_ub = np.zeros((6 * n * n, 2 * n_x))
+    for b in range(6):
+        for i in range(n):
+            rows = (b * n + i) * n + np.arange(n)
+            a_ub[rows, n_x + b * n + i] = 1.0
+            for a in range(6):
+                a_ub[rows, a * n + i] = -u[a, b, i] / 36
+    a_eq = np.zeros((6, 2 * n_x))
+    for a in range(6):
+        a_eq[a, a * n:(a + 1) * n] = 1.0
+    cost = np.concatenate([np.zeros(n_x), -np.ones(n_x)])
+    if instrument.ENABLED:
+        instrument.count('scipy_calls')
+    result = linprog(cost, A_ub=a_ub, b_ub=np.zeros(len(a_ub)), A_eq=a_eq,
+                     b_eq=np.ones(6), bounds=[(0, None)] * n_x +
+                     [(None, None)] * n_x, method='highs')
+    if not result.success:
+        raise RuntimeError(result.message)
+    return -result.fun, result.x[:n_x].reshape(6, n)
+
+
+def solve_second(u: np.ndarray) -> Tuple[float, np.ndarray]:
+    """
+    Solves for the second player's equilibrium replies.
+
+    Returns:
+        Tuple[float, np.ndarray]: The value of the game to the first
+                                  player and the (6, 11, 11) chance of
+                                  each reply with each dice to each
+                                  guess.
+    """
+    from scipy.optimize import linprog
+
+    n = len(GUESSES)
+    # Variables: y[b, i, j] then w[a], the best guess's value when the
+    # first player holds a.
+    n_y = 6 * n * n
+    a_ub = np.zeros((6 * n, n_y + 6))
+    for a in range(6):
+        rows = a * n + np.arange(n)
+        a_ub[rows, n_y + a] = -1.0
+        for b in range(6):
+            for i in range(n):
+                start = (b * n + i) * n
+                a_ub[a * n + i, start:start + n] = u[a, b, i] / 36
+    a_eq = np.zeros((6 * n, n_y + 6))
+    for k in range(6 * n):
+        a_eq[k, k * n:(k + 1) * n] = 1.0
+    cost = np.concatenate([np.zeros(n_y), np.ones(6)])
+    if instrument.ENABLED:
+        instrument.count('scipy_calls')
+    result = linprog(cost, A_ub=a_ub, b_ub=np.zeros(len(a_ub)), A_eq=a_eq,
+                     b_eq=np.ones(6 * n), bounds=[(0, None)] * n_y +
+                     [(None, None)] * 6, method='highs')
+    if not result.success:
+        raise RuntimeError(result.message)
+    return result.fun, result.x[:n_y].reshape(6, n, n)
+
+
+def solve(tolerance: float = 1e-10) -> Tuple[float, np.ndarray]:
+    """
+    Solves sudden death, ties re-rolled.
+
+    Returns:
+        Tuple[float, np.ndarray]: The chance the first player wins and
+                                  the SHAPE strategy table.
+    """
+    value = 0.5
+    while True:
+        solved, first = solve_first(payoffs(value))
+        if abs(solved - value) < tolerance:
+            break
+        value = solved
+    _, second = solve_second(payoffs(value))
+    table = np.zeros(SHAPE)
+    table[:, 0] = first
+    table[:, 1:] = second
+    table = np.maximum(table, 0.0)
+    return value, table / table.sum(axis=2, keepdims=True)
+
+
+def _hands(dice: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns every (hands, 7) histogram of dice and the chance of each.
+    """
+    rolls = np.array(list(product(range(1, 7), repeat=dice)))
+    hists = np.zeros((len(rolls), 7), dtype=np.int64)
+    for column in rolls.T:
+        hists[np.arange(len(rolls)), column] += 1
+    hands, counts = np.unique(hists, axis=0, return_counts=True)
+    return hands, counts / len(rolls)
+
+
+def hand_index(hand: Dict[int, int], dice: int) -> int:
+    """
+    Returns the row of hand among the histograms of dice.
+    """
+    key = ('index', dice)
+    if key not in _TABLE:
+        _TABLE[key] = {tuple(h[1:]): i
+                       for i, h in enumerate(_hands(dice)[0].tolist())}
+    return _TABLE[key][tuple(hand.get(d, 0) for d in range(1, 7))]
+
+
+def _last(masks: np.ndarray, n_claims: int) -> np.ndarray:
+    """
+    Returns the highest claim in each bitmask, -1 if there is none.
+    """
+    last = np.full(len(masks), -1, dtype=np.int64)
+    for bit in range(n_claims):
+        last[(masks >> bit) > 0] = bit
+    return last
+
+
+def _tree(n_claims: int) -> Tuple[np.ndarray, np.ndarray, List[Tuple]]:
+    """
+    Lays out the public states of a bid-out round with n_claims claims
+    breadth first, the children of each state next to each other.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, List[Tuple]]: The bitmask at each
+            row, the row of each bitmask, and for each depth k + 1 the
+            slice of its states with the rows of their parents, how
+            many children each parent has and where each starts.
+    """
+    key = ('tree', n_claims)
+    if key in _TABLE:
+        return _TABLE[key]
+    masks = np.arange(1 << n_claims)
+    depth = np.bitwise_count(masks)
+    parent = masks & ~(1 << np.maximum(_last(masks, n_claims), 0))
+    order = [np.array([0])]
+    position = np.zeros(len(masks), dtype=np.int64)
+    levels = []
+    size = 1
+    for k in range(1, n_claims + 1):
+        children = masks[depth == k]
+        rows = position[parent[children]]
+        sort = np.argsort(rows, kind='stable')
+        children, rows = children[sort], rows[sort]
+        position[children] = size + np.arange(len(children))
+        parents, counts = np.unique(rows, return_counts=True)
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        levels.append((slice(size, size + len(children)), parents, counts,
+                       starts))
+        order.append(children)
+        size += len(children)
+    _TABLE[key] = np.concatenate(order), position, levels
+    return _TABLE[key]
+
+
+class BidOut:
+    """
+    A heads-up round that is still bid out, solved by CFR+ over its
+    whole game tree with perfect recall.
+
+    Claims only rise, so the claims made in a round are a set, and a
+    public state is a bitmask of the 6 * (a + b) claims: bit c is the
+    claim of c // 6 + 1 dice c % 6 + 1.  Seat 0 opens and the seat to
+    move is the parity of the number of claims.  A call ends the round,
+    and its payoff is the chance of winning the game from there: a
+    player who loses their last dice is out, and one dice each is
+    sudden death, opened by the loser of the call.
+
+    States are stored in the rows laid out by _tree, so that each level
+    of the tree is a slice; position maps a bitmask to its row.
+
+    Attributes:
+        dice (Tuple[int, int]): Dice held by the opener and responder.
+        wild (bool): Whether 1's are wild.
+        value (float): Chance the opener wins the game, once solved.
+        iterations (int): CFR+ iterations run.
+        position (np.ndarray): Row of each bitmask.
+    """
+
+    def __init__(self, dice: Tuple[int, int] = (MAX_DICE, 1),
+                 wild: bool = False,
+                 sudden_death: Optional[float] = None) -> None:
+        if sorted(dice) != [1, MAX_DICE]:
+            raise ValueError("Only %d dice against 1 is solved, larger "
+                             "game trees do not fit." % MAX_DICE)
+        self.dice = tuple(dice)
+        self.wild = wild
+        self.iterations = 0
+        self.value = None
+        if sudden_death is None:
+            sudden_death = solve()[0]
+        n_claims = 6 * sum(dice)
+        self.n_claims = n_claims
+        self.masks, self.position, self.levels = _tree(n_claims)
+        self.depth = np.bitwise_count(self.masks).astype(np.int64)
+        self.last = _last(self.masks, n_claims)
+        self.legal = (n_claims - 1 - self.last) + (self.masks > 0)
+
+        hands = [_hands(d) for d in dice]
+        self.hands = [h for h, _ in hands]
+        self.probs = [p for _, p in hands]
+        # payoff[c, s] (H0, H1): chance seat 0 wins the game when seat s
+        # calls the claim c.
+        face = np.arange(n_claims) % 6 + 1
+        count = np.arange(n_claims) // 6 + 1
+        h0, h1 = self.hands
+        counted = (h0[:, face].T[:, :, None] + h1[:, face].T[:, None, :])
+        if wild:
+            ones = h0[:, 1][:, None] + h1[:, 1][None, :]
+            counted = counted + (face != 1)[:, None, None] * ones
+        true = counted >= count[:, None, None]
+        after = [self.__after(loser, sudden_death) for loser in (0, 1)]
+        self.payoff = np.stack([np.where(true, after[s], after[1 - s])
+                                for s in (0, 1)], axis=1)
+        rows = np.arange(len(self.masks))
+        self.calls = [(c, s, rows[(self.last == c) & (self.depth % 2 == s)])
+                      for c in range(n_claims) for s in (0, 1)]
+
+        n = len(self.masks)
+        self.regrets = [np.zeros((2, n, len(h))) for h in self.hands]
+        self.sums = [np.zeros((2, n, len(h))) for h in self.hands]
+
+    def __after(self, loser: int, sudden_death: float) -> float:
+        """
+        Returns the chance seat 0 wins the game once loser loses a dice.
+        """
+        left = list(self.dice)
+        left[loser] -= 1
+        if left[loser] == 0:
+            return float(loser == 1)
+        return sudden_death if loser == 0 else 1 - sudden_death
+
+    def strategy(self, seat: int, sums: bool = False) -> np.ndarray:
+        """
+        Returns the (2, states, hands) strategy of seat from its regrets
+        (or its average strategy if sums is set): [0, m] is the chance
+        of the claim that leads to state m, [1, m] of calling at m.
+        States where every weight is zero are played uniformly.
+        """
+        weights = (self.sums if sums else self.regrets)[seat]
+        totals = weights[1].copy()
+        for k, (level, parents, _, starts) in enumerate(self.levels):
+            if k % 2 == seat:
+                totals[parents] += np.add.reduceat(weights[0, level],
+                                                   starts)
+        zero = totals <= 0
+        totals[zero] = 1.0
+        np.reciprocal(totals, out=totals)
+        uniform = 1.0 / np.maximum(self.legal, 1)
+        rows = np.nonzero(zero.any(axis=1))[0]
+        totals[rows] = np.where(zero[rows], 0.0, totals[rows])
+        policy = np.empty_like(weights)
+        np.multiply(weights[1], totals, out=policy[1])
+        policy[1, rows] += zero[rows] * uniform[rows, None]
+        for k, (level, parents, counts, _) in enumerate(self.levels):
+            if k % 2 == seat:
+                np.multiply(weights[0, level],
+                            np.repeat(totals[parents], counts, axis=0),
+                            out=policy[0, level])
+                policy[0, level] += np.repeat(
+                    zero[parents] * uniform[parents, None], counts, axis=0)
+        policy[1, 0] = 0.0
+        return policy
+
+    def __reach(self, seat: int, policy: np.ndarray) -> np.ndarray:
+        reach = np.ones((len(self.masks), len(self.hands[seat])))
+        for k, (level, parents, counts, _) in enumerate(self.levels):
+            reach[level] = np.repeat(reach[parents], counts, axis=0)
+            if k % 2 == seat:
+                reach[level] *= policy[0, level]
+        return reach
+
+    def __values(self, seat: int, policy: np.ndarray, others: np.ndarray,
+                 best: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the counterfactual values of seat at every state and of
+        calling there, the other seat playing others.  With best set,
+        seat plays a best response instead of policy.
+        """
+        other = 1 - seat
+        reach = self.__reach(other, others)
+        calls = np.zeros((len(self.masks), len(self.hands[seat])))
+        for c, s, states in self.calls:
+            u = self.payoff[c, s] if seat == 0 else 1 - self.payoff[c, s].T
+            weights = reach[states]
+            if s == other:
+                # The other seat's chance of calling depends on its hand.
+                weights *= others[1, states]
+            calls[states] = weights @ (self.probs[other][:, None] * u.T)
+        if best:
+            values = calls.copy()
+        else:
+            values = calls * np.where((self.depth % 2 == seat)[:, None],
+                                      policy[1], 1.0)
+        for k in range(len(self.levels) - 1, -1, -1):
+            level, parents, _, starts = self.levels[k]
+            if k % 2 != seat:
+                values[parents] += np.add.reduceat(values[level], starts)
+            elif best:
+                values[parents] = np.maximum(
+                    values[parents], np.maximum.reduceat(values[level],
+                                                         starts))
+            else:
+                values[parents] += np.add.reduceat(
+                    policy[0, level] * values[level], starts)
+        return values, calls
+
+    def iterate(self, iterations: int) -> None:
+        """
+        Runs CFR+ iterations, updating the seats in turn.
+        """
+        policies = [self.strategy(0), self.strategy(1)]
+        for _ in range(iterations):
+            self.iterations += 1
+            for seat in (0, 1):
+                policy = policies[seat]
+                values, calls = self.__values(seat, policy,
+                                              policies[1 - seat])
+                own = self.__reach(seat, policy)
+                regrets = self.regrets[seat]
+                sums = self.sums[seat]
+                weight = self.iterations
+                for k, (level, parents, counts, _) in enumerate(self.levels):
+                    if k % 2 == seat:
+                        regrets[0, level] += values[level] - np.repeat(
+                            values[parents], counts, axis=0)
+                        sums[0, level] += weight * policy[0, level] * (
+                            np.repeat(own[parents], counts, axis=0))
+                moving = (self.depth % 2 == seat) & (self.depth > 0)
+                regrets[1, moving] += calls[moving] - values[moving]
+                sums[1, moving] += weight * own[moving] * policy[1, moving]
+                np.maximum(regrets, 0.0, out=regrets)
+                policies[seat] = self.strategy(seat)
+
+    def exploitability(self) -> Tuple[float, float]:
+        """
+        Returns the chance seat 0 wins with both seats playing the
+        average strategy, and how much a best response against it gains
+        on average over the two seats.
+        """
+        policies = [self.strategy(s, sums=True) for s in (0, 1)]
+        value = (self.probs[0] @
+                 self.__values(0, policies[0], policies[1])[0][0])
+        best = [self.probs[s] @ self.__values(s, policies[s],
+                                              policies[1 - s], True)[0][0]
+                for s in (0, 1)]
+        self.value = float(value)
+        return self.value, float((best[0] - value) + (best[1] - 1 + value)) / 2
+
+    def table(self) -> np.ndarray:
+        """
+        Returns the average strategies as a (2, states, hands) float16
+        table, padded to the most hands: [0, m] is the chance that the
+        seat to move before m makes the claim leading to m, and [1, m]
+        the chance that the seat to move at m calls.
+        """
+        width = max(len(h) for h in self.hands)
+        table = np.zeros((2, len(self.masks), width), dtype=np.float16)
+        for s in (0, 1):
+            policy = self.strategy(s, sums=True)
+            claims = self.depth % 2 != s
+            calls = ~claims
+            table[0, claims, :len(self.hands[s])] = policy[0, claims]
+            table[1, calls, :len(self.hands[s])] = policy[1, calls]
+        return table
+
+
+def solve_bid_out(iterations: int = ITERATIONS,
+                  verbose: bool = False) -> np.ndarray:
+    """
+    Solves MAX_DICE dice against 1 bid out, with and without wilds and
+    with either player opening.
+
+    Returns:
+        np.ndarray: The BID_OUT_SHAPE table, [w, o] being BidOut.table
+                    with wild w and the player with 1 dice opening if o.
+    """
+    value = solve()[0]
+    table = np.zeros(BID_OUT_SHAPE, dtype=np.float16)
+    for w, o in product((0, 1), (0, 1)):
+        dice = (1, MAX_DICE) if o else (MAX_DICE, 1)
+        game = BidOut(dice, bool(w), value)
+        game.iterate(iterations)
+        table[w, o] = game.table()
+        if verbose:
+            won, exploitability = game.exploitability()
+            print("%d against %d%s: the opener wins %.4f, exploitable by "
+                  "%.4f." % (dice + (" wild" if w else "", won,
+                                     exploitability)))
+    return table
+
+
+def bid_out_table() -> Optional[np.ndarray]:
+    """
+    Returns the bid-out table if it has been solved, loading it the
+    first time.  It takes minutes to solve, so unlike the sudden-death
+    table it is never solved on demand.
+    """
+    if 'bid_out' not in _TABLE:
+        shared = attach('bid_out')
+        table = None
+        if shared is not None and shared.shape == BID_OUT_SHAPE:
+            table = shared
+        else:
+            try:
+                table = np.load(BID_OUT_PATH, mmap_mode='r')
+                if table.shape != BID_OUT_SHAPE:
+                    table = None
+            except (OSError, ValueError):
+                pass
+        _TABLE['bid_out'] = table
+    return _TABLE['bid_out']
+
+
+def bid(hand: Dict[int, int], opponent: int, opened: bool,
+        bids: Sequence[Tuple[int, int]],
+        wild: bool) -> Optional[Tuple[int, int]]:
+    """
+    Returns an equilibrium move of a heads-up round of MAX_DICE dice
+    against 1, bids being the (dice, count) bids made so far this round
+    and opened whether this player made the first.  Returns (0, 0) to
+    call, and None if the table is not solved or does not cover the
+    round (a bid of more dice than there are).
+    """
+    mine = sum(hand.values())
+    table = bid_out_table()
+    if table is None or sorted((mine, opponent)) != [1, MAX_DICE]:
+        return None
+    if opened != (len(bids) % 2 == 0):
+        return None
+    n_claims = 6 * (1 + MAX_DICE)
+    mask, last = 0, -1
+    for face, count in bids:
+        claim = (count - 1) * 6 + face - 1
+        if not last < claim < n_claims:
+            return None
+        mask |= 1 << claim
+        last = claim
+    _, position, _ = _tree(n_claims)
+    strategy = table[int(wild), int((mine == 1) == opened)]
+    h = hand_index(hand, mine)
+    claims = list(range(last + 1, n_claims))
+    weights = [float(strategy[0, position[mask | 1 << c], h])
+               for c in claims]
+    if bids:
+        claims.append(None)
+        weights.append(float(strategy[1, position[mask], h]))
+    if sum(weights) <= 0:
+        return None
+    claim = random.choices(claims, weights)[0]
+    if claim is None:
+        return (0, 0)
+    return (claim % 6 + 1, claim // 6 + 1)
+
+
+def load_table(path: str = TABLE_PATH) -> np.ndarray:
+    """
+    Returns the published strategy table if there is one, and otherwise
+    loads the table at path, solving and saving it first if it does not
+    exist yet.  If the table cannot be written the solved array is used
+    in memory instead.
+    """
+    shared = attach('sudden_death')
+    if shared is not None and shared.shape == SHAPE:
+        return shared
+    try:
+        table = np.load(path)
+        if table.shape == SHAPE:
+            return table
+    except (OSError, ValueError):
+        pass
+
+    _, table = solve()
+    try:
+        np.save(path, table)
+    except OSError:
+        pass
+    return table
+
+
+def table() -> np.ndarray:
+    if 'table' not in _TABLE:
+        _TABLE['table'] = load_table()
+    return _TABLE['table']
+
+
+def guess(dice: int, last: Optional[int] = None) -> int:
+    """
+    Returns an equilibrium guess of the sum holding dice, replying to
+    the guess last if there is one.
+    """
+    row = 0 if last is None else int(np.clip(last, 2, 12)) - 1
+    return int(random.choices(GUESSES, table()[dice - 1, row])[0])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Solve the sudden-death ending.")
+    parser.add_argument("--path", default=TABLE_PATH)
+    parser.add_argument("--max-dice", type=int, default=1,
+                        choices=range(1, MAX_DICE + 1),
+                        help="also solve %d dice against 1 bid out, "
+                             "which takes minutes." % MAX_DICE)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS,
+                        help="CFR+ iterations of each bid-out ending.")
+    parser.add_argument("--bid-out-path", default=BID_OUT_PATH)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    value, solved = solve()
+    np.save(args.path, solved)
+    print("Wrote %s in %.1fs." % (args.path, time.perf_counter() - start))
+    print("The first guess wins %.4f of games." % value)
+    for d in range(1, 7):
+        print("Dice %d: %s" % (d, " ".join(
+            "%d:%.2f" % (g, p) for g, p in zip(GUESSES, solved[d - 1, 0])
+            if p > 1e-6)))
+
+    if args.max_dice > 1:
+        start = time.perf_counter()
+        np.save(args.bid_out_path, solve_bid_out(args.iterations, True))
+        print("Wrote %s in %.1fs." % (args.bid_out_path,
+                                      time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
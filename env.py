@@ -0,0 +1,188 @@
+"""env.py
+
+A vectorized, gym-style environment for learning to play 'Liars Dice'.
+
+LiarsDiceEnv runs n_tables games of batchround.BatchLiarsDice in
+lockstep.  The learner sits at seat 0 of every table and the other seats
+are sane Players with their own aggressiveness and craziness, moved in
+one decision.decide_all call per turn over all the tables where it is
+their turn.  reset and step take and return arrays over tables: an
+action is a (dice, count) bid or (0, 0) to call, and an observation is
+the learner's hand, the seat sizes, the last bid and the wild flag.
+
+A step plays the learner's move and then the other seats until it is
+the learner's turn again.  The reward is 1 when the learner wins the
+game, -1 when it is out and 0 otherwise, and a finished table is reset
+straight away, so the observation returned for it is the first of its
+next game.  Every game is played by the bidding rules to the last dice.
+
+Usage:
+    env = LiarsDiceEnv(1024, n_seats=4, seed=0)
+    obs = env.reset()
+    obs, reward, done, info = env.step(actions)
+"""
+
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from batchround import BatchLiarsDice
+import decision
+
+
+class Observation(NamedTuple):
+    """
+    What the learner sees at every table.
+
+    Attributes:
+        hand (np.ndarray[int8]): (tables, 6) dice 1 to 6 held.
+        sizes (np.ndarray[int8]): (tables, seats) dice held by each seat
+                                  in turn order, the learner first.
+        bid (np.ndarray[int16]): (tables, 2) the last (dice, count) bid,
+                                 (0, 0) when the learner opens.
+        wild (np.ndarray[bool]): (tables,) whether 1's are wild.
+    """
+    hand: np.ndarray
+    sizes: np.ndarray
+    bid: np.ndarray
+    wild: np.ndarray
+
+
+class LiarsDiceEnv:
+    """
+    n_tables games against sane Players, stepped together.
+
+    Attributes:
+        game (BatchLiarsDice): The tables.
+        aggressiveness (np.ndarray[float64]): (tables, seats) of each
+                                              opponent, drawn from the
+                                              given range every game.
+        craziness (np.ndarray[float64]): (tables, seats) likewise.
+        rng (np.random.Generator): Dice and opponents.
+    """
+
+    def __init__(self,
+                 n_tables: int,
+                 n_seats: int = 4,
+                 dice: int = 5,
+                 wild: bool = False,
+                 seed: Optional[int] = None,
+                 aggressiveness: Tuple[float, float] = (0.0, 0.4),
+                 craziness: Tuple[float, float] = (0.0, 0.3)) -> None:
+        self.rng = np.random.default_rng(seed)
+        self.game = BatchLiarsDice(n_tables, n_seats, dice, wild, self.rng)
+        self.aggressiveness = np.zeros((n_tables, n_seats))
+        self.craziness = np.zeros((n_tables, n_seats))
+        self.__ranges = (aggressiveness, craziness)
+
+    @property
+    def n_tables(self) -> int:
+        return self.game.n_tables
+
+    @property
+    def n_actions(self) -> int:
+        """
+        Size of action_mask: the call, then every claim.
+        """
+        return 1 + 6 * self.game.n_seats * self.game.dice
+
+    def reset(self, seed: Optional[int] = None) -> Observation:
+        """
+        Starts a new game at every table, reseeding first if seed is
+        given.
+        """
+        if seed is not None:
+            self.rng = self.game.rng = np.random.default_rng(seed)
+        self.__start(np.ones(self.n_tables, dtype=bool))
+        return self.observe()
+
+    def step(self, actions: np.ndarray) -> Tuple[Observation, np.ndarray,
+                                                 np.ndarray, Dict]:
+        """
+        Plays the learner's (tables, 2) actions, then the opponents.
+
+        Returns:
+            Tuple: The observation, the (tables,) float32 reward, the
+                   (tables,) done mask and an info dict whose 'lost'
+                   marks the tables where the learner lost a dice.
+
+        Raises:
+            ValueError: If an action is illegal.
+        """
+        game = self.game
+        actions = np.asarray(actions, dtype=np.int16).reshape(-1, 2)
+        lost = game.step(actions) == 0
+        lost |= self.__play_opponents()
+
+        out = game.sizes[:, 0] == 0
+        won = game.done() & ~out
+        done = out | won
+        reward = won.astype(np.float32) - out
+        if done.any():
+            self.__start(done)
+        return self.observe(), reward, done, {'lost': lost}
+
+    def observe(self) -> Observation:
+        game = self.game
+        return Observation(game.hands[:, 0, 1:].copy(), game.sizes.copy(),
+                           game.bid.copy(), game.wild.copy())
+
+    def legal(self, actions: np.ndarray) -> np.ndarray:
+        """
+        Returns a mask of the tables where actions are legal.
+        """
+        return self.game.can_move(np.asarray(actions, dtype=np.int16))
+
+    def action_mask(self) -> np.ndarray:
+        """
+        Returns the (tables, n_actions) legal actions: index 0 is the
+        call and 1 + (count - 1) * 6 + (dice - 1) the bid of count dice.
+        """
+        game = self.game
+        claims = np.arange(self.n_actions - 1)
+        last = np.where(game.bid[:, 1] > 0,
+                        (game.bid[:, 1] - 1) * 6 + game.bid[:, 0] - 1, -1)
+        mask = np.empty((self.n_tables, self.n_actions), dtype=bool)
+        mask[:, 0] = game.bid[:, 1] > 0
+        mask[:, 1:] = ((claims[None, :] > last[:, None]) &
+                       (claims[None, :] < 6 * game.totals()[:, None]))
+        return mask
+
+    @staticmethod
+    def actions(indices: np.ndarray) -> np.ndarray:
+        """
+        Returns the (tables, 2) actions of action_mask indices.
+        """
+        count, dice = np.divmod(np.asarray(indices, dtype=np.int64) - 1, 6)
+        moves = np.stack([dice + 1, count + 1], axis=1)
+        return np.where(np.asarray(indices)[:, None] == 0, 0, moves)
+
+    def __start(self, tables: np.ndarray) -> None:
+        self.game.reset(tables)
+        n = int(tables.sum())
+        for values, (low, high) in zip((self.aggressiveness,
+                                        self.craziness), self.__ranges):
+            values[tables] = self.rng.uniform(low, high,
+                                              (n, self.game.n_seats))
+
+    def __play_opponents(self) -> np.ndarray:
+        """
+        Moves the other seats until it is the learner's turn or their
+        game is over, returning where the learner lost a dice.
+        """
+        game = self.game
+        lost = np.zeros(self.n_tables, dtype=bool)
+        moves = np.zeros((self.n_tables, 2), dtype=np.int64)
+        while True:
+            moving = (game.turn != 0) & (game.sizes[:, 0] > 0) & ~game.done()
+            if not moving.any():
+                return lost
+            t = np.flatnonzero(moving)
+            seat = game.turn[t]
+            crazy = self.rng.random(len(t)) < self.craziness[t, seat]
+            moves[t] = decision.decide_all(game.hands[t, seat],
+                                           game.totals()[t], game.wild[t],
+                                           game.bid[t],
+                                           self.aggressiveness[t, seat],
+                                           crazy)
+            lost |= game.step(moves, moving) == 0
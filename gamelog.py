@@ -0,0 +1,317 @@
+"""gamelog.py
+
+An append-only binary log of played rounds, for analysing and replaying
+large self-play corpora without building Python objects.
+
+A log is two files of fixed-width records, each starting with an 8 byte
+magic string:
+    path         one ROUND record per round: every seat's hand as a
+                 face histogram, the seat sizes, who opened, called and
+                 lost, and the slice of the bid file holding its bids.
+    path.bids    the bids of every round in order, as uint16 claim codes
+                 (count - 1) * 6 + (dice - 1).
+Seats are numbered in the game's original seating order.  Bids are
+written before the round that points at them, and a record cut short by
+an interruption is dropped when the log is reopened, so a log is always
+readable.  The reader memory-maps both files, and every view it hands
+out is a slice of the map.
+
+Usage:
+    python simulate.py --games 100000 --workers 0 --log games.ldlog
+    python gamelog.py games.ldlog
+"""
+
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b'LDROUND1'
+BIDS_MAGIC = b'LDBIDS01'
+HEADER = len(MAGIC)
+MAX_SEATS = 12
+
+ROUND = np.dtype([
+    ('game', '<u4'),            # game number within the log
+    ('round', '<u2'),           # round number within the game
+    ('seats', 'u1'),            # seats at the start of the game
+    ('first', 'u1'),            # seat that opened the bidding
+    ('caller', 'i1'),           # seat that called, -1 for sudden death
+    ('loser', 'i1'),            # seat that lost a dice, -1 if not known
+    ('wild', '?'),
+    ('sizes', 'u1', (MAX_SEATS,)),
+    ('hands', 'u1', (MAX_SEATS, 6)),
+    ('bid_start', '<u8'),       # first bid in the bid file
+    ('n_bids', '<u2'),
+])
+BID = np.dtype('<u2')
+
+
+def bids_path(path: str) -> str:
+    return path + '.bids'
+
+
+def encode(dice: int, count: int) -> int:
+    return (count - 1) * 6 + (dice - 1)
+
+
+def decode(codes: np.ndarray) -> np.ndarray:
+    """
+    Returns the (n, 2) (dice, count) bids of an array of claim codes.
+    """
+    count, dice = np.divmod(np.asarray(codes, dtype=np.int64), 6)
+    return np.stack([dice + 1, count + 1], axis=-1)
+
+
+def _open(path: str, magic: bytes, itemsize: int):
+    """
+    Opens path for appending, writing magic to a new file and dropping
+    a partly written last record from an old one.
+    """
+    f = open(path, 'ab+')
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        f.write(magic)
+        return f
+    f.seek(0)
+    if f.read(HEADER) != magic:
+        f.close()
+        raise ValueError("%s is not a game log." % path)
+    whole = HEADER + (size - HEADER) // itemsize * itemsize
+    if whole != size:
+        f.truncate(whole)
+    f.seek(0, os.SEEK_END)
+    return f
+
+
+class GameLogWriter:
+    """
+    Appends rounds to a game log.
+
+    Attributes:
+        path (str): The round file.
+        n_rounds (int): Rounds in the log.
+        n_bids (int): Bids in the log.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.__bids = _open(bids_path(path), BIDS_MAGIC, BID.itemsize)
+        self.__rounds = _open(path, MAGIC, ROUND.itemsize)
+        self.n_bids = (self.__bids.tell() - HEADER) // BID.itemsize
+        self.n_rounds = (self.__rounds.tell() - HEADER) // ROUND.itemsize
+        self.next_game = 0
+        if self.n_rounds:
+            last = np.memmap(path, dtype=ROUND, mode='r',
+                             offset=HEADER + (self.n_rounds - 1) *
+                             ROUND.itemsize, shape=(1,))
+            self.next_game = int(last['game'][0]) + 1
+            # Bids of a round that was never written are orphans.
+            end = int(last['bid_start'][0] + last['n_bids'][0])
+            if end != self.n_bids:
+                self.__bids.truncate(HEADER + end * BID.itemsize)
+                self.__bids.seek(0, os.SEEK_END)
+                self.n_bids = end
+        elif self.n_bids:
+            self.__bids.truncate(HEADER)
+            self.__bids.seek(0, os.SEEK_END)
+            self.n_bids = 0
+
+    def write(self, rounds: np.ndarray, bids: np.ndarray) -> None:
+        """
+        Appends rounds whose bid_start index into bids, renumbering
+        their games to follow the games already in the log.
+        """
+        rounds = np.array(rounds, dtype=ROUND)
+        if not len(rounds):
+            return
+        rounds['bid_start'] += self.n_bids
+        games, rounds['game'] = np.unique(rounds['game'],
+                                          return_inverse=True)
+        rounds['game'] += self.next_game
+        self.__bids.write(np.asarray(bids, dtype=BID).tobytes())
+        self.__bids.flush()
+        self.__rounds.write(rounds.tobytes())
+        self.__rounds.flush()
+        self.n_bids += len(bids)
+        self.n_rounds += len(rounds)
+        self.next_game += len(games)
+
+    def close(self) -> None:
+        self.__bids.close()
+        self.__rounds.close()
+
+    def __enter__(self) -> 'GameLogWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Recorder:
+    """
+    Records the games played by simulate.play_game, as its on_move
+    callback, into arrays that can be written to a log.  Given a writer,
+    it writes what it holds at the start of a game once it holds
+    flush_rounds rounds, so memory stays bounded.
+    """
+
+    def __init__(self,
+                 writer: Optional[GameLogWriter] = None,
+                 flush_rounds: int = 1 << 14) -> None:
+        self.writer = writer
+        self.flush_rounds = flush_rounds
+        self.clear()
+
+    def clear(self) -> None:
+        self.__rounds = []
+        self.__bids = []
+        self.__game = -1
+        self.__round = 0
+        self.__seat = {}
+        self.__first = None
+
+    def flush(self) -> None:
+        """
+        Writes the recorded rounds to the writer and forgets them.
+        """
+        self.writer.write(*self.arrays())
+        self.__rounds = []
+        self.__bids = []
+
+    def start_game(self, players: List) -> None:
+        if len(players) > MAX_SEATS:
+            raise ValueError("Logs hold at most %d seats." % MAX_SEATS)
+        if self.writer is not None and \
+                len(self.__rounds) >= self.flush_rounds:
+            self.flush()
+        self.__game += 1
+        self.__round = 0
+        self.__seat = {id(p): i for i, p in enumerate(players)}
+        self.__first = None
+
+    def on_move(self, game, bet: Optional[Tuple[int, int]]) -> None:
+        """
+        Records bet made at game, None being a sudden-death sum guess.
+        """
+        if self.__first is None:
+            self.__first = len(self.__bids)
+        if bet is not None and bet != (0, 0):
+            self.__bids.append(encode(*bet))
+            return
+
+        record = np.zeros((), dtype=ROUND)
+        record['game'] = self.__game
+        record['round'] = self.__round
+        record['seats'] = len(self.__seat)
+        record['wild'] = game.wild
+        curr = game.current_turn
+        for _ in range(game.table_size):
+            seat = self.__seat[id(curr.player)]
+            record['sizes'][seat] = curr.player.size
+            record['hands'][seat] = [curr.player.hand[d]
+                                     for d in range(1, 7)]
+            curr = curr.next
+        n_bids = len(self.__bids) - self.__first
+        opener = game.current_turn
+        for _ in range(n_bids % game.table_size):
+            opener = opener.last
+        record['first'] = self.__seat[id(opener.player)]
+        if bet is None:
+            record['caller'] = record['loser'] = -1
+        else:
+            record['caller'] = self.__seat[id(game.current_turn.player)]
+            loser = game.call_bet(*game.last_bet(), game.current_turn)
+            record['loser'] = self.__seat[id(loser.player)]
+        record['bid_start'] = self.__first
+        record['n_bids'] = n_bids
+        self.__rounds.append(record)
+        self.__round += 1
+        self.__first = None
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the recorded rounds and bids, for GameLogWriter.write.
+        """
+        return (np.array(self.__rounds, dtype=ROUND),
+                np.array(self.__bids, dtype=BID))
+
+
+class GameLog:
+    """
+    A memory-mapped game log.
+
+    Attributes:
+        rounds (np.ndarray[ROUND]): Every round, in the order written.
+        bids (np.ndarray[uint16]): Every bid as a claim code.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.rounds = self.__map(path, MAGIC, ROUND)
+        self.bids = self.__map(bids_path(path), BIDS_MAGIC, BID)
+
+    @staticmethod
+    def __map(path: str, magic: bytes, dtype: np.dtype) -> np.ndarray:
+        with open(path, 'rb') as f:
+            if f.read(HEADER) != magic:
+                raise ValueError("%s is not a game log." % path)
+        n = (os.path.getsize(path) - HEADER) // dtype.itemsize
+        if n == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=HEADER,
+                         shape=(n,))
+
+    def __len__(self) -> int:
+        return len(self.rounds)
+
+    def chunks(self, size: int = 1 << 16) -> Iterator[np.ndarray]:
+        """
+        Yields the rounds in slices of size records.
+        """
+        for start in range(0, len(self.rounds), size):
+            yield self.rounds[start:start + size]
+
+    def round_bids(self, i: int) -> np.ndarray:
+        """
+        Returns the claim codes bid in round i.
+        """
+        start = int(self.rounds['bid_start'][i])
+        return self.bids[start:start + int(self.rounds['n_bids'][i])]
+
+    def replay(self, i: int) -> List[Tuple[int, Tuple[int, int]]]:
+        """
+        Returns the (seat, (dice, count)) bids of round i in order.
+        """
+        record = self.rounds[i]
+        seats = [s for s in range(record['seats']) if record['sizes'][s]]
+        at = seats.index(record['first'])
+        out = []
+        for k, (dice, count) in enumerate(decode(self.round_bids(i))):
+            out.append((seats[(at + k) % len(seats)],
+                        (int(dice), int(count))))
+        return out
+
+    def summary(self) -> Dict:
+        """
+        Counts of rounds, games, bids, calls and called bids that held,
+        computed a chunk at a time.
+        """
+        games = bids = called = held = 0
+        last_game = -1
+        for chunk in self.chunks():
+            games += int(np.count_nonzero(np.diff(chunk['game'].astype(
+                np.int64), prepend=last_game)))
+            last_game = int(chunk['game'][-1])
+            bids += int(chunk['n_bids'].sum())
+            calls = chunk[chunk['caller'] >= 0]
+            called += len(calls)
+            held += int(np.count_nonzero(calls['loser'] == calls['caller']))
+        return {'rounds': len(self), 'games': games, 'bids': bids,
+                'calls': called, 'bids_held': held}
+
+
+if __name__ == "__main__":
+    log = GameLog(sys.argv[1])
+    for key, value in log.summary().items():
+        print("%-12s %d" % (key, value))
@@ -0,0 +1,222 @@
+"""instrument.py
+
+Opt-in latency histograms and event counters for the hot paths of the
+bots and the game engine.
+
+Functions are registered with the timed decorator, which leaves them
+untouched until instrumentation is enabled, so there is no overhead at
+all when it is off.  enable() (or setting LIARS_DICE_PROFILE before
+import) swaps every registered function for a timing wrapper in place,
+and disable() puts the originals back.  Metrics can be exported as JSON
+or Prometheus text, and snapshots from worker processes can be merged.
+"""
+
+import functools
+import json
+import os
+import sys
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional
+
+ENABLED = False
+
+# Upper bounds of the latency buckets, in seconds.
+BOUNDS = [b * 1e-6 for b in (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000,
+                             2500, 5000, 10000, 25000, 100000, 1000000)]
+
+_SITES = []
+_LATENCY = {}
+_COUNTERS = {}
+_STARTED = [time.perf_counter()]
+
+
+class Latency:
+    """
+    A latency histogram for one function.
+
+    Attributes:
+        counts (List[int]): Calls in each bucket of BOUNDS, plus one for
+                            calls slower than the last bound.
+        total (float): Summed seconds of all calls.
+        calls (int): Number of calls.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.total = 0.0
+        self.calls = 0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect_left(BOUNDS, seconds)] += 1
+        self.total += seconds
+        self.calls += 1
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """
+    Registers a function (or method) to be timed under name, its
+    qualified name by default, while instrumentation is enabled.
+    """
+    def register(fn: Callable) -> Callable:
+        _SITES.append((fn, name or fn.__qualname__))
+        if ENABLED:
+            return _wrap(fn, name or fn.__qualname__)
+        return fn
+    return register
+
+
+def count(event: str, n: int = 1) -> None:
+    """
+    Adds n to the counter for event.  Callers on hot paths should check
+    ENABLED first.
+    """
+    _COUNTERS[event] = _COUNTERS.get(event, 0) + n
+
+
+def enable() -> None:
+    """
+    Starts recording, wrapping every registered function in place.
+    """
+    global ENABLED
+    if ENABLED:
+        return
+    ENABLED = True
+    _STARTED[0] = time.perf_counter()
+    for fn, name in _SITES:
+        owner, attr = _owner(fn)
+        if owner is not None and getattr(owner, attr, None) is fn:
+            setattr(owner, attr, _wrap(fn, name))
+
+
+def disable() -> None:
+    """
+    Stops recording and restores the original functions.  Metrics
+    recorded so far are kept.
+    """
+    global ENABLED
+    ENABLED = False
+    for fn, name in _SITES:
+        owner, attr = _owner(fn)
+        if owner is None:
+            continue
+        current = getattr(owner, attr, None)
+        if getattr(current, '__wrapped__', None) is fn:
+            setattr(owner, attr, fn)
+
+
+def reset() -> None:
+    for latency in _LATENCY.values():
+        latency.__init__()
+    _COUNTERS.clear()
+    _STARTED[0] = time.perf_counter()
+
+
+def snapshot() -> Dict:
+    """
+    Returns every metric as plain data that can be pickled or merged.
+    """
+    return {
+        'elapsed': time.perf_counter() - _STARTED[0],
+        'latency': {name: {'counts': list(lat.counts), 'sum': lat.total,
+                           'count': lat.calls}
+                    for name, lat in _LATENCY.items()},
+        'counters': dict(_COUNTERS),
+    }
+
+
+def merge(other: Dict) -> None:
+    """
+    Adds the metrics of a snapshot, e.g. from a worker process.
+    """
+    for name, data in other['latency'].items():
+        lat = _LATENCY.setdefault(name, Latency())
+        lat.counts = [a + b for a, b in zip(lat.counts, data['counts'])]
+        lat.total += data['sum']
+        lat.calls += data['count']
+    for event, n in other['counters'].items():
+        count(event, n)
+
+
+def to_json() -> str:
+    """
+    Returns the metrics as JSON, with calls per second for each timed
+    function since recording started.
+    """
+    data = snapshot()
+    data['bounds'] = BOUNDS
+    for lat in data['latency'].values():
+        lat['per_second'] = lat['count'] / max(data['elapsed'], 1e-9)
+        lat['mean'] = lat['sum'] / max(lat['count'], 1)
+    return json.dumps(data, indent=2, sort_keys=True)
+
+
+def to_prometheus() -> str:
+    """
+    Returns the metrics in the Prometheus text exposition format.
+    """
+    data = snapshot()
+    lines = ['# TYPE liars_dice_latency_seconds histogram']
+    for name, lat in sorted(data['latency'].items()):
+        cumulative = 0
+        for bound, n in zip(BOUNDS + [float('inf')], lat['counts']):
+            cumulative += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('liars_dice_latency_seconds_bucket'
+                         '{fn="%s",le="%s"} %d' % (name, le, cumulative))
+        lines.append('liars_dice_latency_seconds_sum{fn="%s"} %r' %
+                     (name, lat['sum']))
+        lines.append('liars_dice_latency_seconds_count{fn="%s"} %d' %
+                     (name, lat['count']))
+    lines.append('# TYPE liars_dice_calls_per_second gauge')
+    for name, lat in sorted(data['latency'].items()):
+        lines.append('liars_dice_calls_per_second{fn="%s"} %r' %
+                     (name, lat['count'] / max(data['elapsed'], 1e-9)))
+    lines.append('# TYPE liars_dice_events_total counter')
+    for event, n in sorted(data['counters'].items()):
+        lines.append('liars_dice_events_total{event="%s"} %d' % (event, n))
+    return '\n'.join(lines) + '\n'
+
+
+def dump(path: str) -> None:
+    """
+    Writes the metrics to path, as Prometheus text if it ends in .prom
+    and as JSON otherwise.
+    """
+    with open(path, 'w') as f:
+        f.write(to_prometheus() if path.endswith('.prom') else to_json())
+
+
+def _wrap(fn: Callable, name: str) -> Callable:
+    latency = _LATENCY.setdefault(name, Latency())
+
+    @functools.wraps(fn)
+    def timed_fn(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latency.record(time.perf_counter() - start)
+    return timed_fn
+
+
+def _owner(fn: Callable):
+    """
+    Returns the object fn is stored on and the attribute it is stored
+    under, following name mangling of private methods.
+    """
+    owner = sys.modules.get(fn.__module__)
+    parts = fn.__qualname__.split('.')
+    for part in parts[:-1]:
+        if part == '<locals>' or owner is None:
+            return None, None
+        owner = getattr(owner, part, None)
+    attr = parts[-1]
+    if (isinstance(owner, type) and attr.startswith('__') and
+            not attr.endswith('__')):
+        attr = '_%s%s' % (owner.__name__.lstrip('_'), attr)
+    return owner, attr
+
+
+if os.environ.get('LIARS_DICE_PROFILE'):
+    ENABLED = True
@@ -0,0 +1,176 @@
+"""montecarlo.py
+
+An anytime Monte Carlo estimate of the distribution probcalc computes
+exactly: the chance of at least j dice i on the table, given the
+player's hand.  The unseen dice are rolled a batch at a time until a
+deadline, and the estimate is returned with the variance of every
+entry, so a bot with a per-move time budget can trade accuracy for
+latency.
+
+Given a HandPosterior the opponents' hands are rolled seat by seat and
+weighted by the likelihood of the bids each seat has made (self
+normalized importance sampling), so the estimate takes the bid history
+into account without an exact convolution.
+"""
+
+import time
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from dealing import FACES, deal, default_rng
+from instrument import timed
+from posterior import HandPosterior
+
+BATCH = 64                      # rolled before the cost is known
+MAX_BATCH = 1 << 16
+
+
+class Estimate(NamedTuple):
+    """
+    Attributes:
+        mean (np.ndarray[float64]): (7, total + 1) estimated chance of
+                                    at least j dice i, row 0 unused.
+        variance (np.ndarray[float64]): Variance of each entry of mean.
+        samples (int): Tables rolled.
+        ess (float): Effective sample size, samples when unweighted.
+        elapsed_ms (float): Time spent.
+    """
+    mean: np.ndarray
+    variance: np.ndarray
+    samples: int
+    ess: float
+    elapsed_ms: float
+
+    def bid(self, dice: int, count: int) -> float:
+        return float(self.mean[dice, count])
+
+
+@timed()
+def estimate(hand: Union[Dict[int, int], np.ndarray],
+             opponents: List[int],
+             wild: bool,
+             deadline_ms: float,
+             posterior: Optional[HandPosterior] = None,
+             rng: Optional[np.random.Generator] = None,
+             tolerance: float = 0.0,
+             batch: int = BATCH) -> Estimate:
+    """
+    Rolls the opponents' dice in batches until deadline_ms have passed
+    (at least one batch is always rolled) or the largest standard error
+    falls below tolerance.  The clock is read before every batch, and a
+    batch grows only while the measured time per sample fits what is
+    left of the budget.
+
+    Args:
+        hand: The player's dice, a hand dict or a face histogram.
+        opponents: Dice held by each opponent, in the order of the
+                   posterior's seats 1, 2, ...
+        wild: Whether 1's are wild.
+        deadline_ms: Time budget in milliseconds.
+        posterior: Weights the rolls by the bids seen, if given.
+        rng: The dice, this process's Generator by default.
+        tolerance: Stop early once every standard error is below this.
+        batch: Size of the first batch; later batches are at most
+               twice the one before and sized to fit the time left.
+    """
+    start = time.perf_counter()
+    end = start + deadline_ms / 1000
+    rng = rng if rng is not None else default_rng()
+    if isinstance(hand, dict):
+        hand = np.array([0] + [hand.get(d, 0) for d in range(1, 7)])
+    hand = np.asarray(hand, dtype=np.int64)
+    sizes = np.asarray(opponents, dtype=np.int64)
+    total = int(hand.sum() + sizes.sum())
+    width = total + 1
+
+    weighted = np.zeros(7 * width)     # summed weights of each count
+    squared = np.zeros(7 * width)      # summed squared weights
+    shift = None                       # log-weights are kept relative
+    samples = 0
+    rows = np.arange(1, 7) * width
+
+    while True:
+        tick = time.perf_counter()
+        if samples and tick >= end:
+            break
+        if posterior is None:
+            rolled = np.zeros((batch, 7), dtype=np.int64)
+            rolled[:, 1:] = rng.multinomial(sizes.sum(), FACES, size=batch)
+            log_w = None
+        else:
+            seats = deal(rng, np.broadcast_to(sizes, (batch, len(sizes))))
+            rolled = seats.sum(axis=1)
+            log_w = log_weights(posterior, seats, wild)
+
+        table = rolled + hand
+        counts = table[:, 1:].copy()
+        if wild:
+            counts[:, 1:] += table[:, 1:2]
+        index = (counts + rows[None, :]).ravel()
+
+        if log_w is None:
+            w = np.ones(batch)
+        else:
+            top = float(log_w.max())
+            if shift is None or top > shift:
+                if shift is not None:
+                    weighted *= np.exp(shift - top)
+                    squared *= np.exp(2 * (shift - top))
+                shift = top
+            w = np.exp(log_w - shift)
+        weighted += np.bincount(index, weights=np.repeat(w, 6),
+                                minlength=7 * width)
+        squared += np.bincount(index, weights=np.repeat(w * w, 6),
+                               minlength=7 * width)
+        samples += batch
+
+        now = time.perf_counter()
+        if now >= end:
+            break
+        if tolerance:
+            _, variance, _ = _summarize(weighted, squared, width)
+            if np.sqrt(variance.max()) < tolerance:
+                break
+        per_sample = (now - tick) / batch
+        batch = int(min(max((end - now) / max(per_sample, 1e-9), 1),
+                        2 * batch, MAX_BATCH))
+
+    mean, variance, ess = _summarize(weighted, squared, width)
+    return Estimate(mean, variance, samples, ess,
+                    (time.perf_counter() - start) * 1000)
+
+
+def log_weights(posterior: HandPosterior, seats: np.ndarray,
+                wild: bool) -> np.ndarray:
+    """
+    Returns the log-likelihood of the bids seen for each rolled table
+    of (batch, seats, 7) opponent histograms.
+    """
+    counts = seats.copy()
+    if wild:
+        counts[..., 2:] += counts[..., 1:2]
+    n = seats.shape[1]
+    loglik = posterior.loglik[1:n + 1]
+    cap = loglik.shape[2] - 1
+    return loglik[np.arange(n)[None, :, None], np.arange(7)[None, None, :],
+                  np.minimum(counts, cap)].sum(axis=(1, 2))
+
+
+def _summarize(weighted: np.ndarray, squared: np.ndarray, width: int):
+    """
+    Turns summed weights of each count into the chance of at least each
+    count, with the variance of the self normalized estimate.
+    """
+    w = weighted.reshape(7, width)
+    w2 = squared.reshape(7, width)
+    total = w[1].sum()
+    total2 = w2[1].sum()
+    at_least = np.cumsum(w[:, ::-1], axis=1)[:, ::-1]
+    at_least2 = np.cumsum(w2[:, ::-1], axis=1)[:, ::-1]
+    mean = at_least / total
+    mean[0] = 1.0
+    # sum w^2 (x - mean)^2 / (sum w)^2 with x in {0, 1}.
+    variance = (at_least2 * (1 - 2 * mean) + mean ** 2 * total2) / total ** 2
+    variance[0] = 0.0
+    return mean, np.maximum(variance, 0.0), total ** 2 / total2
@@ -0,0 +1,224 @@
+"""names.py
+
+A compact binary table of names and their frequencies, used to name the
+computer players.  The table is compiled once from the baby names CSV
+and memory-mapped at startup, so picking names does not need pandas or
+a CSV parse.
+
+Names are drawn with a Walker alias table built once from the weights,
+so a draw costs two uniforms and two lookups whatever the size of the
+table, and many tables of distinct names can be drawn in one batch.
+
+File layout (little endian):
+    MAGIC (8 bytes), n (uint32),
+    weights (float32[n]), offsets (uint32[n + 1]), utf-8 names.
+Name i is names[offsets[i]:offsets[i + 1]].
+
+Usage:
+    python names.py us-names.csv us-names.bin
+"""
+
+import csv
+import os
+import sys
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+MAGIC = b'LDNAMES1'
+HEADER = len(MAGIC) + 4
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CSV_PATH = os.path.join(ROOT, 'us-names.csv')
+TABLE_PATH = os.path.join(ROOT, 'us-names.bin')
+
+
+def compile_names(csv_path: str = CSV_PATH,
+                  path: str = TABLE_PATH) -> None:
+    """
+    Sums the 'percent' column of every 'name' in csv_path and writes
+    the name table to path.
+    """
+    weights = {}
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            name = row['name']
+            weights[name] = weights.get(name, 0.0) + float(row['percent'])
+    write_names(weights, path)
+
+
+def write_names(weights: Dict[str, float], path: str = TABLE_PATH) -> None:
+    encoded = [n.encode('utf-8') for n in weights]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(n) for n in encoded])
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(encoded)).astype('<u4').tobytes())
+        f.write(np.array(list(weights.values()), dtype='<f4').tobytes())
+        f.write(offsets.tobytes())
+        f.write(b''.join(encoded))
+
+
+class AliasTable:
+    """
+    A Walker alias table over n weighted outcomes, built with Vose's
+    method.  Outcome i is drawn by picking a column j uniformly and
+    keeping j with probability prob[j], or taking alias[j] otherwise.
+
+    Attributes:
+        prob (np.ndarray[float64]): Probability of keeping each column.
+        alias (np.ndarray[int64]): Outcome each column falls back to.
+        support (int): Number of outcomes with a positive weight.
+    """
+
+    def __init__(self, weights: np.ndarray) -> None:
+        weights = np.asarray(weights, dtype=np.float64)
+        n = len(weights)
+        if n == 0 or weights.sum() <= 0:
+            raise ValueError("Alias table needs a positive weight.")
+        self.support = int(np.count_nonzero(weights > 0))
+        scaled = weights * (n / weights.sum())
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        small = list(np.flatnonzero(scaled < 1))
+        large = list(np.flatnonzero(scaled >= 1))
+        while small and large:
+            s, l = small.pop(), large[-1]
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            if scaled[l] < 1:
+                small.append(large.pop())
+        # Columns left over are full up to rounding, prob stays 1.
+
+    def __len__(self) -> int:
+        return len(self.prob)
+
+    def draw(self, rng: np.random.Generator, size=None) -> np.ndarray:
+        """
+        Returns outcomes of the given shape (a scalar by default), drawn
+        in proportion to the weights.
+        """
+        j = rng.integers(len(self.prob), size=size)
+        keep = rng.random(size) < self.prob[j]
+        return np.where(keep, j, self.alias[j])
+
+    def unique(self,
+               rng: np.random.Generator,
+               n_tables: int,
+               seats: int) -> np.ndarray:
+        """
+        Draws seats distinct outcomes for each of n_tables tables.  Only
+        the seats that repeat an earlier seat at their table are drawn
+        again, so each round of redraws shrinks quickly.
+
+        Returns:
+            np.ndarray[int64]: (n_tables, seats) outcomes.
+        """
+        if seats > self.support:
+            raise ValueError("Fewer outcomes than seats.")
+        out = self.draw(rng, (n_tables, seats))
+        while True:
+            order = np.argsort(out, axis=1, kind='stable')
+            ranked = np.take_along_axis(out, order, axis=1)
+            repeat = np.zeros(out.shape, dtype=bool)
+            repeat[:, 1:] = ranked[:, 1:] == ranked[:, :-1]
+            if not repeat.any():
+                return out
+            rows, cols = np.nonzero(repeat)
+            cols = order[rows, cols]
+            out[rows, cols] = self.draw(rng, len(rows))
+
+
+class NameTable:
+    """
+    A memory-mapped name table.
+
+    Attributes:
+        weights (np.ndarray[float32]): Frequency of each name.
+        offsets (np.ndarray[uint32]): Start of each name in the blob.
+    """
+
+    def __init__(self, path: str = TABLE_PATH) -> None:
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError("%s is not a name table." % path)
+        n = int(data[len(MAGIC):HEADER].view('<u4')[0])
+        start = HEADER + 4 * n
+        self.weights = data[HEADER:start].view('<f4')
+        self.offsets = data[start:start + 4 * (n + 1)].view('<u4')
+        self.__names = data[start + 4 * (n + 1):]
+        self.__alias = None
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.__names[start:end]).decode('utf-8')
+
+    @property
+    def alias(self) -> 'AliasTable':
+        if self.__alias is None:
+            self.__alias = AliasTable(self.weights)
+        return self.__alias
+
+    def choice(self, rng: np.random.Generator) -> str:
+        """
+        Returns a name chosen in proportion to its weight.
+        """
+        return self[int(self.alias.draw(rng))]
+
+    def sample(self,
+               rng: np.random.Generator,
+               k: int,
+               exclude: Iterable[str] = ()) -> List[str]:
+        """
+        Returns k distinct names, none of them in exclude.
+
+        Raises:
+            ValueError: If fewer than k names with a positive weight are
+                        left once exclude is taken out.
+        """
+        taken = set(exclude)
+        left = self.alias.support
+        if k > left - len(taken):
+            left -= sum(self[int(i)] in taken
+                        for i in np.flatnonzero(self.weights > 0))
+        if k > left:
+            raise ValueError("Only %d names to draw %d from." % (left, k))
+        out = []
+        while len(out) < k:
+            for i in self.alias.draw(rng, 2 * (k - len(out))):
+                name = self[int(i)]
+                if name not in taken and len(out) < k:
+                    taken.add(name)
+                    out.append(name)
+        return out
+
+    def tables(self,
+               rng: np.random.Generator,
+               n_tables: int,
+               seats: int) -> List[List[str]]:
+        """
+        Returns seats distinct names for each of n_tables tables, drawn
+        in one batch.
+        """
+        return [[self[int(i)] for i in row]
+                for row in self.alias.unique(rng, n_tables, seats)]
+
+
+def load(path: str = TABLE_PATH,
+         csv_path: str = CSV_PATH) -> Optional[NameTable]:
+    """
+    Returns the name table at path, compiling it from csv_path first if
+    only the CSV is available.  Returns None if neither exists.
+    """
+    if not os.path.exists(path):
+        if not os.path.exists(csv_path):
+            return None
+        compile_names(csv_path, path)
+    return NameTable(path)
+
+
+if __name__ == "__main__":
+    compile_names(*sys.argv[1:3])
@@ -0,0 +1,220 @@
+"""opponentstats.py
+
+Statistics of how each opponent bids, kept across games.
+
+Every player has one fixed-size STATS record of counters: the bids they
+made of each face, the bids that raised an earlier bid and how many of
+those kept its face (following the leader), the calls they made, and
+how many of their bids were called and turned out to be bluffs.
+Counters only ever add up, so the stores of parallel simulation workers
+merge by summing records, and every rate is a ratio of two counters,
+answered in O(1) from a row index kept by name.  Rates are smoothed
+towards the rate over everyone in the store, so a player seen a few
+times is not judged on a handful of bids.
+
+A store is saved as a .npy of records, one per player.  Names are kept
+as at most 32 bytes of UTF-8.
+
+Usage:
+    python simulate.py --games 10000 --stats opponents.npy
+    python opponentstats.py opponents.npy
+"""
+
+import os
+import sys
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+STATS = np.dtype([
+    ('name', 'S32'),
+    ('faces', '<u4', (6,)),     # bids of each face
+    ('bids', '<u4'),
+    ('raises', '<u4'),          # bids over an earlier bid
+    ('follows', '<u4'),         # raises keeping the earlier bid's face
+    ('calls', '<u4'),
+    ('called', '<u4'),          # bids of theirs that were called
+    ('bluffs', '<u4'),          # called bids that were false
+])
+COUNTERS = STATS.names[1:]
+# Observations worth of the population rate every player starts with.
+PRIOR = 10.0
+
+
+def key(name: str) -> bytes:
+    return str(name).encode('utf-8')[:STATS['name'].itemsize]
+
+
+class OpponentStats:
+    """
+    A store of STATS records.
+
+    Attributes:
+        records (np.ndarray[STATS]): One record per player seen, in the
+                                     order first seen; only the first
+                                     len(self) are in use.
+        totals (np.ndarray[STATS]): 0-d, the sum of every record, for
+                                    the population rates.
+    """
+
+    def __init__(self, capacity: int = 64) -> None:
+        self.records = np.zeros(capacity, dtype=STATS)
+        self.totals = np.zeros((), dtype=STATS)
+        self.__index = {}
+
+    def __len__(self) -> int:
+        return len(self.__index)
+
+    def __contains__(self, name: str) -> bool:
+        return key(name) in self.__index
+
+    def row(self, name: str) -> int:
+        """
+        Returns the row of name, adding a record if it is new.
+        """
+        return self.__row(key(name))
+
+    def __row(self, k: bytes) -> int:
+        row = self.__index.get(k)
+        if row is None:
+            row = len(self.__index)
+            if row == len(self.records):
+                grown = np.zeros(2 * len(self.records), dtype=STATS)
+                grown[:row] = self.records
+                self.records = grown
+            self.records['name'][row] = k
+            self.__index[k] = row
+        return row
+
+    def get(self, name: str) -> Optional[np.void]:
+        row = self.__index.get(key(name))
+        return None if row is None else self.records[row]
+
+    def record_bid(self, name: str, bid: Tuple[int, int],
+                   last: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Counts a bid made by name after the bid last, if there was one.
+        """
+        row = self.row(name)
+        face = bid[0] - 1
+        for record in (self.records[row], self.totals):
+            record['faces'][face] += 1
+            record['bids'] += 1
+            if last:
+                record['raises'] += 1
+                record['follows'] += last[0] == bid[0]
+
+    def record_call(self, caller: str, bidder: str, bluff: bool) -> None:
+        """
+        Counts caller calling the bid of bidder, which was a bluff if
+        bluff is set.
+        """
+        self.records['calls'][self.row(caller)] += 1
+        row = self.row(bidder)
+        self.records['called'][row] += 1
+        self.records['bluffs'][row] += bluff
+        self.totals['calls'] += 1
+        self.totals['called'] += 1
+        self.totals['bluffs'] += bluff
+
+    def on_move(self, game, bet: Optional[Tuple[int, int]]) -> None:
+        """
+        Counts bet made at game, as a simulate.play_game callback.
+        """
+        if bet is None:
+            return
+        curr = game.current_turn
+        last = game.last_bet()
+        if bet != (0, 0):
+            self.record_bid(curr.player.name, bet, last)
+            return
+        loser = game.call_bet(*last, curr)
+        self.record_call(curr.player.name, curr.last.player.name,
+                         loser is not curr)
+
+    def __population(self, hits: str, trials: str) -> float:
+        return float(self.totals[hits]) / max(float(self.totals[trials]), 1.0)
+
+    def __rate(self, name: str, hits: str, trials: str) -> float:
+        population = self.__population(hits, trials)
+        row = self.__index.get(key(name))
+        if row is None:
+            return population
+        return ((float(self.records[hits][row]) + PRIOR * population) /
+                (float(self.records[trials][row]) + PRIOR))
+
+    def bluff_rate(self, name: str) -> float:
+        """
+        Returns the smoothed share of the bids of name that were called
+        and turned out false.
+        """
+        return self.__rate(name, 'bluffs', 'called')
+
+    def follow_rate(self, name: str) -> float:
+        """
+        Returns the smoothed share of the raises name made that kept the
+        face of the bid before.
+        """
+        return self.__rate(name, 'follows', 'raises')
+
+    def face_rate(self, name: str, face: int) -> float:
+        """
+        Returns the smoothed share of the bids name made of face.
+        """
+        total = max(float(self.totals['bids']), 1.0)
+        population = float(self.totals['faces'][face - 1]) / total
+        row = self.__index.get(key(name))
+        if row is None:
+            return population
+        return ((float(self.records['faces'][row, face - 1]) +
+                 PRIOR * population) /
+                (float(self.records['bids'][row]) + PRIOR))
+
+    def bluff_ratio(self, name: str) -> float:
+        """
+        Returns how many times more often than everyone name bluffs, 1
+        before any called bid has been seen.
+        """
+        if not self.totals['bluffs']:
+            return 1.0
+        return self.bluff_rate(name) / self.__population('bluffs', 'called')
+
+    def merge(self, other: Union['OpponentStats', np.ndarray]) -> None:
+        """
+        Adds the records of another store, or an array of records.
+        """
+        records = (other.records[:len(other)]
+                   if isinstance(other, OpponentStats) else other)
+        rows = np.array([self.__row(bytes(k)) for k in records['name']],
+                        dtype=np.int64)
+        for name in COUNTERS:
+            np.add.at(self.records[name], rows, records[name])
+            self.totals[name] += records[name].sum(axis=0,
+                                                   dtype=np.uint32)
+
+    def save(self, path: str) -> None:
+        """
+        Writes the records in use to path, replacing it whole.
+        """
+        partial = path + '.partial'
+        with open(partial, 'wb') as f:
+            np.save(f, self.records[:len(self)])
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'OpponentStats':
+        stats = cls()
+        stats.merge(np.load(path))
+        return stats
+
+
+if __name__ == "__main__":
+    stats = OpponentStats.load(sys.argv[1])
+    print("%-24s %7s %7s %7s %7s" % ("Player", "bids", "bluff", "follow",
+                                     "calls"))
+    for record in stats.records[:len(stats)]:
+        name = record['name'].decode('utf-8', 'ignore')
+        print("%-24s %7d %7.3f %7.3f %7d" % (name, record['bids'],
+                                             stats.bluff_rate(name),
+                                             stats.follow_rate(name),
+                                             record['calls']))
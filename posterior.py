@@ -0,0 +1,122 @@
+"""posterior.py
+
+Estimates of each players hand from the bids they make.  For every seat
+and face the posterior over how many of that face the seat holds starts
+at its binomial prior and is multiplied by the likelihood of each bid as
+it arrives, so an update costs O(dice) rather than a recompute from the
+bid history.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from binomtable import TAILS
+from convolve import SeatConvolution
+
+# How much more likely a player is to bid a face for each one they hold.
+BID_WEIGHT = 1.0
+
+
+class HandPosterior:
+    """
+    Per seat posteriors over face counts, with seats numbered relative
+    to the player that owns them (seat 0 is the owner and seat i is
+    opponent_hands[i - 1]).
+
+    Attributes:
+        marginals (np.ndarray): (seats, 7, max_dice + 1) array where
+                                marginals[s, i, k] is the probability
+                                seat s holds k of face i (1's included
+                                when wild).
+        loglik (np.ndarray): Same shape, the summed log-likelihood of
+                             the bids seen this round for each count.
+        sizes (np.ndarray): Number of dice held by each seat.
+        wild (bool): Whether 1's are wild.
+        version (int): Incremented on every reset and observed bid.
+    """
+
+    def __init__(self,
+                 n_seats: int,
+                 max_dice: int = 5,
+                 weight: float = BID_WEIGHT) -> None:
+        self.marginals = np.zeros((n_seats, 7, max_dice + 1))
+        self.loglik = np.zeros_like(self.marginals)
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.wild = False
+        self.version = 0
+        self.__likelihood = 1.0 + weight * np.arange(max_dice + 1)
+        self.__log_likelihood = np.log(self.__likelihood)
+        self.__convolution = None
+
+    def reset(self,
+              sizes: List[int],
+              wild: bool = False,
+              hand: Optional[Dict[int, int]] = None) -> None:
+        """
+        Starts a new round with seats holding sizes dice.  If hand is
+        given it is the owners hand, so seat 0 is known exactly.
+        """
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.wild = wild
+        self.version += 1
+        self.__convolution = None
+        self.loglik[:] = 0.0
+
+        n = len(self.sizes)
+        k = np.arange(self.marginals.shape[2])
+        p_index = np.zeros(7, dtype=int)
+        if wild:
+            p_index[2:] = 1
+        p = p_index[None, :, None]
+        size = self.sizes[:, None, None]
+        self.marginals[:n] = (TAILS[p, size, k] - TAILS[p, size, k + 1])
+        self.marginals[:n, 0] = 0.0
+        self.marginals[:n, 0, 0] = 1.0
+
+        if hand is not None:
+            self.marginals[0] = 0.0
+            for face in range(7):
+                known = hand.get(face, 0)
+                if wild and face > 1:
+                    known += hand.get(1, 0)
+                self.marginals[0, face, known] = 1.0
+
+    def observe(self, seat: int, bid: Tuple[int, int]) -> None:
+        """
+        Updates the posterior of seat after it bids bid = (dice, count).
+        """
+        face = bid[0]
+        if face == 0:
+            return
+        row = self.marginals[seat, face]
+        row *= self.__likelihood
+        row /= row.sum()
+        self.loglik[seat, face] += self.__log_likelihood
+        self.version += 1
+        self.__convolution = None
+
+    def face_pmf(self, seat: int, face: int) -> np.ndarray:
+        """
+        Returns P[seat holds k of face] for k in [0, sizes[seat]].
+        """
+        return self.marginals[seat, face, :self.sizes[seat] + 1]
+
+    def convolution(self) -> SeatConvolution:
+        """
+        Returns the exact face count distributions over any subset of
+        seats under the current posterior.
+        """
+        if self.__convolution is None:
+            n = len(self.sizes)
+            self.__convolution = SeatConvolution(
+                list(self.sizes), self.wild, pmfs=self.marginals[:n])
+        return self.__convolution
+
+    def tails(self, face: int,
+              seats: Optional[Iterable[int]] = None) -> np.ndarray:
+        """
+        Returns P[seats hold at least k of face] for k in
+        [0, dice held by seats + 1].
+        """
+        return self.convolution().tails(face, seats)
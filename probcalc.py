@@ -11,8 +11,11 @@ players to make moves.
 #       and Z_i == -1 w.p. (5/6 2/3).
 
 import numpy as np
-from scipy.stats import binom
-from typing import List, Tuple, T, Dict, Union
+from typing import Optional, Tuple, T, Dict
+
+from binomtable import MAX_DICE, TAILS
+import instrument
+from instrument import timed
 
 ROUND_MOVES = 0
 
@@ -31,19 +34,26 @@ class probcalc:
         size (int): Number of dice in play.
         wild (bool): Whether or not 1's are wild.
         hand_size (int): Number of dice in my hand
+        posterior (HandPosterior): Optional estimate of the opponents
+                                   hands, used in place of the binomial
+                                   distribution when given.
     """
 
+    @timed()
     def __init__(self,
                  hand_size: int,
                  my_hand: Dict[int, int],
                  total_dice: int,
-                 isWild: bool) -> None:
+                 isWild: bool,
+                 posterior=None) -> None:
 
         self.__hand = my_hand
         self.hand_size = hand_size
         self.size = total_dice
         self.wild = isWild
+        self.posterior = posterior
         self.dist = self.__calculate_distribution()
+        self.__opponent = {}
 
     def __copy__(self: T) -> T:
         return probcalc(self.size, self.__hand, self.size, self.wild)
@@ -52,10 +62,11 @@ class probcalc:
         return ((self.wild == s2.wild) and (self.__hand == s2.hand) and
                 (self.dist == s2.probs) and (self.size == s2.size))
 
-    def __calculate_distribution(self) -> List[List[float]]:
+    @timed()
+    def __calculate_distribution(self) -> np.matrix:
         """
-        Populates the probability distribution of the round, if it has
-        not been calculated yet.
+        Populates the probability distribution of the round from the
+        precomputed binomial tails.
 
         Letting X_i = a + (#{Z_i = dice} : i in [0, i]) where
             a = self.__hand[dice], we can represent this as a Markov
@@ -67,32 +78,35 @@ class probcalc:
 
          = Choose(size-len(self.__hand), size-a)
 
+        When 1's are wild they count towards every other face, so those
+        faces use p = 1/3 and include the 1's in my hand.
+
         Returns:
             A 7 x (self.total + 1) dimensional np.matrix where A[i][j]
             is the probability that there are at-least j of that dice i
             in the field.
         """
-        if not self.wild:
-            p = 1 / 6
-            probs = [[0] * (self.size + 1)]
+        if self.size > MAX_DICE:
+            raise ValueError("At most %d dice can be in play." % MAX_DICE)
+        if instrument.ENABLED:
+            instrument.count('distribution_builds')
+
+        n = self.size - self.hand_size
+        known, p_index = self.__known_counts()
+        k = np.arange(self.size + 1)[None, :] - known[:, None]
+        if self.posterior is None:
+            probs = TAILS[p_index[:, None], n, np.clip(k, 0, n + 1)]
         else:
-            p = 1 / 3
-            probs = [[0] * (self.size + 1)] * 2
-
-        n = (self.size - self.hand_size)
-
-        x = np.arange(0, n + 1)
-
-        dist = list(1 - binom.cdf(x - 1, n, p))
-
-        for i in range(1, 7):
-            cdf = [1.0] * self.__hand[i]
-            cdf += dist
-            cdf += [0.0] * (self.__hand[i] + n)
-            probs.append(cdf)
+            # Seat 0 of the posterior is my own hand.
+            opponents = range(1, len(self.posterior.sizes))
+            probs = np.stack([self.posterior.tails(i, opponents)
+                              for i in range(7)])
+            probs = probs[np.arange(7)[:, None], np.clip(k, 0, n + 1)]
+        probs[0] = 0.0
 
         return np.matrix(probs)
 
+    @timed()
     def opponent_probability(self,
                              opponent_size: int,
                              play: Tuple[int, int]) -> float:
@@ -101,31 +115,100 @@ class probcalc:
         likelyhood that your opponent is not lying, or will not catch
         you lying.
         """
-        unknown = play[2] - self.__hand[play[1]]
-        if unknown <= 0:    # must be at least the claimed number in play.
-            return 1.0
-        elif self.dist[play] == 0.0:
-            return 0.0
-        if self.wild:
-            p = 1 / 3
-        else:
-            p = 1 / 6
+        return float(self.opponent_matrix(opponent_size)[play])
 
+    @timed()
+    def opponent_matrix(self, opponent_size: int) -> np.ndarray:
         """
-        Calculate probability that the player has n dice in their hand and
-        that they are right.
-        """
-        dice_remain = self.size - self.hand_size - opponent_size
+        Scores every play against an opponent with opponent_size dice in
+        a single pass, so that a bot can choose its bid with one argmax.
 
-        """
         Probability that at least the wagered number of dice remain given
         they have k dice, and the number in your hand.
 
-        P(S_n >= m | X_(opponent)) = 
-            [P(S_{n - 1} >= m - k) * P(X_1 = k)]  
+        P(S_n >= m | X_(opponent)) =
+            [P(S_{n - 1} >= m - k) * P(X_1 = k)]
             -------------------------------------
                          P(S_n >= m)
+
+        summed over k in [0, opponent_size).  Results are cached per
+        opponent size since the distribution is fixed for the round.
+
+        Returns:
+            A 7 x (self.size + 1) np.ndarray A where A[i][j] is
+            opponent_probability(opponent_size, (i, j)).
+        """
+        if opponent_size in self.__opponent:
+            return self.__opponent[opponent_size]
+        if instrument.ENABLED:
+            instrument.count('opponent_matrix_misses')
+
+        dice_remain = self.size - self.hand_size - opponent_size
+        if dice_remain < 0:
+            raise ValueError("Opponent can have at most %d dice." %
+                             (self.size - self.hand_size))
+
+        known, p_index = self.__known_counts()
+        unknown = np.arange(self.size + 1)[None, :] - known[:, None]
+        k = np.arange(opponent_size)
+
+        # P(X_1 = k) for the opponents hand, one row per face.
+        pmf = (TAILS[p_index[:, None], opponent_size, k] -
+               TAILS[p_index[:, None], opponent_size, k + 1])
+        # P(S_{n - 1} >= m - k) for the dice neither of us hold.
+        rest = TAILS[p_index[:, None, None], dice_remain,
+                     np.clip(unknown[:, :, None] - k, 0, dice_remain + 1)]
+
+        dist = np.asarray(self.dist)
+        joint = (rest * pmf[:, None, :]).sum(axis=2)
+        probs = np.divide(joint, dist, out=np.zeros_like(joint),
+                          where=dist > 0.0)
+        probs[unknown <= 0] = 1.0   # must be at least the claimed number.
+        probs[0] = 0.0
+
+        self.__opponent[opponent_size] = probs
+        return probs
+
+    def best_play(self,
+                  opponent_size: int,
+                  last: Optional[Tuple[int, int]] = None) -> Tuple[int, int]:
+        """
+        Returns the legal play that the opponent is most likely to
+        believe, or (0, 0) if no play can beat last.
+        """
+        probs = self.opponent_matrix(opponent_size)
+        legal = legal_plays(last, self.size)
+        if not legal.any():
+            return (0, 0)
+        face, count = np.unravel_index(
+            np.argmax(np.where(legal, probs, -1.0)), probs.shape)
+        return (int(face), int(count))
+
+    def __known_counts(self) -> Tuple[np.ndarray, np.ndarray]:
         """
-        probs = [((1 - binom.cdf(unknown - k - 1, dice_remain, p)) *
-                  (binom.pmf(k, opponent_size, p))) /
-                 self.dist[play] for k in range(opponent_size)]
+        Returns the number of each face that is already known from my
+        hand, and the index into TAILS of the probability a single
+        unknown dice shows that face.
+        """
+        known = np.array([self.__hand.get(i, 0) for i in range(7)])
+        p_index = np.zeros(7, dtype=int)
+        if self.wild:
+            known[2:] += known[1]
+            p_index[2:] = 1
+        return known, p_index
+
+
+def legal_plays(last: Optional[Tuple[int, int]],
+                total_dice: int) -> np.ndarray:
+    """
+    Returns a 7 x (total_dice + 1) boolean mask of the plays that may
+    follow last.  A higher face may repeat the last count, any other face
+    must raise it.
+    """
+    face = np.arange(7)[:, None]
+    count = np.arange(total_dice + 1)[None, :]
+    legal = (face > 0) & (count > 0)
+    if last:
+        legal &= ((count > last[1]) |
+                  ((count == last[1]) & (face > last[0])))
+    return legal
@@ -0,0 +1,419 @@
+"""search.py
+
+A search agent for 'Liars Dice'.  A round is modelled as a compact,
+hashable SearchState and the moves as GameRound.Operators, one per
+claim plus the call.  The agent runs information set MCTS: each
+iteration deals the unseen dice (a determinization, weighted by a
+HandPosterior if one is given) and walks the tree of information sets,
+each keyed by the Zobrist hash of the seat sizes, the claims made and
+the hand of the player to move.  The nodes live in a transposition
+table of bounded size with least recently used eviction, so the work
+done for one move is reused by the moves after it in the round.
+
+Search is bounded by a deadline in milliseconds and can be run
+root-parallel over a process pool, the visit counts of the roots of
+every worker being summed.  Workers are given the time.monotonic() end
+of the move, so the time spent sending them the state counts against
+it.  Hands are dealt in batches grown while they fit the time left.
+
+Only two raises per face are searched, the lowest legal count and one
+more, which keeps the branching small without losing the moves that
+matter; rollouts use a simple expected-count policy.
+"""
+
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from math import log, sqrt
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from dealing import deal, default_rng
+from GameRound import Operator
+from instrument import timed
+from montecarlo import log_weights
+from Player import Player
+from posterior import HandPosterior
+
+MAX_SEATS = 12
+MAX_HAND = 5
+MAX_TOTAL = MAX_SEATS * MAX_HAND
+N_CLAIMS = 6 * MAX_TOTAL
+CALL = N_CLAIMS                 # action index of the call
+EXPLORATION = 0.7
+CAPACITY = 1 << 18              # information sets kept
+DETERMINIZATIONS = 256          # dealt per batch at most
+FIRST_BATCH = 8                 # dealt before the cost is known
+
+_KEYS = np.random.default_rng(0x1D1CE).integers(
+    1, 2 ** 63, size=MAX_SEATS * (MAX_HAND + 1) * 7 + N_CLAIMS +
+    MAX_SEATS * 7 + MAX_SEATS + 1, dtype=np.int64).tolist()
+# Zobrist keys of (seat, face, count) in the hand to move, of each
+# claim, of (seat, size), of the seat to move and of wild 1's.  Claims
+# only ever rise, so the set of claims made fixes their order.
+_HAND = _KEYS[:MAX_SEATS * 7 * (MAX_HAND + 1)]
+_CLAIM = _KEYS[len(_HAND):len(_HAND) + N_CLAIMS]
+_SIZE = _KEYS[len(_HAND) + N_CLAIMS:len(_HAND) + N_CLAIMS + MAX_SEATS * 7]
+_TURN = _KEYS[-MAX_SEATS - 1:-1]
+_WILD = _KEYS[-1]
+
+
+class SearchState(NamedTuple):
+    """
+    A round seen from seat 0, with the other seats in turn order.
+
+    Attributes:
+        hands (Tuple[Tuple[int, ...], ...]): Dice 1 to 6 held by each
+                                             seat.
+        turn (int): Seat to move.
+        history (Tuple[int, ...]): Claims made, in order.
+        wild (bool): Whether 1's are wild.
+        total (int): Dice on the table.
+        key (int): Zobrist hash of the sizes, wild and the claims.
+        loser (int): Seat that lost the call, -1 until there is one.
+    """
+    hands: Tuple[Tuple[int, ...], ...]
+    turn: int
+    history: Tuple[int, ...]
+    wild: bool
+    total: int
+    key: int
+    loser: int = -1
+
+
+def claim(dice: int, count: int) -> int:
+    return (count - 1) * 6 + dice - 1
+
+
+def unclaim(code: int) -> Tuple[int, int]:
+    count, dice = divmod(code, 6)
+    return dice + 1, count + 1
+
+
+def root(hand: Dict[int, int],
+         sizes: List[int],
+         wild: bool,
+         history: Tuple[int, ...] = ()) -> SearchState:
+    """
+    Returns the state of seat 0 holding hand, to move after history,
+    with the dice of the other seats unknown (all 1's until dealt).
+    """
+    key = _WILD if wild else 0
+    for seat, size in enumerate(sizes):
+        key ^= _SIZE[seat * 7 + min(size, 6)]
+    for code in history:
+        key ^= _CLAIM[code]
+    hands = (tuple(hand.get(d, 0) for d in range(1, 7)),)
+    hands += tuple((size, 0, 0, 0, 0, 0) for size in sizes[1:])
+    return SearchState(hands, 0, tuple(history), wild, sum(sizes), key)
+
+
+def info_key(state: SearchState) -> int:
+    """
+    Returns the hash of what the seat to move knows.
+    """
+    key = state.key ^ _TURN[state.turn]
+    base = state.turn * 7 * (MAX_HAND + 1)
+    for face, count in enumerate(state.hands[state.turn]):
+        key ^= _HAND[base + face * (MAX_HAND + 1) + min(count, MAX_HAND)]
+    return key
+
+
+def _bid(code: int) -> Operator:
+    dice, count = unclaim(code)
+
+    def precond(s: SearchState) -> bool:
+        return (s.loser < 0 and count <= s.total and
+                (not s.history or code > s.history[-1]))
+
+    def transf(s: SearchState) -> SearchState:
+        return s._replace(history=s.history + (code,),
+                          turn=(s.turn + 1) % len(s.hands),
+                          key=s.key ^ _CLAIM[code])
+    return Operator('bid %d %d' % (dice, count), precond, transf)
+
+
+def _call(s: SearchState) -> SearchState:
+    dice, count = unclaim(s.history[-1])
+    held = sum(h[dice - 1] for h in s.hands)
+    if s.wild and dice != 1:
+        held += sum(h[0] for h in s.hands)
+    bidder = (s.turn - 1) % len(s.hands)
+    return s._replace(loser=s.turn if held >= count else bidder)
+
+
+OPERATORS = [_bid(code) for code in range(N_CLAIMS)]
+OPERATORS.append(Operator('call',
+                          lambda s: s.loser < 0 and bool(s.history),
+                          _call))
+
+
+def candidates(state: SearchState) -> List[int]:
+    """
+    Returns the actions searched from state: the lowest legal count of
+    every face and one more, and the call.
+    """
+    if state.history:
+        dice, count = unclaim(state.history[-1])
+        actions = [CALL]
+    else:
+        dice, count = 6, 0
+        actions = []
+    for face in range(1, 7):
+        lowest = count + (face <= dice)
+        for c in (lowest, lowest + 1):
+            if c <= state.total:
+                actions.append(claim(face, c))
+    return actions
+
+
+def rollout(state: SearchState, rng: random.Random) -> int:
+    """
+    Plays the round out, each seat calling when the last claim is more
+    than it expects (plus noise) and otherwise raising its best face.
+
+    Returns:
+        int: The seat that loses.
+    """
+    while state.loser < 0:
+        hand = state.hands[state.turn]
+        unseen = state.total - sum(hand)
+        action = None
+        if state.history:
+            dice, count = unclaim(state.history[-1])
+            wild = state.wild and dice != 1
+            mine = hand[dice - 1] + (hand[0] if wild else 0)
+            expect = mine + unseen * (1 / 3 if wild else 1 / 6)
+            if count > expect + rng.random() - 0.5:
+                action = CALL
+        if action is None:
+            held = [hand[f] + (hand[0] if state.wild and f else 0)
+                    for f in range(6)]
+            face = max(range(6), key=lambda f: held[f]) + 1
+            last_dice, last_count = (unclaim(state.history[-1])
+                                     if state.history else (6, 0))
+            count = last_count + (face <= last_dice)
+            action = claim(face, count) if count <= state.total else CALL
+        state = OPERATORS[action].apply(state)
+    return state.loser
+
+
+class TranspositionTable:
+    """
+    Information set statistics by Zobrist key, keeping the capacity most
+    recently used.  A node maps each action to [visits, wins,
+    availability].
+    """
+
+    def __init__(self, capacity: int = CAPACITY) -> None:
+        self.capacity = capacity
+        self.nodes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node(self, key: int) -> Dict[int, List]:
+        node = self.nodes.get(key)
+        if node is not None:
+            self.hits += 1
+            self.nodes.move_to_end(key)
+            return node
+        self.misses += 1
+        node = self.nodes[key] = {}
+        if len(self.nodes) > self.capacity:
+            self.nodes.popitem(last=False)
+        return node
+
+    def clear(self) -> None:
+        self.nodes.clear()
+
+
+class ISMCTS:
+    """
+    Information set Monte Carlo tree search over SearchStates.
+
+    Attributes:
+        table (TranspositionTable): Node statistics, kept across
+                                    searches.
+        exploration (float): UCB exploration constant.
+    """
+
+    def __init__(self,
+                 capacity: int = CAPACITY,
+                 exploration: float = EXPLORATION,
+                 seed: Optional[int] = None) -> None:
+        self.table = TranspositionTable(capacity)
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.np_rng = (np.random.default_rng(seed) if seed is not None
+                       else default_rng())
+
+    def determinize(self, state: SearchState,
+                    posterior: Optional[HandPosterior],
+                    batch: int = DETERMINIZATIONS) -> List[Tuple]:
+        """
+        Deals batch opponent hands for state, resampled by the
+        likelihood of their bids if a posterior is given.
+        """
+        sizes = np.array([sum(h) for h in state.hands[1:]])
+        n = batch * (4 if posterior is not None else 1)
+        hands = deal(self.np_rng, np.broadcast_to(sizes, (n, len(sizes))))
+        if posterior is not None:
+            log_w = log_weights(posterior, hands, state.wild)
+            w = np.exp(log_w - log_w.max())
+            hands = hands[self.np_rng.choice(n, batch, p=w / w.sum())]
+        return [tuple(tuple(h[1:]) for h in seats)
+                for seats in hands.tolist()]
+
+    def iterate(self, state: SearchState) -> None:
+        """
+        Runs one iteration from a determinized state.
+        """
+        path = []
+        while state.loser < 0:
+            actions = candidates(state)
+            node = self.table.node(info_key(state))
+            untried = []
+            for a in actions:
+                stats = node.get(a)
+                if stats is None:
+                    stats = node[a] = [0, 0.0, 0]
+                stats[2] += 1
+                if stats[0] == 0:
+                    untried.append(a)
+            if untried:
+                a = self.rng.choice(untried)
+                path.append((node[a], state.turn))
+                state = OPERATORS[a].apply(state)
+                break
+            a = max(actions, key=lambda a: self.__ucb(node[a]))
+            path.append((node[a], state.turn))
+            state = OPERATORS[a].apply(state)
+
+        loser = state.loser if state.loser >= 0 else rollout(state,
+                                                              self.rng)
+        for stats, seat in path:
+            stats[0] += 1
+            stats[1] += seat != loser
+
+    def __ucb(self, stats: List) -> float:
+        n, wins, available = stats
+        return wins / n + self.exploration * sqrt(log(available) / n)
+
+    @timed()
+    def search(self, state: SearchState, deadline_ms: float,
+               posterior: Optional[HandPosterior] = None,
+               end: Optional[float] = None) -> Dict[int, int]:
+        """
+        Searches from state, whose unseen hands are ignored, until
+        deadline_ms have passed, or until the time.monotonic() end if
+        one is given.  At least one iteration is always run.
+
+        Returns:
+            Dict[int, int]: Visits of each action at the root.
+        """
+        if end is None:
+            end = time.monotonic() + deadline_ms / 1000
+        batch = FIRST_BATCH
+        while True:
+            tick = time.monotonic()
+            for hands in self.determinize(state, posterior, batch):
+                self.iterate(state._replace(hands=state.hands[:1] + hands))
+                now = time.monotonic()
+                if now >= end:
+                    node = self.table.node(info_key(state))
+                    return {a: s[0] for a, s in node.items()
+                            if a in candidates(state)}
+            per_hand = (now - tick) / batch
+            batch = int(min(max((end - now) / max(per_hand, 1e-9), 1),
+                            2 * batch, DETERMINIZATIONS))
+
+
+_WORKER = {}
+
+
+def _search(state: SearchState, end: float,
+            posterior: Optional[HandPosterior], seed: int,
+            capacity: int) -> Dict[int, int]:
+    """
+    Searches in a worker process until the time.monotonic() end of the
+    move, keeping its tree between moves.
+    """
+    if 'search' not in _WORKER:
+        _WORKER['search'] = ISMCTS(capacity, seed=seed)
+    return _WORKER['search'].search(state, 0.0, posterior, end)
+
+
+class SearchPlayer(Player):
+    """
+    A Player that moves by ISMCTS within deadline_ms per move, searching
+    in workers processes when workers > 1.
+    """
+
+    def __init__(self,
+                 size: int,
+                 total_dice: int,
+                 opponents: List[int],
+                 name: str = "Searcher",
+                 deadline_ms: float = 50.0,
+                 workers: int = 1,
+                 capacity: int = CAPACITY,
+                 seed: Optional[int] = None) -> None:
+        super().__init__(size, total_dice, opponents, name)
+        self.deadline_ms = deadline_ms
+        self.workers = workers
+        self.capacity = capacity
+        self.search = ISMCTS(capacity, seed=seed)
+        self.__seed = random.Random(seed)
+        self.__pool = None
+        self.__bids = []
+
+    def set_wild(self, isWild: bool) -> None:
+        super().set_wild(isWild)
+        self.__bids = []
+
+    def observe(self, seat: int, bet: Tuple[int, int]) -> None:
+        super().observe(seat, bet)
+        self.__bids.append(claim(*bet))
+
+    def take_turn(self, last=None) -> Tuple[int, int]:
+        if self.opponent_hands == [1] and self.size == 1:
+            return super().take_turn(last)
+        state = root(self.hand, [self.size] + self.opponent_hands,
+                     self.wild, tuple(self.__bids))
+        if self.workers > 1:
+            visits = self.__parallel(state)
+        else:
+            visits = self.search.search(state, self.deadline_ms,
+                                        self.posterior)
+        action = max(visits, key=visits.get)
+        return (0, 0) if action == CALL else unclaim(action)
+
+    def __parallel(self, state: SearchState) -> Dict[int, int]:
+        end = time.monotonic() + self.deadline_ms / 1000
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(max_workers=self.workers)
+        futures = [self.__pool.submit(_search, state, end,
+                                      self.posterior,
+                                      self.__seed.getrandbits(32),
+                                      self.capacity)
+                   for _ in range(self.workers)]
+        visits = {}
+        for future in futures:
+            for a, n in future.result().items():
+                visits[a] = visits.get(a, 0) + n
+        return visits
+
+    def close(self) -> None:
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state['_SearchPlayer__pool'] = None
+        return state
@@ -0,0 +1,669 @@
+"""server.py
+
+An asyncio server hosting many concurrent tables of 'Liars Dice'.
+Each table is a GameRound.LiarsDice driven by its own task.  Computer
+players decide in an executor, so a slow Player.take_turn never stalls
+the other tables.  A process executor is sent only the state of the
+turn, and keeps each seat's Player resident between its moves.  Human
+players connect over TCP or a Unix socket and speak line-delimited
+JSON.
+
+Requests (one JSON object per line):
+    {"op": "create", "name": str, "bots": int, "humans": int,
+     "dice": int, "seed": int, "deadline_ms": float}
+                                    open a table and take the first seat
+    {"op": "join", "table": int, "name": str}   take a free human seat
+    {"op": "bid", "table": int, "dice": int, "count": int}
+    {"op": "call", "table": int}
+    {"op": "guess", "table": int, "sum": int}   sudden-death guess
+    {"op": "metrics"}                           server and timing metrics
+
+Events sent back:
+    created, joined, round (with your hand), turn, move, reveal, guess,
+    sudden_death, over, metrics and error, each tagged with its table.
+Hands are lists of the number of 1's to 6's, bids are [dice, count]
+and [0, 0] is a call.  A human who disconnects is played by the bot
+policy for the rest of the game.
+
+Usage:
+    python server.py --port 8765
+    python server.py --unix /tmp/liars_dice.sock --workers 4 --processes
+    python server.py --local --tables 200       # server + scripted client
+    python server.py --local --tables 2 --processes --workers 2
+    python server.py --local --metrics timings.prom
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import (Executor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from multiprocessing import get_context
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import instrument
+from dealing import hand_dict, streams
+from GameRound import LiarsDice
+from Player import Player, one_on_one
+from simulate import make_bots, seat_players
+
+
+class Connection:
+    """
+    One client of the server.
+
+    Attributes:
+        writer (asyncio.StreamWriter): The client's stream.
+        closed (bool): Whether the client has gone.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.closed = False
+
+    def send(self, message: Dict) -> None:
+        if not self.closed:
+            self.writer.write(json.dumps(message).encode() + b'\n')
+
+    async def drain(self) -> None:
+        if not self.closed:
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                self.closed = True
+
+
+class Remote(Player):
+    """
+    A seat played by a connected client.  Until the client answers, the
+    table waits on pending; once the client is gone the seat falls back
+    to the Player policy.
+    """
+
+    def __init__(self, size: int, total_dice: int, opponents: List[int],
+                 name: str = None,
+                 conn: Optional[Connection] = None) -> None:
+        super().__init__(size, total_dice, opponents, name)
+        self.conn = conn
+        self.pending = None
+
+    @property
+    def connected(self) -> bool:
+        return self.conn is not None and not self.conn.closed
+
+
+# Most seats a decision process keeps resident, the least recently
+# played being dropped first.
+MAX_RESIDENT = 4096
+_RESIDENT = {}
+
+
+def init_worker(metrics: bool) -> None:
+    """
+    Starts a decision process, timing it if the server is timed.
+    """
+    if metrics:
+        instrument.enable()
+
+
+def take_turn(key: Tuple[int, int],
+              turn: Dict) -> Tuple[Tuple[int, int], Optional[Dict]]:
+    """
+    Plays a turn in a decision process from the state Table.turn_state
+    sends.  The seat key's Player stays resident, so it is only set up
+    again when a new round starts, and the round's bids it has not seen
+    yet are observed before it moves.
+
+    Returns:
+        Tuple[Tuple[int, int], Optional[Dict]]: The move, and the
+            timings it took if the process is timed.
+    """
+    if instrument.ENABLED:
+        instrument.reset()
+    player, seen = _RESIDENT.pop(key, (None, None))
+    if player is None:
+        player = Player(turn['size'], turn['total'], turn['opponents'],
+                        turn['name'], turn['aggressiveness'],
+                        turn['craziness'])
+    if seen is None or seen[0] != turn['round']:
+        player.hand = hand_dict(turn['hand'])
+        player.size = turn['size']
+        player.total = turn['total']
+        player.opponent_hands = turn['opponents']
+        player.opponent_names = turn['names']
+        player.deadline_ms = turn['deadline_ms']
+        player.set_wild(turn['wild'])
+        seen = (turn['round'], 0)
+    for seat, bet in turn['bids'][seen[1]:]:
+        player.observe(seat, tuple(bet))
+    _RESIDENT[key] = (player, (seen[0], len(turn['bids'])))
+    if len(_RESIDENT) > MAX_RESIDENT:
+        del _RESIDENT[next(iter(_RESIDENT))]
+    bet = player.take_turn(turn['last'])
+    return bet, instrument.snapshot() if instrument.ENABLED else None
+
+
+class Table:
+    """
+    A table and the task playing it.
+
+    Attributes:
+        id (int): The table's number.
+        players (List[Player]): The seats in order, Remotes for humans.
+        open_seats (int): Human seats not yet taken.
+        game (LiarsDice): The current round, None until it starts.
+        round (int): Rounds started.
+        bids (List[Tuple[Player, Tuple[int, int]]]): The bidder and bid
+                                                     of every bid this
+                                                     round.
+    """
+
+    def __init__(self, server: 'Server', table_id: int,
+                 players: List[Player], humans: int,
+                 rng: np.random.Generator) -> None:
+        self.server = server
+        self.id = table_id
+        self.players = players
+        self.open_seats = humans
+        self.rng = rng
+        self.game = None
+        self.task = None
+        self.round = 0
+        self.bids = []
+
+    def connections(self) -> List[Connection]:
+        conns = []
+        for p in self.players:
+            if isinstance(p, Remote) and p.connected and \
+                    p.conn not in conns:
+                conns.append(p.conn)
+        return conns
+
+    def broadcast(self, message: Dict) -> None:
+        message['table'] = self.id
+        for conn in self.connections():
+            conn.send(message)
+
+    async def drain(self) -> None:
+        for conn in self.connections():
+            await conn.drain()
+
+    def seat(self, conn: Connection, name: str) -> Remote:
+        """
+        Gives the next open human seat to conn, starting the game when
+        the last one is taken.
+        """
+        seat = next(p for p in self.players
+                    if isinstance(p, Remote) and p.conn is None)
+        seat.conn, seat.name = conn, name
+        self.open_seats -= 1
+        if self.open_seats == 0:
+            self.task = asyncio.ensure_future(self.run())
+        return seat
+
+    async def run(self) -> None:
+        try:
+            await self.play()
+        except Exception as e:
+            self.broadcast({'event': 'error', 'message': repr(e)})
+        finally:
+            await self.drain()
+            self.server.finish(self)
+
+    async def play(self) -> None:
+        game = LiarsDice(seat_players(self.players), len(self.players),
+                         rng=self.rng)
+        self.start_round(game)
+        while game.table_size > 1:
+            if game.table_size == 2 and game.hand_sizes() == [1, 1]:
+                first, second = game.current_turn, game.current_turn.next
+                guess = await self.guess(first.player, None)
+                reply = await self.guess(second.player, guess)
+                hands = self.hands(game)
+                game = game.sudden_death(guess, reply)
+                self.broadcast({'event': 'sudden_death', 'hands': hands,
+                                'guesses': {first.player.name: guess,
+                                            second.player.name: reply}})
+                self.start_round(game)
+                continue
+
+            player = game.current_turn.player
+            bet = await self.turn(game, player)
+            self.server.moves += 1
+            self.broadcast({'event': 'move', 'player': player.name,
+                            'bid': list(bet)})
+            if bet == (0, 0):
+                loser = game.call_bet(*game.last_bet(), game.current_turn)
+                self.broadcast({'event': 'reveal', 'hands': self.hands(game),
+                                'bid': list(game.last_bet()),
+                                'loser': loser.player.name})
+            if bet != (0, 0):
+                self.bids.append((player, bet))
+            result = game.move(*bet)
+            if result is not None:
+                game = result
+                self.start_round(game)
+            await self.drain()
+
+        self.broadcast({'event': 'over',
+                        'winner': game.current_turn.player.name})
+
+    def start_round(self, game: LiarsDice) -> None:
+        self.game = game
+        self.round += 1
+        self.bids = []
+        self.broadcast({'event': 'round', 'wild': game.wild,
+                        'sizes': {p.name: p.size for p in self.players},
+                        'first': game.current_turn.player.name})
+        curr = game.current_turn
+        for _ in range(game.table_size):
+            p = curr.player
+            if isinstance(p, Remote) and p.connected:
+                p.conn.send({'event': 'round', 'table': self.id,
+                             'hand': [p.hand[d] for d in range(1, 7)]})
+            curr = curr.next
+
+    def hands(self, game: LiarsDice) -> Dict[str, List[int]]:
+        hands = {}
+        curr = game.current_turn
+        for _ in range(game.table_size):
+            hands[curr.player.name] = [curr.player.hand[d]
+                                       for d in range(1, 7)]
+            curr = curr.next
+        return hands
+
+    async def turn(self, game: LiarsDice, player: Player) -> Tuple[int, int]:
+        """
+        Returns the move of player, from its client while it has one and
+        from the executor otherwise.
+        """
+        last = game.last_bet()
+        if isinstance(player, Remote) and player.connected:
+            try:
+                return await self.ask(player, {'event': 'turn',
+                                               'last': last and list(last)})
+            except ConnectionError:
+                pass
+        bet = await self.server.decide(self, game, player)
+        if not game.can_move(bet):
+            raise ValueError("%s made an illegal move %s after %s." %
+                             (player.name, bet, last))
+        return bet
+
+    def turn_state(self, game: LiarsDice, player: Player) -> Dict:
+        """
+        Returns what take_turn needs to play player's turn: its hand and
+        parameters, the seats, and this round's bids with the seat of
+        each bidder counted from player.
+        """
+        seats = {}
+        curr = game.current_turn
+        for seat in range(game.table_size):
+            seats[id(curr.player)] = seat
+            curr = curr.next
+        return {'round': self.round, 'name': player.name,
+                'hand': [player.hand[d] for d in range(7)],
+                'size': player.size, 'total': player.total,
+                'opponents': game.hand_sizes()[1:],
+                'names': game.names()[1:],
+                'wild': game.wild, 'last': game.last_bet(),
+                'bids': [(seats[id(p)], bet) for p, bet in self.bids],
+                'aggressiveness': player.aggressiveness,
+                'craziness': player.craziness,
+                'deadline_ms': player.deadline_ms}
+
+    async def guess(self, player: Player, last: Optional[int]) -> int:
+        if isinstance(player, Remote) and player.connected:
+            try:
+                return await self.ask(player, {'event': 'guess',
+                                               'last': last})
+            except ConnectionError:
+                pass
+        return one_on_one(last, player.hand)
+
+    async def ask(self, player: Remote, message: Dict):
+        player.pending = asyncio.get_event_loop().create_future()
+        message['table'] = self.id
+        player.conn.send(message)
+        await player.conn.drain()
+        try:
+            return await player.pending
+        finally:
+            player.pending = None
+
+    def answer(self, player: Remote, request: Dict) -> None:
+        """
+        Resolves the pending move or guess of player from a request,
+        raising ValueError if it is not a legal answer.
+        """
+        if player.pending is None or player.pending.done():
+            raise ValueError("It is not your turn.")
+        if request['op'] == 'guess':
+            value = int(request['sum'])
+            if value not in range(2, 13):
+                raise ValueError("Guess a sum from 2 to 12.")
+        else:
+            if request['op'] == 'call':
+                value = (0, 0)
+            else:
+                value = (int(request['dice']), int(request['count']))
+            if not self.game.can_move(value):
+                raise ValueError("Illegal move %s after %s." %
+                                 (list(value), self.game.last_bet()))
+        player.pending.set_result(value)
+
+
+class Server:
+    """
+    Hosts tables for any number of clients.
+
+    Attributes:
+        tables (Dict[int, Table]): Tables being played or waiting for
+                                   players.
+        executor (Executor): Runs the computer players' decisions.
+        finished (int): Tables played to the end.
+        moves (int): Moves made at all tables.
+    """
+
+    def __init__(self, executor: Optional[Executor] = None,
+                 seed: Optional[int] = None) -> None:
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.tables = {}
+        self.connections = 0
+        self.finished = 0
+        self.moves = 0
+        self.__ids = 0
+        self.__seeds = random.Random(seed)
+        self.__started = time.perf_counter()
+
+    async def decide(self, table: Table, game: LiarsDice,
+                     player: Player) -> Tuple[int, int]:
+        """
+        Returns the bot move of player, made in the executor.  Threads
+        share the Player; a process is sent the turn state and returns
+        its timings to merge.
+        """
+        loop = asyncio.get_event_loop()
+        if not isinstance(self.executor, ProcessPoolExecutor):
+            return await loop.run_in_executor(self.executor,
+                                              player.take_turn,
+                                              game.last_bet())
+        key = (table.id, table.players.index(player))
+        bet, metrics = await loop.run_in_executor(
+            self.executor, take_turn, key, table.turn_state(game, player))
+        if metrics:
+            instrument.merge(metrics)
+        return bet
+
+    def create(self, conn: Connection, request: Dict) -> Table:
+        bots = int(request.get('bots', 3))
+        humans = int(request.get('humans', 1))
+        dice = int(request.get('dice', 5))
+        n = bots + humans
+        if not (humans >= 1 and bots >= 0 and 2 <= n <= 12 and
+                1 <= dice <= 5):
+            raise ValueError("Tables seat 2 to 12 players of 1 to 5 dice.")
+        seed = request.get('seed', self.__seeds.getrandbits(64))
+        players = [Remote(dice, dice * n, [dice] * (n - 1), None)
+                   for _ in range(humans)]
+        players += make_bots(n, dice)[humans:]
+        for p in players:
+            # Bots estimate by sampling within the per-move budget.
+            p.deadline_ms = request.get('deadline_ms')
+        self.__ids += 1
+        table = Table(self, self.__ids, players, humans,
+                      streams(seed, 1)[0])
+        self.tables[table.id] = table
+        return table
+
+    def finish(self, table: Table) -> None:
+        self.tables.pop(table.id, None)
+        self.finished += 1
+
+    def metrics(self) -> Dict:
+        elapsed = time.perf_counter() - self.__started
+        return {'event': 'metrics', 'tables': len(self.tables),
+                'finished': self.finished, 'moves': self.moves,
+                'moves_per_second': self.moves / max(elapsed, 1e-9),
+                'connections': self.connections,
+                'timings': instrument.snapshot()}
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        conn = Connection(writer)
+        self.connections += 1
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    self.request(conn, json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    conn.send({'event': 'error', 'message': str(e)})
+                await conn.drain()
+        except ConnectionError:
+            pass
+        finally:
+            conn.closed = True
+            self.connections -= 1
+            for table in list(self.tables.values()):
+                for p in table.players:
+                    if isinstance(p, Remote) and p.conn is conn and \
+                            p.pending is not None and not p.pending.done():
+                        p.pending.set_exception(ConnectionError())
+                if table.task is None and not table.connections():
+                    # Nobody is left waiting for its seats to fill.
+                    del self.tables[table.id]
+            writer.close()
+
+    def request(self, conn: Connection, request: Dict) -> None:
+        op = request.get('op')
+        if op == 'metrics':
+            conn.send(self.metrics())
+        elif op == 'create':
+            table = self.create(conn, request)
+            conn.send({'event': 'created', 'table': table.id})
+            table.seat(conn, request.get('name') or 'Player 1')
+        elif op == 'join':
+            table = self.table(request)
+            if table.open_seats == 0:
+                raise ValueError("Table %d is full." % table.id)
+            name = request.get('name') or 'Player %d' % (
+                sum(isinstance(p, Remote) for p in table.players) -
+                table.open_seats + 1)
+            if any(p.name == name for p in table.players):
+                raise ValueError("%s is already at table %d." %
+                                 (name, table.id))
+            conn.send({'event': 'joined', 'table': table.id})
+            table.seat(conn, name)
+        elif op in ('bid', 'call', 'guess'):
+            table = self.table(request)
+            player = next((p for p in table.players
+                           if isinstance(p, Remote) and p.conn is conn and
+                           p.pending is not None), None)
+            if player is None:
+                raise ValueError("It is not your turn.")
+            table.answer(player, request)
+        else:
+            raise ValueError("Unknown op %r." % op)
+
+    def table(self, request: Dict) -> Table:
+        table = self.tables.get(int(request['table']))
+        if table is None:
+            raise ValueError("No table %s." % request['table'])
+        return table
+
+
+async def serve(server: Server,
+                host: str = '127.0.0.1',
+                port: int = 8765,
+                unix: Optional[str] = None) -> asyncio.AbstractServer:
+    if unix:
+        return await asyncio.start_unix_server(server.handle, unix)
+    return await asyncio.start_server(server.handle, host, port)
+
+
+async def scripted_client(reader: asyncio.StreamReader,
+                          writer: asyncio.StreamWriter,
+                          n_tables: int,
+                          bots: int = 3,
+                          seed: Optional[int] = None) -> Dict:
+    """
+    Plays one human seat at each of n_tables tables over one
+    connection: it bids its most common face one higher than the last
+    bid until the bid is more than a third of the dice, then calls.
+
+    Returns:
+        Dict: Tables won and played, moves made and the server metrics.
+    """
+    rng = random.Random(seed)
+    hands, totals = {}, {}
+    won = over = moves = 0
+
+    def send(message):
+        writer.write(json.dumps(message).encode() + b'\n')
+
+    for _ in range(n_tables):
+        send({'op': 'create', 'name': 'Script', 'bots': bots,
+              'seed': rng.getrandbits(32)})
+    await writer.drain()
+
+    while over < n_tables:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection.")
+        event = json.loads(line)
+        kind, table = event['event'], event.get('table')
+        if kind == 'error':
+            raise RuntimeError(event['message'])
+        if kind == 'round' and 'hand' in event:
+            hands[table] = event['hand']
+        elif kind == 'round':
+            totals[table] = sum(event['sizes'].values())
+        elif kind == 'turn':
+            moves += 1
+            hand, last = hands[table], event['last']
+            face = 1 + max(range(6), key=lambda i: hand[i])
+            if last is None:
+                send({'op': 'bid', 'table': table, 'dice': face,
+                      'count': max(hand[face - 1], 1)})
+            elif last[1] + 1 > totals[table] / 3:
+                send({'op': 'call', 'table': table})
+            else:
+                send({'op': 'bid', 'table': table, 'dice': face,
+                      'count': last[1] + (face <= last[0])})
+        elif kind == 'guess':
+            mine = 6 - hands[table][::-1].index(1)
+            guess = mine + 4
+            if guess == event['last']:
+                guess -= 1
+            send({'op': 'guess', 'table': table, 'sum': guess})
+        elif kind == 'over':
+            over += 1
+            won += event['winner'] == 'Script'
+        await writer.drain()
+
+    send({'op': 'metrics'})
+    await writer.drain()
+    while True:
+        event = json.loads(await reader.readline())
+        if event['event'] == 'metrics':
+            break
+    return {'tables': n_tables, 'won': won, 'moves': moves,
+            'server': event}
+
+
+async def run_local(n_tables: int, bots: int, executor: Executor,
+                    seed: Optional[int] = None) -> Dict:
+    """
+    Serves on a temporary Unix socket and plays n_tables tables against
+    it with the scripted client.
+    """
+    server = Server(executor, seed)
+    path = os.path.join(tempfile.mkdtemp(), 'liars_dice.sock')
+    listener = await serve(server, unix=path)
+    try:
+        reader, writer = await asyncio.open_unix_connection(path)
+        result = await scripted_client(reader, writer, n_tables, bots, seed)
+        writer.close()
+        await writer.wait_closed()
+        while server.connections:
+            await asyncio.sleep(0.01)
+        return result
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        os.remove(path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Host Liars Dice tables over line-delimited JSON.")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None,
+                        help="listen on this Unix socket instead of TCP.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="threads (or processes) for the bots.")
+    parser.add_argument("--processes", action="store_true",
+                        help="decide in processes instead of threads.")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--local", action="store_true",
+                        help="play --tables tables with the scripted "
+                             "client and exit.")
+    parser.add_argument("--tables", type=int, default=100)
+    parser.add_argument("--bots", type=int, default=3)
+    parser.add_argument("--metrics", default=None,
+                        help="time the decisions and write the timings "
+                             "here on exit, Prometheus text if the path "
+                             "ends in .prom and JSON otherwise.")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        instrument.enable()
+    if args.processes:
+        # Workers start lazily, once clients are connected; forked ones
+        # would inherit the client sockets and hide every disconnect.
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=get_context('forkserver'),
+            initializer=init_worker, initargs=(bool(args.metrics),))
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        with executor:
+            run(args, executor)
+    finally:
+        if args.metrics:
+            instrument.dump(args.metrics)
+
+
+def run(args: argparse.Namespace, executor: Executor) -> None:
+    if args.local:
+        start = time.perf_counter()
+        result = asyncio.run(run_local(args.tables, args.bots, executor,
+                                       args.seed))
+        elapsed = time.perf_counter() - start
+        print("Played %d tables in %.2fs, won %d, %d moves/s." %
+              (result['tables'], elapsed, result['won'],
+               result['server']['moves'] / elapsed))
+        return
+
+    async def forever():
+        server = Server(executor, args.seed)
+        listener = await serve(server, args.host, args.port, args.unix)
+        print("Serving on %s." %
+              (args.unix or '%s:%d' % (args.host, args.port)))
+        async with listener:
+            await listener.serve_forever()
+    asyncio.run(forever())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,548 @@
+"""service.py
+
+A long-running decision service for 'Liars Dice' bots embedded in other
+systems.  Callers send the state of a turn as line-delimited JSON on
+stdin or over a Unix socket and get back the move Player.take_turn
+would make, from one warm process instead of a Python start per move.
+
+Requests that arrive together are coalesced into micro-batches: the
+batcher waits at most --max-delay-ms after the first request of a batch
+(or until --max-batch are queued) and decides the whole batch in one
+decision.decide_all call.  A longer delay buys bigger batches, and so
+throughput, at the cost of latency.  The service counts requests and
+batches and keeps a window of recent latencies, from the arrival of a
+request to its answer, for the throughput and p99 it reports.
+
+Requests (one JSON object per line):
+    {"id": any, "hand": [1's, ..., 6's], "sizes": [int, ...],
+     "last": [dice, count] | null, "wild": bool,
+     "aggressiveness": float, "craziness": float}
+                    sizes are the dice of every seat in turn order,
+                    this player's first; aggressiveness and craziness
+                    are drawn as for a Player when left out
+        -> {"id": any, "move": [dice, count]}      [0, 0] is a call
+    The same request heads-up with one dice each ("last" being the
+    other player's guess or null)
+        -> {"id": any, "guess": int}               sudden-death sum
+    {"op": "metrics"}
+        -> {"event": "metrics", "requests": ..., "p99_ms": ...}
+Malformed requests are answered with {"id": any, "error": str}.
+
+Usage:
+    python service.py < turns.jsonl > moves.jsonl
+    python service.py --unix /tmp/liars_dice_decide.sock --max-delay-ms 2
+    python service.py --bench 100000 --clients 64   # service + load
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import (Callable, Dict, List, NamedTuple, Optional,
+                    Tuple, Union)
+
+import numpy as np
+
+import endgame
+from binomtable import MAX_DICE
+import decision
+
+
+class Turn(NamedTuple):
+    """
+    One request to decide, checked.
+
+    Attributes:
+        hand (List[int]): Dice 1 to 6 held, at indices 1 to 6.
+        sizes (List[int]): Dice of every seat in turn order, this
+                           player's first.
+        last (Union[Tuple[int, int], int, None]): The last bid, or the
+                                                  other guess heads-up.
+        wild (bool): Whether 1's are wild.
+        aggressiveness (float): The player's call threshold.
+        craziness (float): The chance the player acts randomly.
+    """
+    hand: List[int]
+    sizes: List[int]
+    last: Union[Tuple[int, int], int, None]
+    wild: bool
+    aggressiveness: float
+    craziness: float
+
+    @property
+    def heads_up(self) -> bool:
+        return self.sizes == [1, 1]
+
+
+def parse(request: Dict) -> Turn:
+    """
+    Returns the Turn of a request.
+
+    Raises:
+        ValueError, KeyError, TypeError: If the request is malformed.
+    """
+    hand = [int(n) for n in request['hand']]
+    sizes = [int(n) for n in request['sizes']]
+    if len(hand) != 6 or min(hand) < 0:
+        raise ValueError("A hand is the number of 1's to 6's held.")
+    if len(sizes) < 2 or min(sizes) < 1 or sizes[0] != sum(hand):
+        raise ValueError("sizes are the dice of every seat, yours first.")
+    if sum(sizes) > MAX_DICE:
+        raise ValueError("At most %d dice can be in play." % MAX_DICE)
+
+    last = request.get('last')
+    if sizes == [1, 1]:
+        if last is not None:
+            last = int(last)
+            if last not in range(2, 13):
+                raise ValueError("A guess is a sum from 2 to 12.")
+    elif last is not None and list(last) != [0, 0]:
+        dice, count = (int(n) for n in last)
+        if not (1 <= dice <= 6 and 1 <= count <= sum(sizes)):
+            raise ValueError("Illegal last bid %s." % (last,))
+        last = (dice, count)
+    else:
+        last = None
+
+    aggressiveness = request.get('aggressiveness')
+    craziness = request.get('craziness')
+    return Turn([0] + hand, sizes, last, bool(request.get('wild', False)),
+                random.uniform(0, 0.4) if aggressiveness is None
+                else float(aggressiveness),
+                random.uniform(0, 0.3) if craziness is None
+                else float(craziness))
+
+
+def special(turn: Turn, crazy: bool) -> Optional[Dict]:
+    """
+    Returns the answer to a turn Player.take_turn settles before its
+    probabilities (the sudden-death guess, the heads-up one dice
+    opening and a crazy opening), or None if it goes to decide_all.
+    """
+    hand = turn.hand
+    if turn.heads_up:
+        mine = next(d for d in range(1, 7) if hand[d])
+        return {'guess': endgame.guess(mine, turn.last)}
+    if turn.last is not None:
+        return None
+    d = 2 + int(np.argmax(hand[2:]))
+    if len(turn.sizes) == 2 and turn.sizes[0] == 1 and hand[d]:
+        return {'move': [d, hand[d]]}
+    if crazy:
+        return {'move': [random.choice(range(1, 7)),
+                         random.choice(range(1, max(turn.sizes[0] // 4,
+                                                    1) + 1))]}
+    return None
+
+
+def decide_turns(turns: List[Turn]) -> List[Dict]:
+    """
+    Returns the answer of a Player to every turn, deciding all those
+    that need the probabilities in one decide_all call.
+    """
+    answers = []
+    batch = []
+    crazy = []
+    for turn in turns:
+        draw = random.uniform(0, 1) < turn.craziness
+        answers.append(special(turn, draw))
+        if answers[-1] is None:
+            batch.append(len(answers) - 1)
+            crazy.append(draw)
+    if not batch:
+        return answers
+
+    picked = [turns[i] for i in batch]
+    moves = decision.decide_all(np.array([t.hand for t in picked]),
+                                np.array([sum(t.sizes) for t in picked]),
+                                np.array([t.wild for t in picked]),
+                                np.array([t.last or (0, 0) for t in picked]),
+                                np.array([t.aggressiveness for t in picked]),
+                                np.array(crazy))
+    for i, move in zip(batch, moves.tolist()):
+        answers[i] = {'move': move}
+    return answers
+
+
+class LatencyWindow:
+    """
+    The most recent latencies, for percentiles.
+
+    Attributes:
+        seconds (np.ndarray[float64]): A ring of the last latencies.
+        count (int): Latencies recorded in all.
+    """
+
+    def __init__(self, size: int = 1 << 16) -> None:
+        self.seconds = np.zeros(size)
+        self.count = 0
+
+    def record(self, seconds: np.ndarray) -> None:
+        seconds = np.asarray(seconds, dtype=np.float64)
+        kept = seconds[-len(self.seconds):]
+        at = (self.count + len(seconds) - len(kept) +
+              np.arange(len(kept))) % len(self.seconds)
+        self.seconds[at] = kept
+        self.count += len(seconds)
+
+    def percentile(self, q: float) -> float:
+        n = min(self.count, len(self.seconds))
+        return float(np.percentile(self.seconds[:n], q)) if n else 0.0
+
+
+class Batcher:
+    """
+    Coalesces turns into micro-batches decided together.
+
+    Attributes:
+        max_delay (float): Seconds a batch waits for more turns after
+                           its first.
+        max_batch (int): Turns decided at once at most.
+        requests (int): Turns answered.
+        batches (int): Batches decided.
+        latency (LatencyWindow): Seconds from submit to answer.
+    """
+
+    def __init__(self, max_delay_ms: float = 1.0,
+                 max_batch: int = 1024) -> None:
+        self.max_delay = max_delay_ms / 1000
+        self.max_batch = max_batch
+        self.requests = 0
+        self.batches = 0
+        self.latency = LatencyWindow()
+        self.__pending = []
+        self.__ready = asyncio.Event()
+        self.__full = asyncio.Event()
+        self.__task = None
+        self.__first = None
+        self.__last = None
+
+    def submit(self, turn: Turn) -> asyncio.Future:
+        """
+        Queues a turn, returning the future of its answer.
+        """
+        if self.__task is None:
+            self.__task = asyncio.ensure_future(self.run())
+        future = asyncio.get_running_loop().create_future()
+        now = time.perf_counter()
+        if self.__first is None:
+            self.__first = now
+        self.__pending.append((turn, future, now))
+        self.__ready.set()
+        if len(self.__pending) >= self.max_batch:
+            self.__full.set()
+        return future
+
+    async def run(self) -> None:
+        while True:
+            await self.__ready.wait()
+            if len(self.__pending) < self.max_batch and self.max_delay > 0:
+                try:
+                    await asyncio.wait_for(self.__full.wait(),
+                                           self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self.__pending[:self.max_batch]
+            del self.__pending[:self.max_batch]
+            if len(self.__pending) < self.max_batch:
+                self.__full.clear()
+            if not self.__pending:
+                self.__ready.clear()
+            self.decide(batch)
+
+    def decide(self, batch: List[Tuple[Turn, asyncio.Future, float]]):
+        try:
+            answers = decide_turns([turn for turn, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), answer in zip(batch, answers):
+            if not future.done():
+                future.set_result(answer)
+        self.__last = time.perf_counter()
+        self.latency.record(self.__last -
+                            np.array([start for _, _, start in batch]))
+        self.requests += len(batch)
+        self.batches += 1
+
+    def metrics(self) -> Dict:
+        """
+        Returns the counts, the throughput from the first request to the
+        last answer and the latency percentiles in milliseconds.
+        """
+        busy = (self.__last - self.__first) if self.__last else 0.0
+        return {'event': 'metrics', 'requests': self.requests,
+                'batches': self.batches,
+                'mean_batch': self.requests / max(self.batches, 1),
+                'requests_per_second': self.requests / max(busy, 1e-9),
+                'p50_ms': 1000 * self.latency.percentile(50),
+                'p99_ms': 1000 * self.latency.percentile(99),
+                'max_delay_ms': 1000 * self.max_delay,
+                'max_batch': self.max_batch}
+
+    async def close(self) -> None:
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+            self.__task = None
+
+
+class Service:
+    """
+    Answers request lines from any number of streams.
+
+    Attributes:
+        batcher (Batcher): Decides the turns.
+        connections (int): Socket clients connected.
+    """
+
+    def __init__(self, batcher: Batcher) -> None:
+        self.batcher = batcher
+        self.connections = 0
+
+    def request(self, line: bytes, send: Callable[[Dict], None],
+                outstanding: set) -> None:
+        """
+        Answers one request line through send, adding the future of a
+        turn to outstanding until it is answered.
+        """
+        request = {}
+        try:
+            request = json.loads(line)
+            if request.get('op') == 'metrics':
+                send(self.batcher.metrics())
+                return
+            turn = parse(request)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            send({'id': request.get('id') if isinstance(request, dict)
+                  else None, 'error': str(e)})
+            return
+
+        rid = request.get('id')
+
+        def answer(future: asyncio.Future) -> None:
+            outstanding.discard(future)
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                send({'id': rid, 'error': repr(future.exception())})
+            else:
+                send(dict(id=rid, **future.result()))
+
+        future = self.batcher.submit(turn)
+        outstanding.add(future)
+        future.add_done_callback(answer)
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        outstanding = set()
+        self.connections += 1
+
+        def send(message: Dict) -> None:
+            if not writer.is_closing():
+                writer.write(json.dumps(message).encode() + b'\n')
+
+        try:
+            async for line in reader:
+                if line.strip():
+                    self.request(line, send, outstanding)
+                await writer.drain()
+            if outstanding:
+                await asyncio.wait(outstanding)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def stdio(self) -> None:
+        """
+        Answers the requests on stdin on stdout until stdin ends.
+        """
+        loop = asyncio.get_running_loop()
+        stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+        outstanding = set()
+
+        def send(message: Dict) -> None:
+            stdout.write(json.dumps(message).encode() + b'\n')
+            stdout.flush()
+
+        tail = b''
+        while True:
+            chunk = await loop.run_in_executor(None, stdin.read1, 1 << 16)
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop() if chunk else b''
+            for line in lines:
+                if line.strip():
+                    self.request(line, send, outstanding)
+            if not chunk:
+                break
+        if outstanding:
+            await asyncio.wait(outstanding)
+
+
+def random_turns(n: int, seed: Optional[int] = None) -> List[Dict]:
+    """
+    Returns n requests from random tables of 2 to 6 seats, half of
+    them answering a random earlier bid (or guess, heads-up).
+    """
+    rng = np.random.default_rng(seed)
+    turns = []
+    for i in range(n):
+        sizes = rng.integers(1, 6, rng.integers(2, 7)).tolist()
+        total = sum(sizes)
+        hand = np.bincount(rng.integers(0, 6, sizes[0]), minlength=6)
+        last = None
+        if sizes == [1, 1]:
+            last = int(rng.integers(2, 13)) if rng.random() < 0.5 else None
+        elif rng.random() < 0.5:
+            last = [int(rng.integers(1, 7)),
+                    int(rng.integers(1, max(total // 3, 1) + 1))]
+        turns.append({'id': i, 'hand': hand.tolist(), 'sizes': sizes,
+                      'last': last, 'wild': bool(rng.random() < 0.5),
+                      'aggressiveness': float(rng.uniform(0, 0.4)),
+                      'craziness': float(rng.uniform(0, 0.3))})
+    return turns
+
+
+async def load_client(path: str, turns: List[Dict],
+                      inflight: int = 1) -> List[float]:
+    """
+    Sends turns over a Unix socket keeping inflight unanswered, as that
+    many tables waiting on a move would.
+
+    Returns:
+        List[float]: Seconds from sending each turn to its answer.
+    """
+    reader, writer = await asyncio.open_unix_connection(path)
+    sent = {}
+    latencies = []
+    turns = iter(turns)
+
+    def send_next() -> None:
+        turn = next(turns, None)
+        if turn is not None:
+            sent[turn['id']] = time.perf_counter()
+            writer.write(json.dumps(turn).encode() + b'\n')
+
+    for _ in range(inflight):
+        send_next()
+    while sent:
+        await writer.drain()
+        answer = json.loads(await reader.readline())
+        if 'error' in answer:
+            raise RuntimeError(answer['error'])
+        latencies.append(time.perf_counter() - sent.pop(answer['id']))
+        send_next()
+    writer.close()
+    await writer.wait_closed()
+    return latencies
+
+
+async def run_bench(n: int, clients: int, inflight: int,
+                    batcher: Batcher, seed: Optional[int] = None) -> Dict:
+    """
+    Serves on a temporary Unix socket and loads it with n random turns
+    from clients connections.
+
+    Returns:
+        Dict: The service metrics, with the throughput and latency
+              percentiles the clients saw.
+    """
+    service = Service(batcher)
+    turns = random_turns(n, seed)
+    path = os.path.join(tempfile.mkdtemp(), 'liars_dice_decide.sock')
+    listener = await asyncio.start_unix_server(service.handle, path)
+    try:
+        start = time.perf_counter()
+        seen = await asyncio.gather(*(
+            load_client(path, turns[c::clients], inflight)
+            for c in range(clients)))
+        elapsed = time.perf_counter() - start
+        latencies = np.concatenate([np.asarray(s) for s in seen])
+        result = batcher.metrics()
+        result.update({
+            'client_requests_per_second': n / elapsed,
+            'client_p50_ms': 1000 * float(np.percentile(latencies, 50)),
+            'client_p99_ms': 1000 * float(np.percentile(latencies, 99))})
+        return result
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        await batcher.close()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+
+def report(metrics: Dict) -> str:
+    return ("%d requests in %d batches (%.1f per batch), %.0f requests/s, "
+            "p50 %.3fms, p99 %.3fms." %
+            (metrics['requests'], metrics['batches'], metrics['mean_batch'],
+             metrics['requests_per_second'], metrics['p50_ms'],
+             metrics['p99_ms']))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Decide Liars Dice turns over line-delimited JSON.")
+    parser.add_argument("--unix", default=None,
+                        help="listen on this Unix socket instead of "
+                             "answering stdin.")
+    parser.add_argument("--max-delay-ms", type=float, default=1.0,
+                        help="longest a batch waits for more requests.")
+    parser.add_argument("--max-batch", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--bench", type=int, default=0,
+                        help="serve this many random turns to local "
+                             "clients and exit.")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--inflight", type=int, default=1,
+                        help="unanswered turns per bench client.")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    async def run():
+        batcher = Batcher(args.max_delay_ms, args.max_batch)
+        if args.bench:
+            result = await run_bench(args.bench, args.clients,
+                                     args.inflight, batcher, args.seed)
+            print(report(result))
+            print("Clients saw %.0f requests/s, p50 %.3fms, p99 %.3fms." %
+                  (result['client_requests_per_second'],
+                   result['client_p50_ms'], result['client_p99_ms']))
+            return
+        service = Service(batcher)
+        try:
+            if args.unix:
+                listener = await asyncio.start_unix_server(service.handle,
+                                                           args.unix)
+                print("Serving on %s." % args.unix, file=sys.stderr)
+                async with listener:
+                    await listener.serve_forever()
+            else:
+                await service.stdio()
+        finally:
+            await batcher.close()
+            if batcher.requests:
+                print(report(batcher.metrics()), file=sys.stderr)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,168 @@
+"""sharedtables.py
+
+Read-only tables shared by the processes of a pool.
+
+The parent publishes each table once into a multiprocessing.shared_memory
+segment and describes the segments in the LIARS_DICE_TABLES environment
+variable, which workers inherit when they are spawned.  A module that
+loads a table (binomtable's tails, tablebase, endgame) first asks attach
+for it and gets a read-only NumPy view of the segment, so a worker
+neither reads nor rebuilds the table and holds no copy of it.  The
+publisher unlinks its segments when it is closed, or when the parent
+exits if it never is; the resource tracker unlinks them if the parent
+is killed.
+
+Usage:
+    with SharedTables() as tables:
+        publish_defaults(tables)
+        with ProcessPoolExecutor(mp_context=tables.context()) as pool:
+            ...
+"""
+
+import json
+import os
+import sys
+import weakref
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional
+
+import numpy as np
+
+ENV = 'LIARS_DICE_TABLES'
+
+_ATTACHED = {}
+
+
+def _unlink(segments: List[SharedMemory]) -> None:
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            pass                # a view is still alive, unmapped at exit
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+    segments.clear()
+
+
+class SharedTables:
+    """
+    Publishes tables into shared memory for spawned workers.
+
+    Attributes:
+        specs (Dict[str, list]): (segment, shape, dtype descr) of each
+                                 table by name.
+    """
+
+    def __init__(self) -> None:
+        self.specs = {}
+        self.__segments = []
+        self.__environ = os.environ.get(ENV)
+        self.__finalizer = weakref.finalize(self, _unlink, self.__segments)
+
+    def publish(self, name: str, array: np.ndarray) -> None:
+        """
+        Copies array into a new segment published as name.
+        """
+        array = np.ascontiguousarray(array)
+        segment = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.__segments.append(segment)
+        np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+        self.specs[name] = [segment.name, list(array.shape),
+                            np.lib.format.dtype_to_descr(array.dtype)]
+        os.environ[ENV] = json.dumps(self.specs)
+
+    def context(self):
+        """
+        Returns the multiprocessing context for pools that attach:
+        spawned workers start from the environment and import afresh,
+        where forked ones would inherit (and copy on write) the
+        parent's tables instead.
+        """
+        return get_context('spawn')
+
+    def close(self) -> None:
+        """
+        Unlinks every segment.  Workers that attached keep their views
+        until they exit.
+        """
+        self.__finalizer()
+        self.specs = {}
+        if self.__environ is None:
+            os.environ.pop(ENV, None)
+        else:
+            os.environ[ENV] = self.__environ
+
+    def __enter__(self) -> 'SharedTables':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_segment(name: str) -> SharedMemory:
+    """
+    Attaches to a segment without registering it with this process's
+    resource tracker, which would unlink it when the process exits.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return SharedMemory(name)
+    finally:
+        resource_tracker.register = register
+
+
+def _dtype(descr) -> np.dtype:
+    """
+    Returns the dtype of a descr that went through JSON, which turned
+    the tuples of a structured descr into lists.
+    """
+    if isinstance(descr, str):
+        return np.dtype(descr)
+    return np.dtype([tuple(tuple(x) if isinstance(x, list) else x
+                           for x in field) for field in descr])
+
+
+def attach(name: str) -> Optional[np.ndarray]:
+    """
+    Returns a read-only view of the table published as name, or None if
+    no such table is published.
+    """
+    spec = json.loads(os.environ.get(ENV, '{}')).get(name)
+    if spec is None:
+        return None
+    segment, shape, dtype = spec
+    if segment not in _ATTACHED:
+        try:
+            shm = open_segment(segment)
+        except FileNotFoundError:
+            return None
+        view = np.ndarray(tuple(shape), _dtype(dtype), buffer=shm.buf)
+        view.flags.writeable = False
+        _ATTACHED[segment] = (shm, view)
+    return _ATTACHED[segment][1]
+
+
+def publish_defaults(tables: SharedTables) -> None:
+    """
+    Publishes the binomial tails, the sudden-death strategies, and the
+    bid-out strategies and Player tablebase if they have been generated
+    (the tablebase only if it was built with the current margin).
+    """
+    import binomtable
+    import endgame
+    import tablebase
+
+    tables.publish('tails', binomtable.TAILS)
+    tables.publish('sudden_death', endgame.table())
+    if os.path.exists(endgame.BID_OUT_PATH):
+        tables.publish('bid_out', np.load(endgame.BID_OUT_PATH,
+                                          mmap_mode='r'))
+    if os.path.exists(tablebase.TABLE_PATH) and tablebase.current():
+        tables.publish('tablebase', np.load(tablebase.TABLE_PATH,
+                                            mmap_mode='r'))
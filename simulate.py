@@ -0,0 +1,267 @@
+"""simulate.py
+
+Runs complete games of 'Liars Dice' between computer players with no
+user input, so that bots can be tuned over large numbers of games.
+Games are played with GameRound.LiarsDice and Player.take_turn, either
+serially or spread in batches over a process pool.  With --shared the
+pool's workers are spawned and attach to the probability and decision
+tables published once by the parent into shared memory.
+
+Usage:
+    python simulate.py --games 10000 --players 6 --workers 0
+    python simulate.py --games 100000 --workers 64 --shared
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import gamelog
+import instrument
+from dealing import streams
+from GameRound import LiarsDice
+from opponentstats import OpponentStats
+from Player import Player, PlayerNode
+from sharedtables import SharedTables, publish_defaults
+
+
+def seat_players(players: List[Player]) -> PlayerNode:
+    """
+    Links players into a ring of PlayerNodes in seating order and
+    returns the node of the first player.
+    """
+    front = PlayerNode(players[0], players[0].size)
+    curr = front
+    for p in players[1:]:
+        curr.next = PlayerNode(p, p.size, curr)
+        curr = curr.next
+    curr.next = front
+    front.last = curr
+    return front
+
+
+def make_bots(n_players: int,
+              dice: int = 5,
+              names: Optional[List[str]] = None) -> List[Player]:
+    """
+    Creates n_players computer players with dice each, named from names
+    (e.g. a row of NameTable.tables) or "Bot i".  Simulated games keep
+    the seat names by default, since OpponentStats and the game logs
+    key players by name and a fresh name every game would split each
+    seat's records.
+    """
+    total = n_players * dice
+    if names is None:
+        names = ["Bot %d" % i for i in range(n_players)]
+    return [Player(dice, total, [dice] * (n_players - 1), name)
+            for name in names]
+
+
+@instrument.timed()
+def play_game(players: List[Player],
+              on_move: Optional[Callable] = None,
+              rng: Optional[np.random.Generator] = None) -> int:
+    """
+    Plays a game to completion, starting with the first player.
+
+    Args:
+        players: The players in seating order.
+        on_move: Called as on_move(game, bet) before every move, and
+                 as on_move(game, None) before a sudden-death guess.
+        rng: The dice for this table.
+
+    Returns:
+        int: The seat index of the winner.
+    """
+    game = LiarsDice(seat_players(players), len(players), rng=rng)
+    while game.table_size > 1:
+        if game.table_size == 2 and game.hand_sizes() == [1, 1]:
+            if on_move:
+                on_move(game, None)
+            game = game.sudden_death()
+            continue
+
+        bet = game.current_turn.player.take_turn(game.last_bet())
+        if not game.can_move(bet):
+            raise ValueError("%s made an illegal move %s after %s." %
+                             (game.current_turn.player.name, bet,
+                              game.last_bet()))
+        if on_move:
+            on_move(game, bet)
+        result = game.move(*bet)
+        if result is not None:
+            game = result
+
+    winner = game.current_turn.player
+    return next(i for i, p in enumerate(players) if p is winner)
+
+
+def run_games(n_games: int,
+              n_players: int,
+              dice: int = 5,
+              seed: Optional[int] = None,
+              recorder: Optional[gamelog.Recorder] = None,
+              stats: Optional[OpponentStats] = None) -> List[int]:
+    """
+    Plays n_games games between freshly created bots.  Each game rolls
+    its dice from its own stream spawned from seed, and is recorded by
+    recorder and counted in stats if they are given.
+
+    Returns:
+        List[int]: The number of games won from each seat.
+    """
+    if seed is not None:
+        random.seed(seed)
+    wins = [0] * n_players
+    callbacks = [c.on_move for c in (recorder, stats) if c is not None]
+    if len(callbacks) > 1:
+        def on_move(game, bet):
+            for callback in callbacks:
+                callback(game, bet)
+    else:
+        on_move = callbacks[0] if callbacks else None
+    for rng in streams(seed, n_games):
+        players = make_bots(n_players, dice)
+        if recorder is not None:
+            recorder.start_game(players)
+        wins[play_game(players, on_move, rng)] += 1
+    return wins
+
+
+def run_parallel(n_games: int,
+                 n_players: int,
+                 dice: int = 5,
+                 seed: Optional[int] = None,
+                 workers: Optional[int] = None,
+                 batch_size: int = 100,
+                 log: Optional[gamelog.GameLogWriter] = None,
+                 shared: bool = False,
+                 stats: Optional[OpponentStats] = None) -> List[int]:
+    """
+    Splits n_games into batches of batch_size and plays them across a
+    process pool of workers (all cores by default).  Each batch gets its
+    own seed drawn from seed, so runs are reproducible.  The rounds of
+    each batch are appended to log, in batch order, if one is given.
+    If shared is set the tables are published to shared memory for the
+    workers, which are spawned rather than forked.  The bids of every
+    batch are merged into stats if it is given.
+
+    Returns:
+        List[int]: The number of games won from each seat.
+    """
+    seeds = random.Random(seed)
+    batches = [min(batch_size, n_games - start)
+               for start in range(0, n_games, batch_size)]
+    wins = [0] * n_players
+    with SharedTables() as tables:
+        if shared:
+            publish_defaults(tables)
+        context = tables.context() if shared else None
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 mp_context=context) as pool:
+            futures = [pool.submit(_run_batch, n, n_players, dice,
+                                   seeds.getrandbits(64), instrument.ENABLED,
+                                   log is not None, stats is not None)
+                       for n in batches]
+            for future in futures:
+                batch, metrics, rounds, records = future.result()
+                if rounds is not None:
+                    log.write(*rounds)
+                if records is not None:
+                    stats.merge(records)
+                for seat, w in enumerate(batch):
+                    wins[seat] += w
+                if metrics:
+                    instrument.merge(metrics)
+    return wins
+
+
+def _run_batch(n_games: int,
+               n_players: int,
+               dice: int,
+               seed: int,
+               metrics: bool,
+               record: bool = False,
+               count: bool = False) -> Tuple[List[int], Optional[Dict],
+                                             Optional[Tuple],
+                                             Optional[np.ndarray]]:
+    """
+    Plays a batch in a worker, returning its metrics if instrumented,
+    its recorded rounds if record is set and its opponent statistics
+    records if count is set.
+    """
+    recorder = gamelog.Recorder() if record else None
+    stats = OpponentStats() if count else None
+    if metrics:
+        instrument.enable()
+        instrument.reset()
+    wins = run_games(n_games, n_players, dice, seed, recorder, stats)
+    return (wins, instrument.snapshot() if metrics else None,
+            recorder.arrays() if record else None,
+            stats.records[:len(stats)] if count else None)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Play Liars Dice games between computer players.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--dice", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes to use, 0 plays in this process.")
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--metrics", default=None,
+                        help="write timings here, Prometheus text if the "
+                             "path ends in .prom and JSON otherwise.")
+    parser.add_argument("--log", default=None,
+                        help="append every round to this game log.")
+    parser.add_argument("--stats", default=None,
+                        help="count every player's bids into this "
+                             "opponent statistics file.")
+    parser.add_argument("--shared", action="store_true",
+                        help="publish the tables to shared memory for "
+                             "spawned workers.")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        instrument.enable()
+
+    log = gamelog.GameLogWriter(args.log) if args.log else None
+    stats = None
+    if args.stats:
+        stats = (OpponentStats.load(args.stats)
+                 if os.path.exists(args.stats) else OpponentStats())
+    start = time.perf_counter()
+    if args.workers == 0:
+        recorder = gamelog.Recorder(log) if log else None
+        wins = run_games(args.games, args.players, args.dice, args.seed,
+                         recorder, stats)
+        if log:
+            recorder.flush()
+    else:
+        wins = run_parallel(args.games, args.players, args.dice, args.seed,
+                            args.workers, args.batch, log, args.shared,
+                            stats)
+    elapsed = time.perf_counter() - start
+    if log:
+        log.close()
+    if stats is not None:
+        stats.save(args.stats)
+
+    print("Played %d games in %.2fs (%.1f games/s)." %
+          (args.games, elapsed, args.games / elapsed))
+    for seat, w in enumerate(wins):
+        print("Seat %d won %d games." % (seat, w))
+    if args.metrics:
+        instrument.dump(args.metrics)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,253 @@
+"""tablebase.py
+
+Precomputed decisions for Player.take_turn.  A sane (not crazy) Player's
+move depends only on its hand histogram, the total dice in play, whether
+1's are wild, the last bid and its aggressiveness.  With at most
+MAX_HAND dice in a hand and MAX_TOTAL on the table every such state can
+be enumerated, so the generator here evaluates the policy for all of
+them into a compact binary table which the loader memory-maps.  A
+decision is then one index computation.
+
+Each record holds the raise the player would make (0, 0 when it calls
+regardless of aggressiveness) and call_from, the first aggressiveness
+bucket that calls the last bid instead.  Craziness only decides whether
+a move is random, so it is applied when the table is read rather than
+stored.  The raises depend on decision.MARGIN, which is written beside
+the table; a table built with another margin is not loaded, so it can
+never disagree with live play.
+
+Usage:
+    python tablebase.py --max-total 60
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import product
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import decision
+from binomtable import TAILS
+from decision import wilson_lower
+from sharedtables import attach
+
+MAX_HAND = 5
+MAX_TOTAL = 60
+N_BUCKETS = 16
+MAX_AGGRESSIVENESS = 0.4
+# Representative aggressiveness of each bucket.
+BUCKETS = (np.arange(N_BUCKETS) + 0.5) * MAX_AGGRESSIVENESS / N_BUCKETS
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'player_tablebase.npy')
+
+RECORD = np.dtype([('face', np.uint8), ('count', np.uint8),
+                   ('call_from', np.uint8)])
+
+
+def enumerate_hands(max_hand: int = MAX_HAND) -> np.ndarray:
+    """
+    Returns every face histogram of 1 to max_hand dice as a (hands, 7)
+    array, in the order used to rank them.
+    """
+    hands = [(0,) + h for h in product(range(max_hand + 1), repeat=6)
+             if 0 < sum(h) <= max_hand]
+    return np.array(hands, dtype=np.int64)
+
+
+HANDS = enumerate_hands()
+# Mixed radix code of a hand (faces 1..6 in base MAX_HAND + 1).
+RADIX = (MAX_HAND + 1) ** np.arange(6)
+HAND_RANK = np.full((MAX_HAND + 1) ** 6, -1, dtype=np.int64)
+HAND_RANK[HANDS[:, 1:] @ RADIX] = np.arange(len(HANDS))
+
+
+def block_size(max_total: int) -> int:
+    """
+    Returns the number of records for one (hand, wild) pair, every total
+    t in [1, max_total] having 6 * t + 1 possible last bids.
+    """
+    return total_offset(max_total + 1)
+
+
+def total_offset(total: int) -> int:
+    return 3 * total * (total - 1) + total - 1
+
+
+def last_code(last: Optional[Tuple[int, int]]) -> int:
+    if not last:
+        return 0
+    return (last[1] - 1) * 6 + last[0]
+
+
+def bucket(aggressiveness: float) -> int:
+    b = int(aggressiveness / MAX_AGGRESSIVENESS * N_BUCKETS)
+    return min(max(b, 0), N_BUCKETS - 1)
+
+
+def evaluate(hand: np.ndarray, total: int, wild: bool) -> np.ndarray:
+    """
+    Evaluates the sane Player policy for every last bid with hand at a
+    table of total dice.
+
+    Returns:
+        np.ndarray[RECORD]: 6 * total + 1 records indexed by last_code.
+    """
+    size = int(hand.sum())
+    known = hand.copy()
+    p_index = np.zeros(7, dtype=int)
+    if wild:
+        known[2:] += known[1]
+        p_index[2:] = 1
+    n = total - size
+    k = np.arange(total + 2)[None, :] - known[:, None]
+    # One extra column, so count + 1 never runs off the end.
+    dist = TAILS[p_index[:, None], n, np.clip(k, 0, n + 1)]
+    dist[:, total + 1] = -1.0
+
+    out = np.zeros(6 * total + 1, dtype=RECORD)
+    out['call_from'] = N_BUCKETS
+
+    # Opening bid.
+    d = 2 + int(np.argmax(hand[2:]))
+    ones = int(hand[1])
+    if ones >= hand[d]:
+        out[0] = (1, ones, N_BUCKETS)
+    else:
+        out[0] = (d, ones + hand[d], N_BUCKETS)
+
+    # last bids (f, c) in last_code order.
+    c, f = np.divmod(np.arange(6 * total), 6)
+    c, f = c + 1, f + 1
+    p_last = dist[f, c]
+
+    # The best raise on (f, c) for each face is the lowest legal count.
+    faces = np.arange(1, 7)
+    counts = c[:, None] + (faces[None, :] <= f[:, None])
+    values = dist[faces[None, :], counts]
+    best = np.argmax(values, axis=1)
+    rows = np.arange(len(best))
+    face, count = faces[best], counts[rows, best]
+    p_play = values[rows, best]
+
+    n_s = count - hand[face]
+    if wild:
+        n_s = n_s - np.where(face != 1, hand[1], 0)
+    n_f = total - size - n_s
+    p = 1 / 3 if wild else 1 / 6
+    with np.errstate(invalid='ignore', divide='ignore'):
+        unlikely = (n_s > 0) & ((n_f < 0) | (wilson_lower(n_s, n_f) >= p))
+
+    call = (p_play < 0) | (p_last - p_play > decision.MARGIN) | unlikely
+    out['face'][1:] = np.where(call, 0, face)
+    out['count'][1:] = np.where(call, 0, count)
+    out['call_from'][1:] = np.searchsorted(BUCKETS, p_last, side='right')
+    return out
+
+
+def generate(path: str = TABLE_PATH, max_total: int = MAX_TOTAL) -> None:
+    """
+    Evaluates every state and writes the table to path.  States that
+    cannot occur (no opponents) are left as calls.
+    """
+    block = block_size(max_total)
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=RECORD,
+                                      shape=(len(HANDS), 2, block))
+    for rank, hand in enumerate(HANDS):
+        for wild in (False, True):
+            row = table[rank, int(wild)]
+            for total in range(int(hand.sum()) + 1, max_total + 1):
+                start = total_offset(total)
+                row[start:start + 6 * total + 1] = evaluate(hand, total,
+                                                            wild)
+    table.flush()
+    with open(meta_path(path), 'w') as f:
+        json.dump({'margin': decision.MARGIN}, f)
+
+
+def meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + '.json'
+
+
+def current(path: str = TABLE_PATH) -> bool:
+    """
+    Returns whether the table at path was built with decision.MARGIN.
+    """
+    try:
+        with open(meta_path(path)) as f:
+            return json.load(f).get('margin') == decision.MARGIN
+    except (OSError, ValueError):
+        return False
+
+
+class Tablebase:
+    """
+    A decision table written by generate, memory-mapped from path unless
+    the table itself is given (or, for the default path, published to
+    shared memory).  Raises ValueError if the table at path was built
+    with another margin than decision.MARGIN.
+
+    Attributes:
+        table (np.ndarray[RECORD]): (hands, 2, block) records.
+        max_total (int): Largest total dice covered.
+    """
+
+    def __init__(self,
+                 path: str = TABLE_PATH,
+                 table: Optional[np.ndarray] = None) -> None:
+        if table is None and path == TABLE_PATH:
+            table = attach('tablebase')
+        if table is None and not current(path):
+            raise ValueError("%s was not built with decision.MARGIN %s, "
+                             "run tablebase.py again." %
+                             (path, decision.MARGIN))
+        self.table = (table if table is not None
+                      else np.load(path, mmap_mode='r'))
+        block = self.table.shape[2]
+        self.max_total = next(t for t in range(MAX_TOTAL * 10)
+                              if block_size(t) == block)
+
+    def covers(self, size: int, total: int) -> bool:
+        return 0 < size <= MAX_HAND and size < total <= self.max_total
+
+    def lookup(self,
+               hand: Dict[int, int],
+               total: int,
+               wild: bool,
+               last: Optional[Tuple[int, int]]) -> np.void:
+        code = sum(hand.get(f, 0) * RADIX[f - 1] for f in range(1, 7))
+        return self.table[HAND_RANK[code], int(wild),
+                          total_offset(total) + last_code(last)]
+
+    def decide(self,
+               hand: Dict[int, int],
+               total: int,
+               wild: bool,
+               last: Optional[Tuple[int, int]],
+               aggressiveness: float) -> Tuple[int, int]:
+        """
+        Returns the sane Player's move, (0, 0) being a call.
+        """
+        record = self.lookup(hand, total, wild, last)
+        if last and bucket(aggressiveness) >= record['call_from']:
+            return (0, 0)
+        return (int(record['face']), int(record['count']))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Generate the Player decision tablebase.")
+    parser.add_argument("--max-total", type=int, default=MAX_TOTAL)
+    parser.add_argument("--path", default=TABLE_PATH)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    generate(args.path, args.max_total)
+    print("Wrote %s in %.1fs." % (args.path, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,323 @@
+"""tournament.py
+
+Tournaments between Player parameter settings and other agents, to find
+out which settings win.  Entrants meet in heads-up matches of several
+games, scheduled round-robin or Swiss, and the matches of a round are
+played across a process pool.  Every finished match is appended to a
+JSON-lines results file as soon as it completes, and Elo ratings are
+updated as results come in.
+
+Each match has an id and a seed fixed by the tournament seed, the round
+and the two entrants, so a tournament restarted on the same results
+file skips the matches already in it and plays the rest exactly as the
+first run would have.  The file starts with a header line of the games
+per match, dice and seed, and a tournament with other settings refuses
+to resume on it rather than mix its results in.  Ratings are rebuilt
+from the file in match order at the end of every round, so they do not
+depend on which worker finished first.
+
+Usage:
+    python tournament.py --aggressiveness 0.1 0.2 0.3 --craziness 0 0.1 \\
+        --markov --format swiss --rounds 6 --games 40
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations, product
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import LiarsDiceAgent
+from dealing import streams
+from Player import Player
+from simulate import play_game
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'tournament.jsonl')
+INITIAL_RATING = 1500.0
+K_FACTOR = 16.0
+
+
+def grid(aggressiveness: Iterable[float],
+         craziness: Iterable[float]) -> List[Dict]:
+    """
+    Returns a Player entrant for every pair of settings.
+    """
+    return [{'name': 'Player a=%.2f c=%.2f' % (a, c), 'agent': 'player',
+             'aggressiveness': a, 'craziness': c}
+            for a, c in product(aggressiveness, craziness)]
+
+
+def make_player(entrant: Dict, size: int, total: int,
+                opponents: List[int]) -> Player:
+    """
+    Creates the player described by an entrant.  'markov' entrants are
+    LiarsDiceAgent.MarkovMaster with the trained configurations on disk.
+    """
+    args = (size, total, opponents, entrant['name'],
+            entrant.get('aggressiveness'), entrant.get('craziness'))
+    if entrant['agent'] == 'markov':
+        if not LiarsDiceAgent.SOLVERS:
+            LiarsDiceAgent.initialize()
+        return LiarsDiceAgent.MarkovMaster(*args[:4], None, *args[4:])
+    if entrant['agent'] == 'player':
+        return Player(*args)
+    raise ValueError("Unknown agent %r." % entrant['agent'])
+
+
+def play_match(a: Dict, b: Dict, games: int, dice: int,
+               seed: int) -> Tuple[int, int]:
+    """
+    Plays games heads-up games between two entrants, alternating who
+    opens, with every game dealt from its own stream of seed.
+
+    Returns:
+        Tuple[int, int]: Games won by a and by b.
+    """
+    random.seed(seed)
+    wins = [0, 0]
+    for g, rng in enumerate(streams(seed, games)):
+        order = (0, 1) if g % 2 == 0 else (1, 0)
+        players = [make_player((a, b)[i], dice, 2 * dice, [dice])
+                   for i in order]
+        wins[order[play_game(players, rng=rng)]] += 1
+    return wins[0], wins[1]
+
+
+def _play(match: Dict, a: Dict, b: Dict, games: int,
+          dice: int) -> Dict:
+    start = time.perf_counter()
+    wins = play_match(a, b, games, dice, match['seed'])
+    return dict(match, wins=list(wins), games=games, dice=dice,
+                seconds=time.perf_counter() - start)
+
+
+class Elo:
+    """
+    Elo ratings, updated once per match with the K factor scaled by the
+    games played.
+
+    Attributes:
+        ratings (Dict[str, float]): Rating of each entrant.
+        k (float): Rating change per game of surprise.
+    """
+
+    def __init__(self, names: Iterable[str], k: float = K_FACTOR) -> None:
+        self.ratings = {name: INITIAL_RATING for name in names}
+        self.k = k
+
+    def expected(self, a: str, b: str) -> float:
+        return 1 / (1 + 10 ** ((self.ratings[b] - self.ratings[a]) / 400))
+
+    def update(self, a: str, b: str, wins_a: int, wins_b: int) -> None:
+        games = wins_a + wins_b
+        if not games:
+            return
+        delta = self.k * (wins_a - games * self.expected(a, b))
+        self.ratings[a] += delta
+        self.ratings[b] -= delta
+
+
+def round_robin_pairs(names: List[str]) -> List[Tuple[str, str]]:
+    return list(combinations(names, 2))
+
+
+def swiss_pairs(names: List[str],
+                ratings: Dict[str, float],
+                played: set) -> List[Tuple[str, str]]:
+    """
+    Pairs each entrant, best rated first, with the best rated entrant
+    it has not met yet, or the best rated left if it has met them all.
+    With an odd number of entrants the lowest rated sits out.
+    """
+    order = sorted(names, key=lambda n: (-ratings[n], n))
+    pairs = []
+    while len(order) > 1:
+        a = order.pop(0)
+        b = next((n for n in order if frozenset((a, n)) not in played),
+                 order[0])
+        order.remove(b)
+        pairs.append((a, b))
+    return pairs
+
+
+class Tournament:
+    """
+    A resumable tournament between entrants.  Raises ValueError if the
+    results file is from a tournament of other games, dice or seed.
+
+    Attributes:
+        entrants (Dict[str, Dict]): Entrants by name.
+        path (str): The JSON-lines results file.
+        results (Dict[str, Dict]): Finished matches by id.
+        elo (Elo): Current ratings.
+    """
+
+    def __init__(self,
+                 entrants: List[Dict],
+                 path: str = RESULTS_PATH,
+                 games: int = 20,
+                 dice: int = 5,
+                 seed: int = 0,
+                 k: float = K_FACTOR) -> None:
+        self.entrants = {e['name']: e for e in entrants}
+        if len(self.entrants) != len(entrants):
+            raise ValueError("Entrant names must be unique.")
+        self.path = path
+        self.games = games
+        self.dice = dice
+        self.seed = seed
+        self.k = k
+        self.results = {}
+        header = {'games': games, 'dice': dice, 'seed': seed}
+        if os.path.exists(path):
+            self.__truncate()
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path) as f:
+                found = json.loads(f.readline() or '{}').get('header')
+                if found != header:
+                    raise ValueError("%s holds a tournament with %s, not "
+                                     "%s." % (path, found, header))
+                for line in f:
+                    record = json.loads(line)
+                    if record.get('a') in self.entrants and \
+                            record.get('b') in self.entrants:
+                        self.results[record['id']] = record
+        else:
+            with open(path, 'w') as f:
+                f.write(json.dumps({'header': header}) + '\n')
+        self.elo = self.rebuild()
+
+    def __truncate(self) -> None:
+        """
+        Drops a last line cut short by an interruption, so appended
+        results start on a line of their own.
+        """
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def match(self, round_: int, a: str, b: str) -> Dict:
+        names = sorted(self.entrants)
+        i, j = names.index(a), names.index(b)
+        seed = np.random.SeedSequence([self.seed, round_, i, j])
+        return {'id': '%d:%s|%s' % (round_, a, b), 'round': round_,
+                'a': a, 'b': b, 'seed': int(seed.generate_state(1)[0])}
+
+    def rebuild(self, before: Optional[int] = None) -> Elo:
+        """
+        Replays the finished matches (of rounds before before, if
+        given) in (round, id) order.
+        """
+        elo = Elo(self.entrants, self.k)
+        for r in sorted(self.results.values(),
+                        key=lambda r: (r['round'], r['id'])):
+            if before is None or r['round'] < before:
+                elo.update(r['a'], r['b'], *r['wins'])
+        return elo
+
+    def play(self, matches: List[Dict], workers: Optional[int] = None,
+             verbose: bool = False) -> None:
+        """
+        Plays the matches not yet in the results file, appending each
+        as it finishes.
+        """
+        todo = [m for m in matches if m['id'] not in self.results]
+        if not todo:
+            return
+        with open(self.path, 'a') as out, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_play, m, self.entrants[m['a']],
+                                   self.entrants[m['b']], self.games,
+                                   self.dice) for m in todo]
+            for future in as_completed(futures):
+                record = future.result()
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                self.results[record['id']] = record
+                self.elo.update(record['a'], record['b'], *record['wins'])
+                if verbose:
+                    print("%-28s %3d - %-3d %s" % (record['a'],
+                                                   record['wins'][0],
+                                                   record['wins'][1],
+                                                   record['b']))
+        self.elo = self.rebuild()
+
+    def round_robin(self, rounds: int = 1,
+                    workers: Optional[int] = None,
+                    verbose: bool = False) -> None:
+        pairs = round_robin_pairs(sorted(self.entrants))
+        matches = [self.match(r, a, b)
+                   for r in range(rounds) for a, b in pairs]
+        self.play(matches, workers, verbose)
+
+    def swiss(self, rounds: int,
+              workers: Optional[int] = None,
+              verbose: bool = False) -> None:
+        played = set()
+        for r in range(rounds):
+            pairs = swiss_pairs(sorted(self.entrants),
+                                self.rebuild(r).ratings, played)
+            self.play([self.match(r, a, b) for a, b in pairs], workers,
+                      verbose)
+            played.update(frozenset(p) for p in pairs)
+
+    def standings(self) -> List[Tuple[str, float, int, int]]:
+        """
+        Returns (name, rating, games won, games played) for every
+        entrant, best first.
+        """
+        won = dict.fromkeys(self.entrants, 0)
+        played = dict.fromkeys(self.entrants, 0)
+        for r in self.results.values():
+            for name, w in zip((r['a'], r['b']), r['wins']):
+                won[name] += w
+                played[name] += sum(r['wins'])
+        return sorted(((n, self.elo.ratings[n], won[n], played[n])
+                       for n in self.entrants), key=lambda s: -s[1])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Rate Player settings and agents in a tournament.")
+    parser.add_argument("--aggressiveness", type=float, nargs="+",
+                        default=[0.1, 0.2, 0.3])
+    parser.add_argument("--craziness", type=float, nargs="+",
+                        default=[0.0, 0.1, 0.2])
+    parser.add_argument("--markov", action="store_true",
+                        help="enter Markov Master as well.")
+    parser.add_argument("--format", choices=("round-robin", "swiss"),
+                        default="round-robin")
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--games", type=int, default=20,
+                        help="games per match.")
+    parser.add_argument("--dice", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=RESULTS_PATH,
+                        help="results file, resumed if it exists.")
+    args = parser.parse_args(argv)
+
+    entrants = grid(args.aggressiveness, args.craziness)
+    if args.markov:
+        entrants.append({'name': LiarsDiceAgent.NAME, 'agent': 'markov'})
+    t = Tournament(entrants, args.out, args.games, args.dice, args.seed)
+    start = time.perf_counter()
+    if args.format == "swiss":
+        t.swiss(args.rounds, args.workers, verbose=True)
+    else:
+        t.round_robin(args.rounds, args.workers, verbose=True)
+    print("Finished in %.1fs." % (time.perf_counter() - start))
+    for name, rating, won, played in t.standings():
+        print("%-28s %7.1f %5d / %d" % (name, rating, won, played))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,418 @@
+"""training.py
+
+A streaming pipeline of training data for tuning Player by gradient
+descent, using each round as an episode.
+
+Every time a player faces a bid it either raises or calls, and since a
+game log holds every hand, whether the bid it faced was true is known
+for every decision, not only for calls.  Decisions are read a round at a
+time from a gamelog.GameLog or from live self-play, shuffled through a
+bounded buffer and cut into fixed-size batches, so memory stays the same
+however many games are streamed.
+
+The features of a decision are the player's hand histogram, the
+probcalc row around the last bid (the chance of at least count - 2 to
+count + 2 of its dice), the seat sizes in turn order from the player,
+the wild flag and the chance of the best raise.  LogisticModel fits the
+chance that the faced bid is true with Adam, and fit_threshold turns
+the fit into the aggressiveness Player.take_turn compares the probcalc
+chance of the last bid with.  fit_margin fits the other threshold,
+decision.MARGIN, from whether the best raise would have been true,
+holding the chance of the last bid fixed.
+
+Usage:
+    python training.py --log games.ldlog --batch 512
+    python training.py --games 2000 --players 4
+"""
+
+import argparse
+import random
+import sys
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import numpy as np
+
+import decision
+import gamelog
+from simulate import make_bots, play_game
+
+ROW = np.arange(-2, 3)          # offsets of the probcalc row from count
+N_FEATURES = 6 + len(ROW) + gamelog.MAX_SEATS + 2
+P_LAST = 6 + 2                  # column of the chance of the last bid
+P_PLAY = N_FEATURES - 1         # column of the chance of the best raise
+
+
+class Examples(NamedTuple):
+    """
+    A set of decisions.
+
+    Attributes:
+        features (np.ndarray[float32]): (n, N_FEATURES) states.
+        action (np.ndarray[int8]): 1 where the player called, 0 where it
+                                   raised.
+        outcome (np.ndarray[int8]): 1 where the player lost a dice in
+                                    the round.
+        truth (np.ndarray[int8]): 1 where the bid faced was true.
+        raise_truth (np.ndarray[int8]): 1 where the best raise on it
+                                        would have been true.
+    """
+    features: np.ndarray
+    action: np.ndarray
+    outcome: np.ndarray
+    truth: np.ndarray
+    raise_truth: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.action)
+
+
+def empty() -> Examples:
+    return Examples(np.zeros((0, N_FEATURES), dtype=np.float32),
+                    *(np.zeros(0, dtype=np.int8) for _ in range(4)))
+
+
+def concatenate(parts: Iterable[Examples]) -> Examples:
+    return Examples(*(np.concatenate(x) for x in zip(*parts)))
+
+
+def take(examples: Examples, index) -> Examples:
+    return Examples(*(x[index] for x in examples))
+
+
+def round_examples(record: np.void, codes: np.ndarray) -> Examples:
+    """
+    Returns the decisions of one round of a log, a raise or a call by
+    the next player after every bid.
+    """
+    n = len(codes)
+    if n == 0:
+        return empty()
+    n_seats = int(record['seats'])
+    sizes = record['sizes'][:n_seats].astype(np.int64)
+    seats = np.flatnonzero(sizes)
+    at = int(np.searchsorted(seats, record['first']))
+    deciders = seats[(at + 1 + np.arange(n)) % len(seats)]
+    bids = gamelog.decode(codes)
+    faces, counts = bids[:, 0], bids[:, 1]
+    wild = bool(record['wild'])
+    total = int(sizes.sum())
+
+    hands = np.zeros((n, 7), dtype=np.int64)
+    hands[:, 1:] = record['hands'][deciders]
+    dist = decision.distribution(hands, np.full(n, total), np.full(n, wild))
+    columns = counts[:, None] + ROW[None, :]
+    valid = (columns >= 0) & (columns <= total)
+    row = np.where(valid, dist[np.arange(n)[:, None], faces[:, None],
+                               np.clip(columns, 0, total)], 0.0)
+
+    turn_order = (deciders[:, None] + np.arange(gamelog.MAX_SEATS)) % n_seats
+    seat_sizes = np.where(np.arange(gamelog.MAX_SEATS) < n_seats,
+                          sizes[turn_order], 0)
+
+    evaluation = decision.evaluate(dist, hands, np.full(n, total),
+                                   np.full(n, wild), bids)
+    best = evaluation.best
+    p_play = evaluation.p_play[np.arange(n), best]
+
+    features = np.concatenate([hands[:, 1:], row, seat_sizes,
+                               np.full((n, 1), wild), p_play[:, None]],
+                              axis=1)
+    table = record['hands'][:n_seats].sum(axis=0).astype(np.int64)
+
+    def held(faces):
+        return table[faces - 1] + np.where(wild & (faces != 1), table[0], 0)
+    action = np.zeros(n, dtype=np.int8)
+    action[-1] = record['caller'] >= 0
+    return Examples(features.astype(np.float32), action,
+                    (deciders == record['loser']).astype(np.int8),
+                    (held(faces) >= counts).astype(np.int8),
+                    (held(best + 1) >= evaluation.counts[np.arange(n), best]
+                     ).astype(np.int8))
+
+
+def log_examples(log: gamelog.GameLog,
+                 chunk: int = 1 << 14) -> Iterator[Examples]:
+    """
+    Yields the decisions of every round in a log, a chunk of rounds at a
+    time.
+    """
+    for rounds in log.chunks(chunk):
+        parts = [round_examples(record, log.bids[int(record['bid_start']):
+                                                 int(record['bid_start']) +
+                                                 int(record['n_bids'])])
+                 for record in rounds]
+        if parts:
+            yield concatenate(parts)
+
+
+def selfplay_examples(n_players: int = 4,
+                      dice: int = 5,
+                      seed: Optional[int] = None,
+                      n_games: Optional[int] = None) -> Iterator[Examples]:
+    """
+    Plays games between bots (forever unless n_games is given) and
+    yields the decisions of each game.
+    """
+    if seed is not None:
+        random.seed(seed)
+    seeds = np.random.SeedSequence(seed)
+    played = 0
+    while n_games is None or played < n_games:
+        rng = np.random.default_rng(seeds.spawn(1)[0])
+        recorder = gamelog.Recorder()
+        players = make_bots(n_players, dice)
+        recorder.start_game(players)
+        play_game(players, recorder.on_move, rng)
+        rounds, bids = recorder.arrays()
+        yield concatenate([empty()] + [
+            round_examples(r, bids[int(r['bid_start']):
+                                   int(r['bid_start']) + int(r['n_bids'])])
+            for r in rounds])
+        played += 1
+
+
+def shuffle(stream: Iterable[Examples],
+            buffer_size: int = 1 << 16,
+            seed: Optional[int] = None) -> Iterator[Examples]:
+    """
+    Shuffles a stream through a buffer of buffer_size decisions: once
+    the buffer is full, each arriving decision takes the place of a
+    random one, which is passed on.
+    """
+    rng = np.random.default_rng(seed)
+    buffer = empty()
+    for examples in stream:
+        room = buffer_size - len(buffer)
+        if room > 0:
+            buffer = concatenate([buffer, take(examples, slice(0, room))])
+            examples = take(examples, slice(room, None))
+        if not len(examples):
+            continue
+        for start in range(0, len(examples), buffer_size):
+            incoming = take(examples, slice(start, start + buffer_size))
+            used = rng.choice(buffer_size, size=len(incoming),
+                              replace=False)
+            yield take(buffer, used)
+            for kept, new in zip(buffer, incoming):
+                kept[used] = new
+    yield take(buffer, rng.permutation(len(buffer)))
+
+
+def batches(stream: Iterable[Examples],
+            size: int = 512) -> Iterator[Examples]:
+    """
+    Cuts a stream into batches of exactly size decisions, dropping the
+    remainder at the end.
+    """
+    pending = []
+    held = 0
+    for examples in stream:
+        pending.append(examples)
+        held += len(examples)
+        if held < size:
+            continue
+        joined = concatenate(pending)
+        n = len(joined) // size * size
+        for start in range(0, n, size):
+            yield take(joined, slice(start, start + size))
+        pending = [take(joined, slice(n, None))]
+        held = len(pending[0])
+
+
+class LogisticModel:
+    """
+    Logistic regression of whether the faced bid is true, fitted one
+    batch at a time with Adam.
+
+    Attributes:
+        weights (np.ndarray[float64]): One weight per column of the
+                                       inputs, then the bias.
+        columns (Optional[np.ndarray]): Feature columns used, all by
+                                        default.
+        transform: Applied to the selected columns before the fit,
+                   returning n_inputs columns if it changes how many.
+        label: Returns the (possibly soft) labels of a batch, whether
+               the faced bid was true by default.
+        mean, scale (np.ndarray): Standardization of the inputs, taken
+                                  from the first batch seen.
+    """
+
+    def __init__(self,
+                 columns: Optional[np.ndarray] = None,
+                 transform=None,
+                 rate: float = 0.01,
+                 l2: float = 1e-4,
+                 label=None,
+                 n_inputs: Optional[int] = None) -> None:
+        self.columns = columns
+        self.transform = transform
+        self.label = label or (lambda batch: batch.truth)
+        n = N_FEATURES if columns is None else len(columns)
+        n = n_inputs or n
+        self.weights = np.zeros(n + 1)
+        self.rate = rate
+        self.l2 = l2
+        self.__m = np.zeros(n + 1)
+        self.__v = np.zeros(n + 1)
+        self.__t = 0
+        self.mean = None
+        self.scale = None
+
+    def inputs(self, features: np.ndarray) -> np.ndarray:
+        x = features.astype(np.float64)
+        if self.columns is not None:
+            x = x[:, self.columns]
+        if self.transform is not None:
+            x = self.transform(x)
+        if self.mean is None:
+            self.mean = x.mean(axis=0)
+            self.scale = np.where(x.std(axis=0) > 0, x.std(axis=0), 1.0)
+        x = (x - self.mean) / self.scale
+        return np.concatenate([x, np.ones((len(x), 1))], axis=1)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Returns the chance each bid is true.
+        """
+        return 1 / (1 + np.exp(-self.inputs(features) @ self.weights))
+
+    def step(self, batch: Examples) -> float:
+        """
+        Takes one Adam step on a batch, returning its log loss.
+        """
+        x = self.inputs(batch.features)
+        y = np.asarray(self.label(batch), dtype=np.float64)
+        p = 1 / (1 + np.exp(-x @ self.weights))
+        grad = x.T @ (p - y) / len(y) + self.l2 * self.weights
+        self.__t += 1
+        self.__m = 0.9 * self.__m + 0.1 * grad
+        self.__v = 0.999 * self.__v + 0.001 * grad ** 2
+        m = self.__m / (1 - 0.9 ** self.__t)
+        v = self.__v / (1 - 0.999 ** self.__t)
+        self.weights -= self.rate * m / (np.sqrt(v) + 1e-8)
+        eps = 1e-12
+        return float(-np.mean(y * np.log(p + eps) +
+                              (1 - y) * np.log(1 - p + eps)))
+
+    def fit(self, stream: Iterable[Examples],
+            max_batches: Optional[int] = None) -> float:
+        """
+        Steps through a stream of batches, returning the mean loss of
+        the last hundred.
+        """
+        losses = []
+        for i, batch in enumerate(stream):
+            if max_batches is not None and i >= max_batches:
+                break
+            losses.append(self.step(batch))
+            losses = losses[-100:]
+        return float(np.mean(losses)) if losses else float('nan')
+
+
+def logit(x: np.ndarray) -> np.ndarray:
+    x = np.clip(x, 1e-6, 1 - 1e-6)
+    return np.log(x / (1 - x))
+
+
+def fit_threshold(stream: Iterable[Examples],
+                  target: float = 0.5,
+                  max_batches: Optional[int] = None) -> float:
+    """
+    Fits the chance a bid is true from the logit of its probcalc chance
+    alone, and returns the probcalc chance at which the fitted chance
+    is target: the aggressiveness Player.take_turn should call below.
+    """
+    model = LogisticModel(columns=np.array([P_LAST]), transform=logit,
+                          rate=0.2, l2=0.0)
+    model.fit(stream, max_batches)
+    # Solve w * (logit(p) - mean) / scale + b = logit(target).
+    w, b = model.weights
+    z = (float(logit(np.array(target))) - b) / w * model.scale[0] + \
+        model.mean[0]
+    return float(1 / (1 + np.exp(-z)))
+
+
+def fit_margin(stream: Iterable[Examples],
+               p_last: Optional[float] = None,
+               max_batches: Optional[int] = None) -> Optional[float]:
+    """
+    Fits decision.MARGIN: the amount by which the probcalc chance of the
+    best raise may fall short of the last bid's before calling is the
+    better move.
+
+    Calling wins when the faced bid is false and the raise holds when
+    it is true, so the soft label (2 - truth - raise_truth) / 2 is
+    fitted against the shortfall and the last bid's chance itself,
+    which otherwise confounds it: a likely last bid makes calling worse
+    whatever the raise.  The margin is the shortfall at which the
+    fitted label is one half for a last bid of chance p_last (the mean
+    over the decisions by default).  Decisions with no legal raise are
+    left out.
+
+    Returns:
+        Optional[float]: The margin, or None if calling does not gain on
+                         raising as the shortfall grows, so that no
+                         margin fits.
+    """
+    def raises():
+        for batch in stream:
+            yield take(batch, batch.features[:, P_PLAY] >= 0)
+
+    model = LogisticModel(columns=np.array([P_LAST, P_PLAY]),
+                          transform=lambda x: np.concatenate(
+                              [x[:, :1] - x[:, 1:], x[:, :1]], axis=1),
+                          rate=0.2, l2=0.0,
+                          label=lambda b: (2.0 - b.truth -
+                                           b.raise_truth) / 2,
+                          n_inputs=2)
+    model.fit(raises(), max_batches)
+    w_gap, w_last, b = model.weights
+    if w_gap <= 0:
+        return None
+    if p_last is None:
+        p_last = model.mean[1]
+    # Solve w_gap * z_gap + w_last * z_last + b = 0 for the gap.
+    z_last = (p_last - model.mean[1]) / model.scale[1]
+    z_gap = -(b + w_last * z_last) / w_gap
+    return float(np.clip(model.mean[0] + z_gap * model.scale[0], 0, 1))
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Fit Player's call threshold from self-play.")
+    parser.add_argument("--log", default=None,
+                        help="read decisions from this game log instead "
+                             "of live self-play.")
+    parser.add_argument("--games", type=int, default=1000,
+                        help="self-play games to stream.")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--dice", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch", type=int, default=512)
+    parser.add_argument("--buffer", type=int, default=1 << 16)
+    args = parser.parse_args(argv)
+
+    def stream():
+        if args.log:
+            source = log_examples(gamelog.GameLog(args.log))
+        else:
+            source = selfplay_examples(args.players, args.dice, args.seed,
+                                       args.games)
+        return batches(shuffle(source, args.buffer, args.seed), args.batch)
+
+    model = LogisticModel()
+    loss = model.fit(stream())
+    print("Log loss of the full model: %.4f" % loss)
+    print("Fitted aggressiveness: %.3f" % fit_threshold(stream()))
+    margin = fit_margin(stream())
+    if margin is None:
+        print("No margin fits: calling never gains on raising as the best "
+              "raise gets less likely (decision.MARGIN is %.2f)." %
+              decision.MARGIN)
+    else:
+        print("Fitted margin: %.3f (decision.MARGIN is %.2f)" %
+              (margin, decision.MARGIN))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])